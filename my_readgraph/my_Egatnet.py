@@ -1,3 +1,4 @@
+from my_runtime import apply_runtime  # 须在 torch / dgl 之前导入（OpenMP 环境变量）
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -7,12 +8,14 @@ import dgl
 import time
 import numpy as np
 import random
-import networkx as nx
 import math
-import matplotlib.pyplot as plt
 import dgl.nn.pytorch
+from my_checkpoint import CheckpointManager
+from my_profile import profiled, stage, torch_profiler
+from my_features import NODE_TYPE_WIDTH, GATE_FLAG_WIDTH, EDGE_ROLE_WIDTH, edge_role_table
+from my_init import score_memory_mb
 
-device = torch.device('cuda:1' if torch.cuda.is_available() else 'cpu')
+device = apply_runtime()  # 设备、线程数等见 my_runtime.py
 # seed = 826
 # torch.manual_seed(seed)
 # torch.cuda.manual_seed(seed)
@@ -21,6 +24,7 @@ cos = nn.CosineSimilarity(dim=1, eps=1e-8)
 
 
 def plot(value, name):
+    import matplotlib.pyplot as plt  # 只在画图时加载
     plt.plot(range(1, len(value) + 1), value)
     plt.xlabel('Epoch')
     plt.ylabel('{}'.format(name))
@@ -29,6 +33,21 @@ def plot(value, name):
     pass
 
 
+def pair_chunk_size(dim, itemsize=4, memory_mb=score_memory_mb):
+    """memory_mb 内每块可以打分的节点对数量
+    每对的中间量：两行 gather 的嵌入及其乘积（3 * dim）、两个 int64 下标、一个分数
+    """
+    per_pair = 3 * dim * itemsize + 2 * 8 + itemsize
+    return max(1, int(memory_mb * 2 ** 20) // per_pair)
+
+
+def _index_chunk(index, start, stop, device):
+    chunk = index[start:stop]
+    if not isinstance(chunk, torch.Tensor):
+        chunk = torch.from_numpy(np.array(chunk))  # 复制一块（memmap 可能只读）
+    return chunk.to(device=device, dtype=torch.long)
+
+
 class Mlp(nn.Module):
     """带有残差连接的多层感知机
     结构：LayerNorm -> 扩展维度(2x) -> ReLU -> 压缩维度 -> 残差连接
@@ -59,6 +78,37 @@ class Mlp(nn.Module):
         return x
 
 
+class FeatureEmbedding(nn.Module):
+    """紧凑特征（见 my_features）的输入层
+    类型编号、门连接标志编号、引脚角色位掩码分别查表得到向量，与尺寸拼接成 EGT 的输入；
+    嵌入表初始化为原 one-hot / multi-hot，训练时一起学习
+    """
+    def __init__(self):
+        super(FeatureEmbedding, self).__init__()
+        self.node_type = nn.Embedding(NODE_TYPE_WIDTH, NODE_TYPE_WIDTH)
+        self.gate_flag = nn.Embedding(GATE_FLAG_WIDTH, GATE_FLAG_WIDTH)
+        self.edge_role = nn.Embedding(1 << EDGE_ROLE_WIDTH, EDGE_ROLE_WIDTH)
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        with torch.no_grad():
+            self.node_type.weight.copy_(torch.eye(NODE_TYPE_WIDTH))
+            self.gate_flag.weight.copy_(torch.eye(GATE_FLAG_WIDTH))
+            self.edge_role.weight.copy_(torch.from_numpy(edge_role_table()))
+
+    def forward(self, nfeats, efeats):
+        """
+        参数：
+            nfeats: (cats [N, 2] int8, sizes [N, 2] float32)
+            efeats: [E] uint8 位掩码
+        返回：
+            h [N, 15], e [E, 5]
+        """
+        cats, sizes = nfeats
+        h = torch.cat((self.node_type(cats[:, 0].long()), self.gate_flag(cats[:, 1].long()), sizes), dim=1)
+        return h, self.edge_role(efeats.long())
+
+
 class EGT(nn.Module):
     def __init__(self, dim):
         super(EGT, self).__init__()
@@ -97,6 +147,7 @@ class EGT(nn.Module):
 
         return func
 
+    @profiled('egt_forward')
     def forward(self, g, feat, edge):
         h = self.norm_node0(feat)
         edge_weight = self.norm_edge0(edge)
@@ -140,7 +191,15 @@ class My_lossfun(nn.Module):
 
 
 class GAT(nn.Module):
-    def __init__(self, g, node_feats, edge_feats):
+    def __init__(self, g, node_feats, edge_feats, compact=False, extra_feats=0, net_nodes=False):
+        """
+        参数：
+            compact: True 时输入为紧凑特征（load_data(compact=True)），先经 FeatureEmbedding 查表
+            extra_feats: 节点特征末尾附加的列数（如 WL 结构特征），经线性层投影后加到前 node_feats 列上；
+                         投影初始化为 0，未训练时与不加附加特征相同
+            net_nodes: g 为器件-net 二部图（read_graph 的 net 节点模式）；器件之间相隔两跳，
+                       EGT 的次数加倍（6 次），感受野与器件图上的 3 次相同
+        """
         super(GAT, self).__init__()
         self.g = g
         # loss fc
@@ -148,16 +207,41 @@ class GAT(nn.Module):
         self.node_feats = node_feats
         self.edge_feats = edge_feats
 
+        self.input = FeatureEmbedding() if compact else None
+        self.extra = nn.Linear(extra_feats, node_feats) if extra_feats else None
+        if self.extra is not None:
+            nn.init.zeros_(self.extra.weight)
+            nn.init.zeros_(self.extra.bias)
         self.egt1 = EGT(self.node_feats)
+        self.rounds = 6 if net_nodes else 3
+        # 缓存的单位化节点嵌入，见 cache_embeddings
+        self.node_emb = None
 
         # self.conv1 = dgl.nn.pytorch.GATConv(15, 512, 1)
         # self.conv2 = dgl.nn.pytorch.GATConv(512, 256, 1)
         # self.conv3 = dgl.nn.pytorch.GATConv(256, 15, 1)
 
+    def input_feats(self, nfeats, efeats):
+        """第一次 EGT 的输入：紧凑特征查表、附加特征投影（逐节点 / 逐边，与图无关）"""
+        if self.input is not None:
+            nfeats, efeats = self.input(nfeats, efeats)
+        if self.extra is not None:
+            nfeats = nfeats[:, :self.node_feats] + self.extra(nfeats[:, self.node_feats:])
+        return nfeats, efeats
+
+    def embed(self, nfeats, efeats, g=None):
+        """self.rounds 次 EGT 得到最终节点嵌入 [num_nodes, dim]
+        参数：
+            g: 在其他图（如子图）上计算时给出，默认为 self.g
+        """
+        g = self.g if g is None else g
+        h, e = self.input_feats(nfeats, efeats)
+        for _ in range(self.rounds):
+            h, e = self.egt1(g, h, e)
+        return h
+
     def forward(self, nfeats, efeats, pair1, pair2):
-        h, e = self.egt1(self.g, nfeats, efeats)
-        h, e = self.egt1(self.g, h, e)
-        logits, _ = self.egt1(self.g, h, e)
+        logits = self.embed(nfeats, efeats)
 
         # h = F.relu(self.conv1(self.g, nfeats))
         # h = F.relu(self.conv2(self.g, h))
@@ -174,60 +258,192 @@ class GAT(nn.Module):
         scores = self.forward(nfeats, efeats, pair1, pair2)
         return self.xent(scores, labels)
 
+    @torch.no_grad()
+    def cache_embeddings(self, nfeats, efeats):
+        """计算一次最终节点嵌入并单位化缓存，之后的打分/查询不再需要前向
+        参数：
+            nfeats, efeats: 整张图的节点/边特征
+        返回：
+            node_emb: [num_nodes, dim] 单位化后的嵌入
+        """
+        self.node_emb = F.normalize(self.embed(nfeats, efeats), dim=1, eps=1e-8)
+        return self.node_emb
+
+    def clear_embeddings(self):
+        """参数更新或换图后需要清除缓存"""
+        self.node_emb = None
+
+    @torch.no_grad()
+    def score_pairs(self, pair1, pair2, chunk_size=None, out=None, memory_mb=score_memory_mb):
+        """用缓存的嵌入分块计算任意节点对的余弦相似度
+        参数：
+            pair1, pair2: 节点编号（list / numpy / np.memmap / tensor），逐块转换，不整体复制
+            chunk_size: 每块的节点对数量，默认由 memory_mb 推出（pair_chunk_size）
+            out: 预分配的 [num_pairs] numpy 数组（可以是 np.memmap），给出时分数逐块写入 out
+            memory_mb: 每块中间张量的内存上限
+        返回：
+            scores: out 或 [num_pairs] cpu tensor
+        """
+        assert self.node_emb is not None, "call cache_embeddings first"
+        emb = self.node_emb
+        if chunk_size is None:
+            chunk_size = pair_chunk_size(emb.shape[1], emb.element_size(), memory_mb)
+        scores = torch.empty(len(pair1), dtype=emb.dtype) if out is None else out
+        for start in range(0, len(pair1), chunk_size):
+            p1 = _index_chunk(pair1, start, start + chunk_size, emb.device)
+            p2 = _index_chunk(pair2, start, start + chunk_size, emb.device)
+            chunk = (emb[p1] * emb[p2]).sum(-1).cpu()
+            scores[start:start + chunk_size] = chunk if out is None else chunk.numpy()
+        return scores
+
+    @torch.no_grad()
+    def topk_partners(self, nodes, k=5, candidates=None, block_size=4096):
+        """查询每个器件最对称的 k 个候选器件（分块矩阵乘）
+        参数：
+            nodes: 查询节点编号
+            k: 返回的候选数量
+            candidates: 候选节点编号，默认为全部节点
+            block_size: 每次与查询相乘的候选节点数量
+        返回：
+            scores, partners: [len(nodes), k] 相似度及对应的节点编号（降序）
+        """
+        assert self.node_emb is not None, "call cache_embeddings first"
+        emb = self.node_emb
+        nodes = torch.as_tensor(nodes, dtype=torch.long, device=emb.device).reshape(-1)
+        if candidates is None:
+            candidates = torch.arange(emb.shape[0], device=emb.device)
+        else:
+            candidates = torch.as_tensor(candidates, dtype=torch.long, device=emb.device).reshape(-1)
+        k = min(k, len(candidates))
+        query = emb[nodes]
+        best_scores = torch.full((len(nodes), 0), -2., dtype=emb.dtype, device=emb.device)
+        best_ids = torch.zeros((len(nodes), 0), dtype=torch.long, device=emb.device)
+        for start in range(0, len(candidates), block_size):
+            cand = candidates[start:start + block_size]
+            sim = query @ emb[cand].t()
+            sim[nodes[:, None] == cand[None, :]] = -2.  # 排除自身
+            sim = torch.cat((best_scores, sim), dim=1)
+            ids = torch.cat((best_ids, cand.expand(len(nodes), -1)), dim=1)
+            best_scores, order = sim.topk(min(k, sim.shape[1]), dim=1)
+            best_ids = ids.gather(1, order)
+        return best_scores.cpu(), best_ids.cpu()
+
+
+@torch.no_grad()
+def validate(model, feat_data, edge_feat_data, val_pair1, val_pair2, val_label, threshold=0.6, rules=None, wl=None):
+    """验证集上的 loss 与 F1
+    参数：
+        threshold: 分数阈值，与测试时相同
+        rules: my_rules.node_rule_arrays 的结果，给出时 F1 按规则过滤后的预测计算（同 predict_pairs）
+        wl: my_wl.load_wl_colors 的结果，给出时 WL 颜色不同的对判为负（同 predict_pairs 的预筛选）
+    """
+    assert len(val_pair1), "empty validation set"
+    model.eval()
+    model.cache_embeddings(feat_data, edge_feat_data)
+    scores = model.score_pairs(val_pair1, val_pair2)
+    model.clear_embeddings()
+    label = val_label.cpu()
+    loss = model.xent(scores, label).item()
+    pred = scores >= threshold
+    p1, p2 = np.asarray(val_pair1.cpu()), np.asarray(val_pair2.cpu())
+    if rules is not None:
+        from my_rules import fused_rule_mask
+        pred &= torch.from_numpy(fused_rule_mask(rules, p1, p2))
+    if wl is not None:
+        from my_wl import wl_pair_mask, WL_FILTER_ROUND
+        pred &= torch.from_numpy(wl_pair_mask(wl, p1, p2, WL_FILTER_ROUND))
+    pos = label == 1
+    tp = (pred & pos).sum().item()
+    fp = (pred & ~pos).sum().item()
+    fn = (~pred & pos).sum().item()
+    f1 = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.
+    return loss, f1
+
 
 def train(save_dir, feat_data, edge_feat_data, model, pair1, pair2, train_label, train_len, test_pair1, test_pair2,
-          test_label):
+          test_label, resume=False, flush_interval=60., epoch=450, batch_size=256, lr=0.002, val_pair1=None,
+          val_pair2=None, val_label=None, val_every=10, patience=5, val_metric='loss', val_threshold=0.6,
+          val_rules=None, val_wl=None):
+    """训练模型
+    未给出验证集（或验证集为空）时按 mini-batch 训练 loss 选择最优模型；
+    给出验证集时每 val_every 个 epoch 及最后一个 epoch 验证一次，按 val_metric（'loss' 或 'f1'）选择最优模型，
+    连续 patience 次验证没有提升则提前停止；val_threshold / val_rules / val_wl 同 validate，应与测试时的设置一致
+    没有训练任何 epoch（如 resume 时已训练完）时以当前参数作为最优模型
+    save_dir 为 None 时不写盘
+    返回：
+        最优模型的 state_dict（内存中）
+    """
 
-    optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=0.002, weight_decay=1e-5)
+    optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=lr, weight_decay=1e-5)
     # scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=150, gamma=0.5)
     times = []
-    epoch = 450
-    best = 1e9
     cnt_wait = 0
-    best_epoch = 0
-    best_batch = 0
     # batch
-    batch_size = 256
     num_batch = math.ceil(train_len / batch_size)
     loss_list = []
-    G = nx.read_gpickle('{}/graph.pkl'.format(save_dir))
-    for e in range(epoch):
-        model.train()
-        for i in range(num_batch):
-            if i < num_batch - 1:
-                batch_pair1 = pair1[i * batch_size: i * batch_size + batch_size]
-                batch_pair2 = pair2[i * batch_size: i * batch_size + batch_size]
-                sub_label = train_label[i * batch_size: i * batch_size + batch_size]
-            else:
-                batch_pair1 = pair1[i * batch_size: len(pair1)]
-                batch_pair2 = pair2[i * batch_size: len(pair2)]
-                sub_label = train_label[i * batch_size: len(pair1)]
-
-            start_time = time.time()
-            optimizer.zero_grad()
-
-            loss = model.loss(feat_data, edge_feat_data, batch_pair1, batch_pair2, sub_label)
-
-            if loss < best:
-                best = loss
-                best_epoch = e
-                best_batch = i
-                cnt_wait = 0
-                torch.save(model.state_dict(), '{}/model/model.pkl'.format(save_dir))
-            else:
-                cnt_wait += 1
-            loss.backward()
-            optimizer.step()
-            end_time = time.time()
-            times.append(end_time - start_time)
-            # loss_list.append(loss.item())
-            # if i + 1 == num_batch:
-            #     print("The {}-th epoch, The {}-th batch, ".format(e + 1, i + 1), "Loss: ", loss.item())
-            #     print("The {}-th epoch".format(e + 1))
-        # scheduler.step()
-        print("The {}-th epoch, ".format(e + 1), "Train Loss:{:.4f} ".format(loss.item()))
-    # plot(loss_list, 'Loss')
-    print('Loading {}th epoch {}th batch'.format(best_epoch + 1, best_batch + 1))
-    pass
+    if val_pair1 is not None and len(val_pair1) == 0:
+        print("empty validation set, selecting the model by training loss")
+        val_pair1 = None
+    # 最优模型保存在内存中，由后台线程写盘；resume=True 时从 model/last.pkl 续训
+    ckpt = CheckpointManager(save_dir, flush_interval=flush_interval)
+    start_epoch = ckpt.load_last(model, optimizer) if resume else 0
+    try:
+        with torch_profiler() as prof:  # EGAT_TORCH_TRACE 设置时记录前几个 step
+            for e in range(start_epoch, epoch):
+                model.train()
+                for i in range(num_batch):
+                    if i < num_batch - 1:
+                        batch_pair1 = pair1[i * batch_size: i * batch_size + batch_size]
+                        batch_pair2 = pair2[i * batch_size: i * batch_size + batch_size]
+                        sub_label = train_label[i * batch_size: i * batch_size + batch_size]
+                    else:
+                        batch_pair1 = pair1[i * batch_size: len(pair1)]
+                        batch_pair2 = pair2[i * batch_size: len(pair2)]
+                        sub_label = train_label[i * batch_size: len(pair1)]
+
+                    start_time = time.time()
+                    optimizer.zero_grad()
+
+                    loss = model.loss(feat_data, edge_feat_data, batch_pair1, batch_pair2, sub_label)
+
+                    if val_pair1 is None:
+                        ckpt.track(model, loss, e * num_batch + i)
+                    with stage('egt_backward'):
+                        loss.backward()
+                    optimizer.step()
+                    prof.step()
+                    end_time = time.time()
+                    times.append(end_time - start_time)
+                    # loss_list.append(loss.item())
+                    # if i + 1 == num_batch:
+                    #     print("The {}-th epoch, The {}-th batch, ".format(e + 1, i + 1), "Loss: ", loss.item())
+                    #     print("The {}-th epoch".format(e + 1))
+                # scheduler.step()
+                ckpt.snapshot(model, optimizer, e + 1)
+                print("The {}-th epoch, ".format(e + 1), "Train Loss:{:.4f} ".format(loss.item()))
+                if val_pair1 is not None and ((e + 1) % val_every == 0 or e + 1 == epoch):
+                    val_loss, val_f1 = validate(model, feat_data, edge_feat_data, val_pair1, val_pair2, val_label,
+                                                val_threshold, val_rules, val_wl)
+                    metric = val_loss if val_metric == 'loss' else -val_f1  # 越小越好
+                    best_metric, _ = ckpt.best_info()
+                    ckpt.track(model, torch.tensor(metric, device=next(model.parameters()).device),
+                               e * num_batch + num_batch - 1)
+                    if best_metric is None or metric < best_metric:
+                        cnt_wait = 0
+                    else:
+                        cnt_wait += 1
+                    print("            Val Loss:{:.4f} Val F1:{:.4f} ".format(val_loss, val_f1))
+                    if cnt_wait >= patience:
+                        print("Early stopping at {}-th epoch".format(e + 1))
+                        break
+        if ckpt.best_state is None:  # 没有训练任何 epoch：当前参数即最优模型，保证 model.pkl 与返回值存在
+            ckpt.track(model, torch.tensor(float('inf'), device=next(model.parameters()).device),
+                       max(start_epoch, 1) * num_batch - 1)
+    finally:
+        ckpt.close()  # 异常退出时也要停止后台写盘线程
+    _, best_step = ckpt.best_info()
+    if best_step is not None:
+        print('Loading {}th epoch {}th batch'.format(best_step // num_batch + 1, best_step % num_batch + 1))
+    return ckpt.best_state
 
 
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+
+# 性能基准：
+# 1. generate_netlist 按随机种子生成层次化 SPICE 网表（差分对、电流镜、负载电阻/电容，
+#    重复例化的子电路，全局 vdd/vss 大电源网络）及对应的对称文件
+# 2. 对每个规模分别在独立子进程中计时各阶段并记录内存峰值：
+#    read_netlist -> subckts2graph -> parse_all -> read_graph -> load_data -> train_step -> inference
+# 3. 结果保存为 json，compare_results 用于比较两次提交的结果
+#
+# 内存：rss_peak_mb 为阶段结束时进程的 RSS 峰值（单调不减）；
+#      py_peak_mb 为该阶段内 tracemalloc 统计的 python 分配峰值（需 --tracemalloc，会拖慢计时）
+
+STAGES = ['read_netlist', 'subckts2graph', 'parse_all', 'read_graph', 'load_data', 'train_step', 'inference']
+DEVICES_PER_CELL = 8
+
+
+def generate_netlist(save_dir, num_devices, seed=0, num_variants=4):
+    """生成约 num_devices 个器件的层次化网表
+    参数：
+        save_dir: 输出目录，生成 BENCH_<num_devices>.sp 与同名 .txt 对称文件
+        num_devices: 目标器件数
+        seed: 随机种子（器件尺寸、子电路变体的选择）
+        num_variants: 不同尺寸的单元子电路数量
+    返回：
+        sp_path: 网表路径
+    """
+    rng = random.Random(seed)
+    top = "BENCH_{}".format(num_devices)
+    sp_path = os.path.join(save_dir, top + ".sp")
+    num_cells = max(1, num_devices // DEVICES_PER_CELL)
+    lines = ["** synthetic benchmark netlist, seed={}".format(seed)]
+    sym_lines = []
+    for v in range(num_variants):
+        wn, ln = rng.choice([1, 2, 4, 8]), rng.choice([0.5, 1, 2])
+        wp, lp = rng.choice([2, 4, 8, 16]), rng.choice([0.5, 1, 2])
+        wr, lr = rng.choice([1, 2]), rng.choice([5, 10, 20])
+        cell = "CELL{}".format(v)
+        lines += [
+            ".subckt {} vdd vss inp inn outp outn bias".format(cell),
+            # differential pair + tail
+            "m1 outn inp tail vss nch l={}u w={}u nf=1".format(ln, wn),
+            "m2 outp inn tail vss nch l={}u w={}u nf=1".format(ln, wn),
+            "m5 tail bias vss vss nch l={}u w={}u nf=2".format(ln, 2 * wn),
+            # active load mirror
+            "m3 outn outn vdd vdd pch l={}u w={}u nf=1".format(lp, wp),
+            "m4 outp outn vdd vdd pch l={}u w={}u nf=1".format(lp, wp),
+            # resistive common-mode sense
+            "r1 outp cm vss res l={}u w={}u".format(lr, wr),
+            "r2 outn cm vss res l={}u w={}u".format(lr, wr),
+            "c1 cm vss vss cap l=1u w=1u",
+            ".ends {}".format(cell),
+        ]
+        sym_lines += [cell, "m1 m2", "m3 m4", "r1 r2"]
+    lines.append(".subckt {} vdd vss bias in0 in1".format(top))
+    inp, inn = "in0", "in1"
+    for k in range(num_cells):
+        outp, outn = "o{}p".format(k), "o{}n".format(k)
+        lines.append("xc{} vdd vss {} {} {} {} bias CELL{}".format(k, inp, inn, outp, outn,
+                                                                rng.randrange(num_variants)))
+        inp, inn = outp, outn
+    lines.append(".ends {}".format(top))
+    with open(sp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with open(sp_path.replace(".sp", ".txt"), "w") as f:
+        f.write("\n".join(sym_lines) + "\n")
+    return sp_path
+
+
+class StageTimer(object):
+    """记录每个阶段的耗时与内存峰值"""
+    def __init__(self, size, trace_memory=False):
+        self.size = size
+        self.trace_memory = trace_memory
+        self.records = []
+
+    def run(self, stage, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            error = None
+        except Exception as ex:  # 记录失败（如内存不足），后续阶段跳过
+            result = None
+            error = "{}: {}".format(type(ex).__name__, ex)
+        seconds = time.perf_counter() - start
+        record = {'size': self.size, 'stage': stage, 'seconds': seconds,
+                  'rss_peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.}
+        if self.trace_memory:
+            record['py_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        if error is not None:
+            record['error'] = error
+        self.records.append(record)
+        print("{:>9d} {:<14s} {:10.3f}s {:10.1f}MB {}".format(self.size, stage, seconds, record['rss_peak_mb'],
+                                                            error or ""), file=sys.stderr)
+        return result, error is None
+
+
+def run_size(size, work_dir, seed=0, stages=STAGES, trace_memory=False):
+    """在当前进程中跑一个规模的所有阶段"""
+    import my_parser as parser
+    import my_readgraph as readgraph
+    timer = StageTimer(size, trace_memory)
+    sp_path = generate_netlist(work_dir, size, seed)
+    top = os.path.basename(sp_path).split('.')[0]
+
+    results = {}
+    status = {}
+    # 阶段 -> (依赖的阶段, 函数)；依赖的阶段未选中时只运行、不计时，失败时跳过依赖它的阶段
+    steps = {
+        'read_netlist': (None, lambda: parser.read_netlist(sp_path)),
+        'subckts2graph': ('read_netlist', lambda: parser.subckts2graph(results['read_netlist'], top)),
+        'parse_all': (None, lambda: parser.parse_all(work_dir, work_dir)),
+        'read_graph': ('parse_all', lambda: readgraph.read_graph(os.path.join(work_dir, "dataXY_file.txt"), work_dir,
+                                                                  trainset=[0])),
+        'load_data': ('read_graph', lambda: _load_data(work_dir)),
+        'train_step': ('load_data', lambda: _train_step(results['load_data'])),
+        'inference': ('load_data', lambda: _inference(results['load_data'])),
+    }
+
+    def run(stage):
+        if stage not in status:
+            dep, func = steps[stage]
+            if dep is not None and not run(dep):
+                status[stage] = False
+            elif stage in stages:
+                results[stage], status[stage] = timer.run(stage, func)
+            else:
+                try:
+                    results[stage], status[stage] = func(), True
+                except Exception as ex:
+                    results[stage], status[stage] = None, False
+                    print("{:>9d} {:<14s} (not timed) {}: {}".format(size, stage, type(ex).__name__, ex),
+                          file=sys.stderr)
+        return status[stage]
+
+    for stage in STAGES:
+        if stage in stages:
+            run(stage)
+    return timer.records
+
+
+def _load_data(work_dir):
+    from my_load_data import load_data
+    return load_data(work_dir)
+
+
+def _train_step(data, batch_size=256):
+    import torch
+    node_feat_data, edge_feat_data, model, pair1, pair2, train_label = data[:6]
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.002, weight_decay=1e-5)
+    model.train()
+    optimizer.zero_grad()
+    loss = model.loss(node_feat_data, edge_feat_data, pair1[:batch_size], pair2[:batch_size],
+                      train_label[:batch_size])
+    loss.backward()
+    optimizer.step()
+    return loss.item()
+
+
+def _inference(data):
+    node_feat_data, edge_feat_data, model, pair1, pair2 = data[:5]
+    model.eval()
+    model.cache_embeddings(node_feat_data, edge_feat_data)
+    return model.score_pairs(pair1, pair2)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(sizes, out_path, seed=0, stages=STAGES, trace_memory=False, max_seconds=None):
+    """每个规模在独立子进程中运行（RSS 峰值互不影响），结果写入 out_path
+    参数：
+        max_seconds: 某阶段在较小规模上超过该时间后，更大规模跳过该阶段及之后的阶段
+    """
+    results = []
+    stages = list(stages)
+    for size in sorted(sizes):
+        if not stages:
+            break
+        with tempfile.TemporaryDirectory() as work_dir:
+            cmd = [sys.executable, os.path.abspath(__file__), '--single', str(size), '--seed', str(seed),
+                   '--work', work_dir, '--stages'] + stages
+            if trace_memory:
+                cmd.append('--tracemalloc')
+            output = subprocess.run(cmd, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+            records = json.loads(output.stdout.decode() or "[]")
+        results.extend(records)
+        if max_seconds is not None:
+            slow = [r['stage'] for r in records if r['seconds'] > max_seconds or 'error' in r]
+            if slow:
+                stages = stages[:stages.index(slow[0])]
+    report = {'commit': git_commit(), 'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+              'python': platform.python_version(), 'machine': platform.machine(), 'seed': seed,
+              'results': results}
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def compare_results(old_path, new_path):
+    """打印两次基准结果中相同 (size, stage) 的耗时与内存比值"""
+    with open(old_path) as f:
+        old = {(r['size'], r['stage']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    print("     size stage              old(s)     new(s)  ratio   old(MB)   new(MB)")
+    for r in new:
+        o = old.get((r['size'], r['stage']))
+        if o is None:
+            continue
+        print("{:>9d} {:<14s} {:10.3f} {:10.3f} {:6.2f} {:9.1f} {:9.1f}".format(
+            r['size'], r['stage'], o['seconds'], r['seconds'], r['seconds'] / max(o['seconds'], 1e-9),
+            o['rss_peak_mb'], r['rss_peak_mb']))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    arg_parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--out', default=None)
+    arg_parser.add_argument('--tracemalloc', action='store_true')
+    arg_parser.add_argument('--max-seconds', type=float, default=600.)
+    arg_parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    arg_parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    arg_parser.add_argument('--work', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+    elif args.single is not None:
+        # 子进程：结果以 json 输出到 stdout，日志输出到 stderr
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        records = run_size(args.single, args.work, args.seed, args.stages, args.tracemalloc)
+        sys.stdout = stdout
+        print(json.dumps(records))
+    else:
+        out = args.out or "bench_{}.json".format(git_commit())
+        run_benchmarks(args.sizes, out, args.seed, args.stages, args.tracemalloc, args.max_seconds)
+        print("saved", out)
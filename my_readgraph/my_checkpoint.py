@@ -0,0 +1,150 @@
+import os
+import atexit
+import threading
+import torch
+
+# 训练中的模型保存：
+# - 最优模型保存在内存中（与参数同设备的拷贝），按 loss 是否下降用 torch.where 在设备端更新，
+#   训练循环中不需要 loss < best 的同步，也不直接写盘
+# - 后台线程按 flush_interval 秒把最优模型写到 model/model.pkl，退出时再写一次
+# - 每个 epoch 结束保存一次模型 + 优化器状态的快照（model/last.pkl），用于断点续训
+
+
+def _clone_state(state):
+    """递归 detach + clone 状态字典中的张量"""
+    if torch.is_tensor(state):
+        return state.detach().clone()
+    if isinstance(state, dict):
+        return {k: _clone_state(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(_clone_state(v) for v in state)
+    return state
+
+
+def _to_cpu(state):
+    if torch.is_tensor(state):
+        return state.cpu()
+    if isinstance(state, dict):
+        return {k: _to_cpu(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(_to_cpu(v) for v in state)
+    return state
+
+
+def _atomic_save(obj, path):
+    tmp_path = path + ".tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointManager(object):
+    """最优模型跟踪 + 后台异步保存
+    参数：
+        save_dir: 保存目录，模型写入 save_dir/model/；None 时只在内存中跟踪，不写盘
+        flush_interval: 后台写盘间隔（秒），<= 0 表示只在 flush()/close() 时写盘
+    """
+    def __init__(self, save_dir, flush_interval=60.):
+        self.model_dir = None if save_dir is None else os.path.join(save_dir, "model")
+        self.best_path = None if save_dir is None else os.path.join(self.model_dir, "model.pkl")
+        self.last_path = None if save_dir is None else os.path.join(self.model_dir, "last.pkl")
+        self.flush_interval = flush_interval
+        self.best_state = None   # {name: tensor}，与模型参数在同一设备
+        self.best_loss = None    # 设备端标量
+        self.best_step = None    # 设备端标量，epoch * num_batch + batch
+        self.last = None         # 最近一个 epoch 的模型/优化器快照
+        self._dirty_best = False
+        self._dirty_last = False
+        self._state_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if flush_interval > 0 and save_dir is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    @torch.no_grad()
+    def track(self, model, loss, step):
+        """loss 下降时在设备端把当前参数记为最优，不触发同步
+        需在 optimizer.step() 之前调用（保存的是产生该 loss 的参数）
+        """
+        loss = loss.detach()
+        state = model.state_dict()
+        with self._state_lock:
+            if self.best_state is None:
+                self.best_state = _clone_state(state)
+                self.best_loss = loss.clone()
+                self.best_step = torch.full_like(loss, step, dtype=torch.long)
+            else:
+                improved = loss < self.best_loss
+                for k, v in state.items():
+                    self.best_state[k].copy_(torch.where(improved, v, self.best_state[k]))
+                self.best_loss = torch.where(improved, loss, self.best_loss)
+                self.best_step = torch.where(improved, torch.full_like(self.best_step, step), self.best_step)
+            self._dirty_best = True
+
+    def snapshot(self, model, optimizer, epoch):
+        """保存 epoch 结束时的模型与优化器状态（内存拷贝），由后台线程写盘"""
+        last = {"model": _clone_state(model.state_dict()),
+                "optimizer": _clone_state(optimizer.state_dict()),
+                "epoch": epoch}
+        with self._state_lock:
+            self.last = last
+            self._dirty_last = True
+
+    def flush(self):
+        """把内存中的最优模型与最近快照写盘"""
+        with self._write_lock:
+            with self._state_lock:
+                best = _clone_state(self.best_state) if self._dirty_best else None
+                best_loss, best_step = self.best_loss, self.best_step
+                last = self.last if self._dirty_last else None
+                self._dirty_best = False
+                self._dirty_last = False
+            if (best is None and last is None) or self.model_dir is None:
+                return
+            os.makedirs(self.model_dir, exist_ok=True)
+            if best is not None:
+                _atomic_save(_to_cpu(best), self.best_path)
+            if last is not None:
+                last = dict(_to_cpu(last))
+                last["best_loss"] = None if best_loss is None else best_loss.item()
+                last["best_step"] = None if best_step is None else best_step.item()
+                _atomic_save(last, self.last_path)
+
+    def close(self):
+        """停止后台线程并写盘（程序退出时自动调用）"""
+        atexit.unregister(self.close)  # 关闭后不再被 atexit 引用，管理器与 best_state 可以释放
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def best_info(self):
+        """返回 (best_loss, best_step)，会同步设备"""
+        if self.best_loss is None:
+            return None, None
+        return self.best_loss.item(), self.best_step.item()
+
+    def load_last(self, model, optimizer, device=None):
+        """从 model/last.pkl 恢复模型和优化器，返回下一个要训练的 epoch
+        若存在 model/model.pkl，同时恢复内存中的最优模型
+        """
+        if self.last_path is None or not os.path.exists(self.last_path):
+            return 0
+        last = torch.load(self.last_path, map_location=device)
+        model.load_state_dict(last["model"])
+        optimizer.load_state_dict(last["optimizer"])
+        if last.get("best_loss") is not None and os.path.exists(self.best_path):
+            param = next(iter(model.state_dict().values()))
+            with self._state_lock:
+                best = torch.load(self.best_path, map_location=param.device)
+                self.best_state = {k: v.to(model.state_dict()[k].device) for k, v in best.items()}
+                self.best_loss = torch.tensor(last["best_loss"], device=param.device)
+                self.best_step = torch.tensor(last["best_step"], device=param.device)
+        return last["epoch"]
@@ -0,0 +1,124 @@
+import os
+import math
+import argparse
+from my_runtime import available_cpus, set_threads
+import dgl
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from my_Egatnet import GAT
+from my_checkpoint import CheckpointManager
+from my_init import *
+
+# 多进程数据并行训练（CPU，gloo 后端）
+# - 主进程 load_data 一次，把节点/边特征、图的 src/dst 和训练对放入共享内存
+# - 每个 worker 从共享张量重建 DGL 图，按 batch 编号取互不相交的子集（batch % world_size == rank）
+# - DistributedDataParallel 在 backward 时 all-reduce 梯度
+# - 每步损失 all-reduce 为全部样本对的平均值，rank 0 据此跟踪并保存最优模型（my_checkpoint.CheckpointManager）
+
+
+def share_training_data(node_feat_data, edge_feat_data, model, pair1, pair2, train_label):
+    """把 load_data 的结果转成 cpu 共享内存张量，供 worker 进程零拷贝使用"""
+    src, dst = model.g.edges()
+    if isinstance(node_feat_data, (tuple, list)):  # 紧凑特征 (cats, sizes)
+        node_feat_data = tuple(t.cpu() for t in node_feat_data)
+    else:
+        node_feat_data = node_feat_data.cpu()
+    shared = {
+        'node_feats': node_feat_data,
+        'edge_feats': edge_feat_data.cpu(),
+        'src': src.cpu(),
+        'dst': dst.cpu(),
+        'pair1': pair1.cpu(),
+        'pair2': pair2.cpu(),
+        'label': train_label.cpu(),
+    }
+    for v in shared.values():
+        for t in (v if isinstance(v, tuple) else (v,)):
+            t.share_memory_()
+    shared['num_nodes'] = model.g.num_nodes()
+    # worker 按原模型的输入配置重建 GAT
+    shared['dims'] = (model.node_feats, model.edge_feats)
+    shared['compact'] = model.input is not None
+    shared['extra_feats'] = model.extra.in_features if model.extra is not None else 0
+    return shared
+
+
+def _worker(rank, world_size, save_dir, shared, num_threads, epoch, batch_size, lr, flush_interval):
+    set_threads(num_threads)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+
+    g = dgl.graph((shared['src'], shared['dst']), num_nodes=shared['num_nodes'])
+    feat_data, edge_feat_data = shared['node_feats'], shared['edge_feats']
+    pair1, pair2, train_label = shared['pair1'], shared['pair2'], shared['label']
+    model = GAT(g=g, node_feats=shared['dims'][0], edge_feats=shared['dims'][1], compact=shared['compact'],
+                extra_feats=shared['extra_feats'], net_nodes=use_net_nodes)
+    ddp_model = DistributedDataParallel(model)  # 构造时从 rank 0 广播参数
+    optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, ddp_model.parameters()), lr=lr,
+                                 weight_decay=1e-5)
+    ckpt = CheckpointManager(save_dir, flush_interval=flush_interval) if rank == 0 else None
+
+    num_batch = math.ceil(len(pair1) / batch_size)
+    # 每个 rank 的步数必须相同（每步一次 all-reduce）；第 s 步各 rank 取 batch s * world_size + rank，
+    # 超出 num_batch 的 rank 走一次空 batch（梯度为 0），每个 batch 每个 epoch 只训练一次
+    num_steps = math.ceil(num_batch / world_size)
+    for e in range(epoch):
+        ddp_model.train()
+        for s in range(num_steps):
+            b = s * world_size + rank
+            batch_pair1 = pair1[b * batch_size: b * batch_size + batch_size]
+            batch_pair2 = pair2[b * batch_size: b * batch_size + batch_size]
+            sub_label = train_label[b * batch_size: b * batch_size + batch_size]
+            # 本步所有 rank 的样本对总数
+            step_pairs = min(len(pair1), (s + 1) * world_size * batch_size) - s * world_size * batch_size
+
+            optimizer.zero_grad()
+            scores = ddp_model(feat_data, edge_feat_data, batch_pair1, batch_pair2)
+            # 按样本对数加权：DDP 对梯度取平均后等于本步全部样本对的平均损失
+            loss_sum = model.xent(scores, sub_label) * len(sub_label) if len(sub_label) else scores.sum()
+            loss = loss_sum.detach().clone()
+            dist.all_reduce(loss)
+            loss /= step_pairs
+            if ckpt is not None:
+                ckpt.track(model, loss, e * num_steps + s)
+            (loss_sum * world_size / step_pairs).backward()
+            optimizer.step()
+        if ckpt is not None:
+            ckpt.snapshot(model, optimizer, e + 1)
+            print("The {}-th epoch, ".format(e + 1), "Train Loss:{:.4f} ".format(loss.item()))
+    if ckpt is not None:
+        ckpt.close()
+        _, best_step = ckpt.best_info()
+        print('Loading {}th epoch {}th step'.format(best_step // num_steps + 1, best_step % num_steps + 1))
+    dist.destroy_process_group()
+
+
+def train_ddp(save_dir, node_feat_data, edge_feat_data, model, pair1, pair2, train_label, num_workers=2,
+              threads_per_worker=None, epoch=450, batch_size=256, lr=0.002, flush_interval=60.,
+              master_addr='127.0.0.1', master_port='29500'):
+    """多进程数据并行训练，参数与 train 相同，另外：
+    参数：
+        num_workers: worker 进程数（建议每个 socket 一个或按核数划分）
+        threads_per_worker: 每个 worker 的 intra-op 线程数，默认平分可用的 cpu 核数
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, available_cpus() // num_workers)
+    os.environ.setdefault('MASTER_ADDR', master_addr)
+    os.environ.setdefault('MASTER_PORT', str(master_port))
+    shared = share_training_data(node_feat_data, edge_feat_data, model, pair1, pair2, train_label)
+    mp.spawn(_worker, args=(num_workers, save_dir, shared, threads_per_worker, epoch, batch_size, lr,
+                            flush_interval), nprocs=num_workers, join=True)
+
+
+if __name__ == '__main__':
+    from my_load_data import load_data
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    node_feat_data, edge_feat_data, model, pair1, pair2, train_label, test_label, test_pair1, test_pair2, train_len = \
+        load_data(file_path)
+    train_ddp(file_path, node_feat_data, edge_feat_data, model, pair1, pair2, train_label,
+              num_workers=args.workers, threads_per_worker=args.threads)
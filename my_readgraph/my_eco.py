@@ -0,0 +1,403 @@
+import os
+import time
+import pickle
+import argparse
+from my_runtime import apply_runtime  # 须在 torch / dgl 之前导入（OpenMP 环境变量）
+import dgl
+import numpy as np
+import networkx as nx
+import torch
+import torch.nn.functional as F
+from my_parser import read_netlist, subckts2graph
+from my_readgraph import add_circuit_nodes, add_circuit_edges, add_circuit_weights, add_circuit_net_edges, \
+    add_net_nodes
+from my_stream_graph import NormStats, circuit_rows
+from my_rules import rule_arrays_from_table, fused_rule_mask
+from my_features import feature_edges, encode_node_feats, encode_edge_feats, NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH
+from my_wl import wl_colors, wl_twin_feats
+from my_init import *
+
+# 增量 ECO 模式：版图迭代中只改动少量器件/net 时，只重新计算受影响的部分
+# 1. build_cache 对一个网表完整计算特征、每一轮 EGT 的节点 / 边状态和所有候选对的打分，保存为 eco_state.pkl
+# 2. eco_update 解析新网表，按层次化器件名 / net 名与缓存比较：
+#    - 变化的节点 C：新增节点、输入特征变化、相连边（或边的引脚角色）变化的节点
+#    - 逐轮更新 EGT 状态：第 r 轮只重新计算距 C 不超过 r 跳的节点（用它们的全部入边），
+#      其余节点 / 边沿用缓存的第 r 轮状态，结果与整图计算相同
+#    - 只重新打分至少一端受影响或规则属性（尺寸、电势、net 名、候选类别）变化的候选对，其余沿用缓存
+# 3. 电源 / 地 net 几乎连着所有器件，精确的受影响区域通常就是整个电路（超过 FULL_RECOMPUTE_RATIO 时直接整图计算）。
+#    hub_degree 给出时，度数超过它的节点（net 节点图中即电源 / 地 net）本身仍按完整邻域更新，但变化不再经它向外传播：
+#    受影响区域有界，结果为近似（其余器件经过 hub 感受到的变化被忽略，近似误差会随多次更新累积，定期 --rebuild）。
+#    器件图中电源 net 展开为器件之间的边，没有单独的 hub 节点，hub_degree 应配合 use_net_nodes 使用
+# 尺寸归一化使用 build_cache 时的统计量（保证未改动节点的特征不变）；use_wl_feats 的 WL 特征对新网表整体重新计算，
+# 孪生标志变化的节点也算作变化。
+# 模型输入（稠密 / 紧凑特征、WL 特征、net 节点图）与 load_data 相同，边按 my_features.feature_edges 的顺序与边特征对齐，
+# 同一网表上的分数与 read_graph + load_data / Pipeline 相同。
+
+FULL_RECOMPUTE_RATIO = 0.5  # 受影响区域超过该比例时直接整图计算
+
+
+def featurize_netlist(sp_path, norm=None, net_nodes=use_net_nodes, wl_feats=use_wl_feats):
+    """解析单个网表并生成特征（与 read_graph 使用相同的逐电路代码）
+    参数：
+        norm: (w_stats, l_stats)，默认由该网表统计
+        net_nodes: 同 build_graph，net 节点编号排在器件之后（名字为 "net:<net 名>"）
+        wl_feats: 同时计算 WL 孪生特征（wl_twin_feats）
+    返回：
+        state 字典：names, feats, twin, edges, edge_feats, rules 表（attrs, nets, net_sigs）, cand, norm, net_nodes
+        （attrs / nets / net_sigs / cand 只有器件的行）
+    """
+    subckts = read_netlist(sp_path)
+    graph, _ = subckts2graph(subckts, os.path.basename(sp_path).split('.')[0])
+    num_devices = len(graph.nodes)
+    G_c = nx.DiGraph()
+    edge_dic = {}
+    types, ws, ls = add_circuit_nodes(G_c, graph, 0, 0)
+    if net_nodes:
+        add_circuit_net_edges(edge_dic, graph, 0, num_devices)
+        add_net_nodes(G_c, [(0, graph, num_devices)], edge_dic)
+    else:
+        add_circuit_edges(G_c, graph, edge_dic, 0)
+    add_circuit_weights(G_c, graph, 0)
+    feats, attrs, nets = circuit_rows(G_c, graph, 0, types, ws, ls)
+    if norm is None:
+        norm = (NormStats(), NormStats())
+        norm[0].update(ws)
+        norm[1].update(ls)
+    feats[:, -2] = norm[0].apply(feats[:, -2])
+    feats[:, -1] = norm[1].apply(feats[:, -1])
+    names = [node.attributes["name"] for node in graph.nodes]
+    if net_nodes:
+        feats = np.vstack((feats, np.zeros((len(G_c) - num_devices, feats.shape[1]))))  # net 节点：全 0 行
+        names += ["net:{}".format(G_c.nodes[k]['name']) for k in range(num_devices, len(G_c))]
+
+    edges = feature_edges(list(edge_dic))
+    edge_feats = np.zeros((len(edges), EDGE_ROLE_WIDTH), dtype=np.int64)
+    for k, (src, dst) in enumerate(edges):
+        edge_feats[k, edge_dic[(src, dst)]] = 1
+    twin = None
+    if wl_feats:
+        colors = wl_colors(feats, edges[:, 0], edges[:, 1], encode_edge_feats(edge_feats))
+        twin = wl_twin_feats(colors, np.zeros(len(feats), dtype=np.int64))  # 单个电路
+    net_names = [net.attributes["name"] for net in graph.nets]
+    return {
+        'names': np.array(names),
+        'feats': feats,
+        'twin': twin,
+        'edges': edges,
+        'edge_feats': edge_feats,
+        'attrs': attrs,
+        'nets': nets,
+        # net 编号会随插入的 net 变化，比较规则属性时用 net 名（末位门连接标志保持原值）
+        'net_sigs': np.array([_net_signature(row, net_names) for row in nets]),
+        'cand': np.array([_candidate_key(node.attributes) for node in graph.nodes]),
+        'norm': norm,
+        'net_nodes': net_nodes,
+    }
+
+
+def _net_signature(row, net_names):
+    length = row[0]
+    ids = row[1:1 + length]
+    num_nets = length - 1 if length == 4 else length
+    return "|".join([net_names[i] for i in ids[:num_nets]] + [str(x) for x in ids[num_nets:]])
+
+
+def _candidate_key(attributes):
+    # 与 make_pairs 相同的候选条件：同极性 MOS 且 potential 相同；其他器件不组成候选对
+    if attributes['cell'] in p_types:
+        return "p|{}".format(attributes['potential'])
+    if attributes['cell'] in n_types:
+        return "n|{}".format(attributes['potential'])
+    return ""
+
+
+def eco_model(model_path, compact=use_compact_feats, wl_feats=use_wl_feats, net_nodes=use_net_nodes):
+    """按特征配置构建 GAT 并载入参数（与 load_data 构建的模型相同）"""
+    from my_Egatnet import GAT
+    from my_wl import WL_ROUNDS
+    assert not (compact and net_nodes), "compact features cannot tell net nodes from IO nodes"
+    model = GAT(g=None, node_feats=NODE_FEATS_WIDTH, edge_feats=EDGE_ROLE_WIDTH, compact=compact,
+                extra_feats=WL_ROUNDS if wl_feats else 0, net_nodes=net_nodes)
+    model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    return model.eval()
+
+
+def _node_inputs(state):
+    """比较节点是否变化时使用的输入特征（含 WL 孪生特征）"""
+    return state['feats'] if state['twin'] is None else np.hstack((state['feats'], state['twin']))
+
+
+def _model_inputs(model, state):
+    """state 的特征 -> 模型输入（格式与 load_data 相同）"""
+    if model.input is not None:
+        cats, sizes = encode_node_feats(state['feats'])
+        nfeats = (torch.from_numpy(cats), torch.from_numpy(sizes))
+        efeats = torch.from_numpy(encode_edge_feats(state['edge_feats']))
+    else:
+        nfeats = torch.tensor(state['feats'], dtype=torch.float32)
+        efeats = torch.tensor(state['edge_feats'], dtype=torch.float32)
+    if model.extra is not None:
+        assert state['twin'] is not None, "the model expects WL features (featurize_netlist(wl_feats=True))"
+        twin = torch.from_numpy(state['twin'])
+        if model.input is not None:
+            nfeats = (nfeats[0], torch.cat((nfeats[1], twin), dim=1))
+        else:
+            nfeats = torch.cat((nfeats, twin), dim=1)
+    return nfeats, efeats
+
+
+def _dgl_graph(edges, num_nodes):
+    return dgl.graph((torch.from_numpy(edges[:, 0]), torch.from_numpy(edges[:, 1])), num_nodes=num_nodes)
+
+
+@torch.no_grad()
+def _layers(model, state):
+    """整图计算每一轮 EGT 的状态 [(h, e)]，第 0 项为输入"""
+    model.eval()
+    g = _dgl_graph(state['edges'], len(state['names']))
+    h, e = model.input_feats(*_model_inputs(model, state))
+    layers = [(h.numpy(), e.numpy())]
+    for _ in range(model.rounds):
+        h, e = model.egt1(g, h, e)
+        layers.append((h.numpy(), e.numpy()))
+    return layers
+
+
+@torch.no_grad()
+def _update_layers(model, state, cached, dirty, dirty_edges, expandable=None):
+    """逐轮增量更新 EGT 状态
+    参数：
+        cached: 缓存的各轮状态，已映射到新网表的节点 / 边编号（新增节点 / 边的行不会被使用）
+        dirty: [N] 布尔，输入特征或入边集合变化的节点
+        dirty_edges: [E] 布尔，输入特征变化的边（新增或引脚角色变化）
+        expandable: [N] 布尔，False 的节点更新自身但不向外传播变化（None 时精确）
+    返回：
+        layers: 各轮状态
+        dirty: 最终嵌入被重新计算的节点
+    """
+    model.eval()
+    src, dst = state['edges'][:, 0], state['edges'][:, 1]
+    h, e = model.input_feats(*_model_inputs(model, state))
+    layers = [(h.numpy(), e.numpy())]
+    for r in range(model.rounds):
+        spread = dirty if expandable is None else dirty & expandable
+        dirty = dirty.copy()
+        dirty[dst[dirty_edges | spread[src]]] = True
+        # 本轮重新计算的节点用全部入边（入边的源节点取上一轮状态），这些入边的状态同时更新
+        dirty_edges = dirty[dst]
+        sub = np.flatnonzero(dirty_edges)
+        nodes = np.union1d(np.flatnonzero(dirty), src[sub])
+        h_next = torch.from_numpy(cached[r + 1][0].copy())
+        e_next = torch.from_numpy(cached[r + 1][1].copy())
+        if len(nodes):
+            g = _dgl_graph(np.stack((np.searchsorted(nodes, src[sub]), np.searchsorted(nodes, dst[sub])), axis=1),
+                           len(nodes))
+            sub_h, sub_e = model.egt1(g, h[torch.from_numpy(nodes)], e[torch.from_numpy(sub)])
+            targets = np.flatnonzero(dirty)
+            h_next[torch.from_numpy(targets)] = sub_h[torch.from_numpy(np.searchsorted(nodes, targets))]
+            e_next[torch.from_numpy(sub)] = sub_e
+        h, e = h_next, e_next
+        layers.append((h.numpy(), e.numpy()))
+    return layers, dirty
+
+
+def _embedding(layers):
+    return F.normalize(torch.from_numpy(layers[-1][0]), dim=1, eps=1e-8).numpy()
+
+
+def _ball(edges, seeds, num_nodes, hops, expandable=None):
+    """seeds 的 hops 跳（无向）邻域；expandable 为 False 的节点被加入但不再向外扩展"""
+    inside = np.zeros(num_nodes, dtype=bool)
+    inside[seeds] = True
+    for _ in range(hops):
+        active = inside if expandable is None else inside & expandable
+        touched = active[edges[:, 0]] | active[edges[:, 1]]
+        grown = inside.copy()
+        grown[edges[touched].reshape(-1)] = True
+        if grown.sum() == inside.sum():
+            break
+        inside = grown
+    return np.flatnonzero(inside)
+
+
+def candidate_pairs(cand, nodes=None):
+    """候选对（pair1 < pair2，按 (pair1, pair2) 排序）
+    参数：
+        nodes: 给出时只返回至少一端在 nodes 中的候选对
+    """
+    keys, codes = np.unique(cand, return_inverse=True)
+    codes = codes.reshape(-1)
+    pair1, pair2 = [], []
+    selected = np.zeros(len(cand), dtype=bool)
+    if nodes is not None:
+        selected[nodes] = True
+    for code, key in enumerate(keys):
+        if key == "":
+            continue
+        members = np.flatnonzero(codes == code)
+        i, j = np.triu_indices(len(members), k=1)
+        if nodes is not None:
+            keep = selected[members[i]] | selected[members[j]]
+            i, j = i[keep], j[keep]
+        pair1.append(members[i])
+        pair2.append(members[j])
+    if not pair1:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pair1, pair2 = np.concatenate(pair1), np.concatenate(pair2)
+    order = np.lexsort((pair2, pair1))
+    return pair1[order], pair2[order]
+
+
+def _score(state, pair1, pair2, threshold):
+    emb = state['emb']
+    scores = (emb[pair1] * emb[pair2]).sum(-1)
+    rules = rule_arrays_from_table(state['attrs'], state['nets'])
+    pred = np.where((scores >= threshold) & fused_rule_mask(rules, pair1, pair2), 1, -1)
+    return scores, pred
+
+
+def build_cache(model, sp_path, cache_dir, threshold=0.6, norm=None, net_nodes=use_net_nodes):
+    """对网表做一次完整计算并保存缓存，返回 state（pair1, pair2, scores, pred 为所有候选对的结果）
+    参数：
+        model: eco_model 构建的 GAT（输入特征配置由模型决定，net_nodes 须与训练时相同）
+    """
+    state = featurize_netlist(sp_path, norm, net_nodes, wl_feats=model.extra is not None)
+    state['layers'] = _layers(model, state)
+    state['emb'] = _embedding(state['layers'])
+    state['pair1'], state['pair2'] = candidate_pairs(state['cand'])
+    state['scores'], state['pred'] = _score(state, state['pair1'], state['pair2'], threshold)
+    state['threshold'] = threshold
+    save_state(state, cache_dir)
+    return state
+
+
+def save_state(state, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = os.path.join(cache_dir, "eco_state.pkl.tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, os.path.join(cache_dir, "eco_state.pkl"))
+
+
+def load_state(cache_dir):
+    with open(os.path.join(cache_dir, "eco_state.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
+def _edge_keys(edges, edge_feats, ids, num_ids):
+    """边的整数键：(src, dst, 引脚角色位掩码)，ids 把节点编号映射到新旧网表共用的编号"""
+    roles = edge_feats @ (1 << np.arange(edge_feats.shape[1]))
+    return (ids[edges[:, 0]] * num_ids + ids[edges[:, 1]]) * (1 << edge_feats.shape[1]) + roles
+
+
+def eco_update(model, sp_path, cache_dir, save=True, hub_degree=None):
+    """按缓存增量计算修改后的网表
+    参数：
+        hub_degree: 见文件头说明，None 时结果与 build_cache 完全相同
+    返回：
+        state: 与 build_cache 相同的结构
+        info: 变化统计（changed / affected 节点数，rescored / reused 对数，是否整图重算，是否近似）
+    """
+    old = load_state(cache_dir)
+    new = featurize_netlist(sp_path, old['norm'], old['net_nodes'], wl_feats=old['twin'] is not None)
+    threshold = old['threshold']
+    num_nodes = len(new['names'])
+    num_devices = len(new['cand'])
+
+    # 新旧节点按名字对应，old_id[k] 为新节点 k 在缓存中的编号（-1 为新增）
+    old_index = {name: k for k, name in enumerate(old['names'])}
+    old_id = np.array([old_index.get(name, -1) for name in new['names']], dtype=np.int64)
+    kept = old_id >= 0
+
+    changed = ~kept
+    changed[kept] |= (_node_inputs(new)[kept] != _node_inputs(old)[old_id[kept]]).any(axis=1)
+    # 边按 (src 名, dst 名, 引脚角色) 对应，新增 / 删除的边两端都算变化；
+    # 共用编号：保留的节点用旧编号，新增节点排在旧节点之后
+    new_id = np.full(len(old['names']), -1, dtype=np.int64)
+    new_id[old_id[kept]] = np.flatnonzero(kept)
+    num_ids = len(old['names']) + num_nodes
+    shared_ids = np.where(kept, old_id, len(old['names']) + np.arange(num_nodes))
+    new_keys = _edge_keys(new['edges'], new['edge_feats'], shared_ids, num_ids)
+    old_keys = _edge_keys(old['edges'], old['edge_feats'], np.arange(len(old['names'])), num_ids)
+    order = np.argsort(old_keys)
+    pos = np.minimum(np.searchsorted(old_keys[order], new_keys), max(len(old_keys) - 1, 0))
+    found = old_keys[order][pos] == new_keys if len(old_keys) else np.zeros(len(new_keys), dtype=bool)
+    old_edge = np.where(found, order[pos] if len(old_keys) else 0, -1)
+    changed[new['edges'][~found].reshape(-1)] = True
+    removed = old['edges'][~np.isin(old_keys, new_keys)].reshape(-1)
+    changed[new_id[removed][new_id[removed] >= 0]] = True
+
+    # 规则属性或候选类别变化的器件（电势 weights 可能在远处变化）
+    kept_d, old_d = kept[:num_devices], old_id[:num_devices]
+    rule_changed = ~kept_d
+    rule_changed[kept_d] |= (new['attrs'][kept_d, :2] != old['attrs'][old_d[kept_d], :2]).any(axis=1) | \
+        (new['attrs'][kept_d, 2] != old['attrs'][old_d[kept_d], 2]) | \
+        (new['net_sigs'][kept_d] != old['net_sigs'][old_d[kept_d]]) | \
+        (new['cand'][kept_d] != old['cand'][old_d[kept_d]])
+
+    expandable = None
+    if hub_degree is not None:
+        expandable = np.bincount(new['edges'][:, 1], minlength=num_nodes) <= hub_degree
+    reach = _ball(new['edges'], np.flatnonzero(changed), num_nodes, model.rounds, expandable)
+    full = len(reach) > FULL_RECOMPUTE_RATIO * num_nodes
+    if full:
+        new['layers'] = _layers(model, new)
+        affected = np.ones(num_nodes, dtype=bool)
+    else:
+        # 缓存的各轮状态映射到新编号
+        cached = []
+        for h, e in old['layers']:
+            h_new = np.zeros((num_nodes, h.shape[1]), dtype=h.dtype)
+            h_new[kept] = h[old_id[kept]]
+            e_new = np.zeros((len(new_keys), e.shape[1]), dtype=e.dtype)
+            e_new[found] = e[old_edge[found]]
+            cached.append((h_new, e_new))
+        new['layers'], affected = _update_layers(model, new, cached, changed, ~found, expandable)
+    new['emb'] = _embedding(new['layers'])
+
+    # 至少一端受影响的候选对重新打分，其余沿用缓存（映射到新编号）
+    dirty = affected[:num_devices] | rule_changed
+    p1, p2 = new_id[old['pair1']], new_id[old['pair2']]
+    reuse = (p1 >= 0) & (p2 >= 0)
+    reuse[reuse] &= ~(dirty[p1[reuse]] | dirty[p2[reuse]])
+    r1, r2 = np.minimum(p1[reuse], p2[reuse]), np.maximum(p1[reuse], p2[reuse])
+    d1, d2 = candidate_pairs(new['cand'], np.flatnonzero(dirty))
+    d_scores, d_pred = _score(new, d1, d2, threshold)
+
+    pair1 = np.concatenate((r1, d1))
+    pair2 = np.concatenate((r2, d2))
+    order = np.lexsort((pair2, pair1))
+    new['pair1'], new['pair2'] = pair1[order], pair2[order]
+    new['scores'] = np.concatenate((old['scores'][reuse], d_scores))[order]
+    new['pred'] = np.concatenate((old['pred'][reuse], d_pred))[order]
+    new['threshold'] = threshold
+    if save:
+        save_state(new, cache_dir)
+    info = {'changed': int(changed.sum()), 'affected': int(affected.sum()), 'nodes': num_nodes,
+            'rescored': len(d1), 'reused': int(reuse.sum()), 'full': full, 'approximate': hub_degree is not None}
+    return new, info
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('netlist', help='.sp 网表')
+    parser.add_argument('--cache', default=os.path.join(file_path, "eco"))
+    parser.add_argument('--model', default=os.path.join(file_path, "model", "model.pkl"))
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--rebuild', action='store_true', help='忽略缓存，完整计算')
+    parser.add_argument('--hub_degree', type=int, default=None, help='变化不经度数超过它的节点传播（近似）')
+    args = parser.parse_args()
+
+    apply_runtime()  # 线程数 / 确定性模式（ECO 固定在 cpu 上计算）
+    model = eco_model(args.model)
+    start = time.time()
+    if args.rebuild or not os.path.exists(os.path.join(args.cache, "eco_state.pkl")):
+        state = build_cache(model, args.netlist, args.cache, args.threshold)
+        print("full build: {} nodes, {} pairs".format(len(state['names']), len(state['pair1'])))
+    else:
+        state, info = eco_update(model, args.netlist, args.cache, hub_degree=args.hub_degree)
+        print("incremental update: {}".format(info))
+    print("{:.3f}s".format(time.time() - start))
+    for k in np.flatnonzero(state['pred'] == 1):
+        print(state['names'][state['pair1'][k]], state['names'][state['pair2'][k]],
+              "{:.4f}".format(state['scores'][k]))
@@ -1,199 +1,119 @@
-import warnings
-import dgl
-import json
-import my_parser as parser
-import my_readgraph as readgraph
-from my_load_data import load_data
+from my_runtime import apply_runtime
+from my_load_data import load_data, split_validation
+from my_rules import *
+from my_eval import *
+from my_hierarchy import HierarchyIndex
+from my_wl import load_wl_colors, wl_pair_mask, WL_FILTER_ROUND
 from my_Egatnet import *
 from my_init import *
 
-device = torch.device('cuda:1' if torch.cuda.is_available() else 'cpu')
+device = apply_runtime()  # 设备、线程数等见 my_runtime.py
 
 
 def filter_size_rule(G, p0, p1):
-    pred = np.zeros(len(p0))
-    for i in range(len(p0)):
-        w1, l1 = G.nodes[p0[i]]['w'], G.nodes[p0[i]]['l']
-        w2, l2 = G.nodes[p1[i]]['w'], G.nodes[p1[i]]['l']
-        if float(w1) == float(w2) and float(l1) == float(l2):
-            pred[i] = 1
-        else:
-            pred[i] = -1
-    return pred
+    return np.where(size_rule_mask(node_rule_arrays(G), p0, p1), 1., -1.)
 
 
 def filter_weights_rule(G, p0, p1):
-    pred = np.zeros(len(p0))
-    for i in range(len(p0)):
-        weights1, weights2 = G.nodes[p0[i]]['weights'], G.nodes[p1[i]]['weights']
-        if weights1 == weights2:
-            pred[i] = 1
-        else:
-            pred[i] = -1
-    return pred
+    return np.where(weights_rule_mask(node_rule_arrays(G), p0, p1), 1., -1.)
 
 
 def filter_nets_rule(G, p0, p1):
-    pred = np.zeros(len(p0))
-    for i in range(len(p0)):
-        nets1, nets2 = G.nodes[p0[i]]['nets'], G.nodes[p1[i]]['nets']
-        if len(nets1) == 4 and len(nets2) == 4:
-            nets1 = nets1[0:-1]
-            nets2 = nets2[0:-1]
-        flag = 0
-        for n1 in nets1:
-            for n2 in nets2:
-                if n1 == n2:
-                    flag = 1
-                    break
-            if flag:
-                break
-        if flag:
-            pred[i] = 1
-        else:
-            pred[i] = -1
-    return pred
+    return np.where(nets_rule_mask(node_rule_arrays(G), p0, p1), 1., -1.)
 
 
 def type_01_relu(G, p0, p1):
-    pred = np.zeros(len(p0))
-    for i in range(len(p0)):
-        # 获得测试匹配对的nets数据
-        nets1, nets2 = G.nodes[p0[i]]['nets'], G.nodes[p1[i]]['nets']
-        if len(nets1) == 4 and len(nets2) == 4:
-            nets1 = nets1[0:-1]
-            nets2 = nets2[0:-1]
-        result1 = nets1.count(nets1[0]) == len(nets1)
-        result2 = nets2.count(nets2[0]) == len(nets2)
-        if result1 or result2:
-            pred[i] = -1
-        else:
-            pred[i] = 1
+    return np.where(dummy_rule_mask(node_rule_arrays(G), p0, p1), 1., -1.)
+
+
+def _scores_array(scores_out, num_pairs):
+    # .npy 路径 -> 可写的 memmap；数组原样返回
+    if isinstance(scores_out, str):
+        return np.lib.format.open_memmap(scores_out, mode='w+', dtype=np.float32, shape=(num_pairs,))
+    return scores_out
+
+
+def predict_pairs(model, feat_data, edge_feat_data, test_pair1, test_pair2, rules, threshold=0.6, hierarchy=None,
+                  wl=None, wl_round=WL_FILTER_ROUND, scores_out=None, memory_mb=score_memory_mb):
+    """模型打分 + 阈值 + 规则过滤，返回 1 / -1 预测（int8）
+    嵌入只计算一次，节点对按 memory_mb 分块打分和过滤，中间张量的内存与测试对数量无关
+    参数：
+        hierarchy: my_hierarchy.HierarchyIndex，给出时重复子电路实例内部的对只在代表实例中计算一次
+        wl: my_wl.load_wl_colors 的结果，给出时第 wl_round 轮颜色不同的对直接判为 -1，不送入模型
+        scores_out: 保存模型分数：.npy 路径（写成 memmap）或预分配的 [num_pairs] float32 数组；
+                    WL 预筛选掉的对记为 nan
+        memory_mb: 每块中间张量的内存上限（见 my_Egatnet.pair_chunk_size）
+    """
+    scores = _scores_array(scores_out, len(test_pair1))
+    if wl is not None:
+        test_pair1 = np.asarray(test_pair1)
+        test_pair2 = np.asarray(test_pair2)
+        keep = wl_pair_mask(wl, test_pair1, test_pair2, wl_round)
+        pred = np.full(len(test_pair1), -1, dtype=np.int8)
+        sub = None if scores is None else np.empty(int(keep.sum()), dtype=np.float32)
+        if keep.any():
+            pred[keep] = predict_pairs(model, feat_data, edge_feat_data, test_pair1[keep], test_pair2[keep], rules,
+                                       threshold, hierarchy, scores_out=sub, memory_mb=memory_mb)
+        if scores is not None:
+            scores[:] = np.nan
+            scores[keep] = sub
+        return pred
+    if hierarchy is not None:
+        canon1, canon2 = hierarchy.canonical_pairs(test_pair1, test_pair2)
+        unique, inverse = np.unique(np.stack((canon1, canon2), axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        sub = None if scores is None else np.empty(len(unique), dtype=np.float32)
+        pred = predict_pairs(model, feat_data, edge_feat_data, unique[:, 0], unique[:, 1], rules, threshold,
+                             scores_out=sub, memory_mb=memory_mb)
+        if scores is not None:
+            scores[:] = sub[inverse]
+        return pred[inverse]
+    model.eval()
+    model.cache_embeddings(feat_data, edge_feat_data)
+    if scores is None:
+        scores = np.empty(len(test_pair1), dtype=np.float32)
+    model.score_pairs(test_pair1, test_pair2, out=scores, memory_mb=memory_mb)
+
+    # threshold + size / weights / nets / dummy filters
+    pred = np.empty(len(scores), dtype=np.int8)
+    chunk_size = pair_chunk_size(model.node_emb.shape[1], model.node_emb.element_size(), memory_mb)
+    for start in range(0, len(pred), chunk_size):
+        p1 = np.asarray(test_pair1[start:start + chunk_size])
+        p2 = np.asarray(test_pair2[start:start + chunk_size])
+        keep = (scores[start:start + chunk_size] >= threshold) & fused_rule_mask(rules, p1, p2, chunk_size)
+        pred[start:start + chunk_size] = np.where(keep, 1, -1)
     return pred
 
 
-def test_sage(test_pair1, test_pair2, test_label, feat_data, edge_feat_data, file_dir, save_dir):
+def test_sage(test_pair1, test_pair2, test_label, feat_data, edge_feat_data, file_dir, save_dir, threshold=0.6,
+              hierarchy=None, wl=None, scores_out=None):
+    """载入 model/model.pkl，在测试对上打分、过滤并打印每个电路的指标
+    quantized_inference = True 时用动态 int8 量化的副本推理，只支持 cpu（runtime_device 不是 cpu 时报错）
+    """
+    if quantized_inference:
+        from my_quantize import check_quantized_device
+        check_quantized_device(device)
     start_time = time.time()
 
     model.load_state_dict(torch.load('{}/model/model.pkl'.format(file_path)))
-    G = nx.read_gpickle('{}/graph.pkl'.format(file_dir))
-    pair1 = torch.tensor(test_pair1).to(device)
-    pair2 = torch.tensor(test_pair2).to(device)
-    model.eval()
-    test_output = model.forward(feat_data, edge_feat_data, pair1, pair2)
-    test_output = test_output.cpu()
-    pred = np.where(test_output.data.numpy() < 0.6, -1, 1)
-
-    # size filter
-    filt = filter_size_rule(G, test_pair1, test_pair2)
-    pred = np.where(pred < filt, pred, filt)
-    # weights filter
-    filt = filter_weights_rule(G, test_pair1, test_pair2)
-    pred = np.where(pred < filt, pred, filt)
-    # nets filter
-    filt = filter_nets_rule(G, test_pair1, test_pair2)
-    pred = np.where(pred < filt, pred, filt)
-    # dummy filter
-    filt = type_01_relu(G, test_pair1, test_pair2)
-    pred = np.where(pred < filt, pred, filt)
+    scorer = model
+    if quantized_inference:
+        from my_quantize import quantize_model
+        scorer = quantize_model(model)
+    pred = predict_pairs(scorer, feat_data, edge_feat_data, test_pair1, test_pair2, load_node_rule_arrays(file_dir),
+                         threshold, hierarchy, wl, scores_out=scores_out)
 
     end_time = time.time()
     print("test costs {:.3f}s".format(end_time - start_time))
-    all_tp = 0
-    all_fp = 0
-    all_tn = 0
-    all_fn = 0
-    with open(file_path + "/" + "test_pair_name.json", 'r') as file:
-        loaded_data = json.load(file)
-    test_pair_pa = {}
-    test_label_pa = {}
-    test_pred_pa = {}
-    for i, (key, value) in enumerate(loaded_data.items()):
-        pair_1 = []
-        pair_2 = []
-        label = []
-        p = []
-        for j in range(len(test_pair1)):
-            if value[1] >= int(test_pair1[j]) >= value[0]:
-                pair_1.append(test_pair1[j])
-                pair_2.append(test_pair2[j])
-                label.append(test_label[j])
-                p.append(pred[j])
-        test_label_pa[key] = label
-        test_pred_pa[key] = p
-        test_pair_pa[key] = [pair_1, pair_2]
-    all_tpr = 0
-    all_fpr = 0
-    all_acc = 0
-    all_ppv = 0
-    all_f1 = 0
-    for key, value in test_label_pa.items():
-        true_pos = 0
-        false_pos = 0
-        true_neg = 0
-        false_neg = 0
-        for i in range(len(test_pred_pa[key])):
-            if test_pred_pa[key][i] == 1 and test_label_pa[key][i] == 1:
-                true_pos += 1
-                all_tp += 1
-            elif test_pred_pa[key][i] == 1 and test_label_pa[key][i] == -1:
-                false_pos += 1
-                all_fp += 1
-            elif test_pred_pa[key][i] == -1 and test_label_pa[key][i] == -1:
-                true_neg += 1
-                all_tn += 1
-            elif test_pred_pa[key][i] == -1 and test_label_pa[key][i] == 1:
-                false_neg += 1
-                all_fn += 1
-            else:
-                assert False
-        if true_pos == 0 and false_pos == 0:
-            PPV = 1.
-        else:
-            PPV = true_pos / (true_pos + false_pos)
-        accuracy = (true_pos + true_neg) / (true_pos + true_neg + false_pos + false_neg)
-
-        if false_pos == 0 and true_neg == 0:
-            FPR = 0.
-        else:
-            FPR = false_pos / (false_pos + true_neg)
-
-        if true_pos == 0 and false_neg == 0:
-            TPR = 0.
-        else:
-            TPR = true_pos / (true_pos + false_neg)
-        if true_pos == 0 and false_pos == 0 and false_neg == 0:
-            F1 = 0.
-        else:
-            F1 = 2 * true_pos / (2 * true_pos + false_pos + false_neg)
-        print('  {} TP: {} FP: {} TN: {} FN: {}'.format(
-            key,
-            true_pos,
-            false_pos,
-            true_neg,
-            false_neg))
-        print('            TPR: {:.4f} FPR: {:.4f} ACC: {:.4f} PPV: {:.4f} F1: {:.4f}'.format(
-            TPR,
-            FPR,
-            accuracy,
-            PPV,
-            F1))
-        all_tpr += TPR
-        all_fpr += FPR
-        all_acc += accuracy
-        all_ppv += PPV
-        all_f1 += F1
-    len_of_all = len(test_label_pa)
-    print()
-    print(" Final     TP: {} FP: {} TN: {} FN: {}".format(all_tp, all_fp, all_tn, all_fn))
-    print(" Final    TPR:{:.4f} FPR:{:.4f} PPV:{:.4f} ACC:{:.4f} F1:{:.4f}".format(all_tpr / len_of_all,
-                                                                                   all_fpr / len_of_all,
-                                                                                   all_ppv / len_of_all,
-                                                                                   all_acc / len_of_all,
-                                                                                   all_f1 / len_of_all))
+    table = circuit_metrics(test_pair1, pred, test_label, load_circuit_ranges(file_path))
+    print_metrics(table)
+    return table
 
 
 if __name__ == '__main__':
+    if quantized_inference:  # 在训练之前检查，不要训练完才发现设备不支持
+        from my_quantize import check_quantized_device
+        check_quantized_device(device)
     # load_data
     start_time = time.time()
     node_feat_data, edge_feat_data, model, pair1, pair2, train_label, test_label, test_pair1, test_pair2, train_len = load_data(
@@ -201,12 +121,20 @@ if __name__ == '__main__':
     end_time = time.time()
     print("load_data costs {:.3f}s".format(end_time - start_time))
 
-    # model
+    # hold out 10% of the training pairs for validation / early stopping
+    pair1, pair2, train_label, val_pair1, val_pair2, val_label = split_validation(pair1, pair2, train_label)
+    train_len = len(pair1)
+
+    # model（验证时的阈值、规则与 WL 预筛选与测试相同）
+    wl = load_wl_colors(file_path) if use_wl_prefilter else None
     start_time = time.time()
     train(file_path, node_feat_data, edge_feat_data, model, pair1, pair2, train_label, train_len, test_pair1,
-          test_pair2, test_label)
+          test_pair2, test_label, val_pair1=val_pair1, val_pair2=val_pair2, val_label=val_label,
+          val_rules=load_node_rule_arrays(file_path), val_wl=wl)
     end_time = time.time()
     print("train costs {:.3f}s".format(end_time - start_time))
 
     # test
-    test_sage(test_pair1, test_pair2, test_label, node_feat_data, edge_feat_data, file_path, file_path)
+    hierarchy = HierarchyIndex.from_dataXY(dataXY_file_path) if hierarchical_inference else None
+    test_sage(test_pair1, test_pair2, test_label, node_feat_data, edge_feat_data, file_path, file_path,
+              hierarchy=hierarchy, wl=wl)
@@ -0,0 +1,100 @@
+import json
+import numpy as np
+
+# 按电路统计测试结果：
+# 1. 依据 test_pair_name.json 中每个电路的节点编号区间 [small, big]，
+#    用有序区间 + searchsorted 把每个测试对分配到所属电路
+# 2. 用 bincount 一次性统计所有电路的 TP/FP/TN/FN
+# 3. 返回结构化数组（每行一个电路），训练中每个 epoch 调用也很便宜
+
+METRIC_DTYPE = [('name', object), ('tp', np.int64), ('fp', np.int64), ('tn', np.int64), ('fn', np.int64),
+                ('tpr', np.float64), ('fpr', np.float64), ('acc', np.float64), ('ppv', np.float64),
+                ('f1', np.float64)]
+
+
+def load_circuit_ranges(file_dir):
+    """读取 read_graph 保存的 test_pair_name.json：{电路名: [起始节点, 结束节点]}"""
+    with open(file_dir + "/" + "test_pair_name.json", 'r') as file:
+        return json.load(file)
+
+
+def assign_circuits(pair1, circuit_ranges):
+    """把测试对分配到所属电路
+    参数：
+        pair1: 测试对的第一个节点编号
+        circuit_ranges: {电路名: [small, big]}，区间互不重叠
+    返回：
+        circuit_idx: [num_pairs] 电路在 circuit_ranges 中的序号，不属于任何电路为 -1
+    """
+    pair1 = np.asarray(pair1, dtype=np.int64)
+    bounds = np.array(list(circuit_ranges.values()), dtype=np.int64).reshape(-1, 2)
+    if len(bounds) == 0:
+        return np.full(len(pair1), -1, dtype=np.int64)
+    order = np.argsort(bounds[:, 0], kind='stable')
+    starts = bounds[order, 0]
+    ends = bounds[order, 1]
+    pos = np.searchsorted(starts, pair1, side='right') - 1
+    inside = (pos >= 0) & (pair1 <= ends[np.maximum(pos, 0)])
+    return np.where(inside, order[np.maximum(pos, 0)], -1)
+
+
+def confusion_counts(circuit_idx, pred, label, num_circuits):
+    """一次 bincount 统计每个电路的混淆矩阵
+    返回：
+        counts: [num_circuits, 4]，列依次为 TP FP TN FN
+    """
+    pred = np.asarray(pred) == 1
+    label = np.asarray(label) == 1
+    keep = circuit_idx >= 0
+    # 0:TN 1:FN 2:FP 3:TP
+    code = circuit_idx[keep] * 4 + pred[keep] * 2 + label[keep]
+    counts = np.bincount(code, minlength=num_circuits * 4).reshape(num_circuits, 4)
+    return counts[:, [3, 2, 0, 1]]
+
+
+def _ratio(num, den, default):
+    num = num.astype(np.float64)
+    return np.where(den == 0, default, num / np.maximum(den, 1))
+
+
+def circuit_metrics(pair1, pred, label, circuit_ranges):
+    """计算每个电路的 TP/FP/TN/FN 及 TPR/FPR/ACC/PPV/F1
+    参数：
+        pair1: 测试对的第一个节点编号
+        pred, label: 预测值与标签（1 / -1）
+        circuit_ranges: {电路名: [small, big]}
+    返回：
+        table: 结构化数组，字段见 METRIC_DTYPE，行顺序与 circuit_ranges 相同
+    """
+    names = list(circuit_ranges.keys())
+    counts = confusion_counts(assign_circuits(pair1, circuit_ranges), pred, label, len(names))
+    tp, fp, tn, fn = counts.T
+    table = np.zeros(len(names), dtype=METRIC_DTYPE)
+    table['name'] = names
+    table['tp'], table['fp'], table['tn'], table['fn'] = tp, fp, tn, fn
+    table['tpr'] = _ratio(tp, tp + fn, 0.)
+    table['fpr'] = _ratio(fp, fp + tn, 0.)
+    table['acc'] = _ratio(tp + tn, tp + tn + fp + fn, 0.)
+    table['ppv'] = _ratio(tp, tp + fp, 1.)
+    table['f1'] = _ratio(2 * tp, 2 * tp + fp + fn, 0.)
+    return table
+
+
+def summarize_metrics(table):
+    """汇总：混淆矩阵求和，各比率按电路取平均"""
+    summary = {key: int(table[key].sum()) for key in ['tp', 'fp', 'tn', 'fn']}
+    for key in ['tpr', 'fpr', 'acc', 'ppv', 'f1']:
+        summary[key] = float(table[key].mean()) if len(table) else 0.
+    return summary
+
+
+def print_metrics(table):
+    for row in table:
+        print('  {} TP: {} FP: {} TN: {} FN: {}'.format(row['name'], row['tp'], row['fp'], row['tn'], row['fn']))
+        print('            TPR: {:.4f} FPR: {:.4f} ACC: {:.4f} PPV: {:.4f} F1: {:.4f}'.format(
+            row['tpr'], row['fpr'], row['acc'], row['ppv'], row['f1']))
+    s = summarize_metrics(table)
+    print()
+    print(" Final     TP: {} FP: {} TN: {} FN: {}".format(s['tp'], s['fp'], s['tn'], s['fn']))
+    print(" Final    TPR:{:.4f} FPR:{:.4f} PPV:{:.4f} ACC:{:.4f} F1:{:.4f}".format(
+        s['tpr'], s['fpr'], s['ppv'], s['acc'], s['f1']))
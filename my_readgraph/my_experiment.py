@@ -0,0 +1,208 @@
+import os
+import json
+import pickle
+import random
+import argparse
+import itertools
+import contextlib
+import concurrent.futures
+from my_runtime import available_cpus, set_threads
+import dgl
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from my_Egatnet import GAT, train
+from my_load_data import shuffle_list, load_dgl_graph
+from my_readgraph import make_pairs
+from my_rules import load_node_rule_arrays
+from my_eval import circuit_metrics, summarize_metrics
+from my_features import load_compact_feats, NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH
+from my_wl import load_wl_twin_feats
+from my_init import *
+
+# 并行实验：k 折电路划分 + 超参数网格
+# 1. prepare_dataset 只读取一次 read_graph 的输出（特征、图）和 dataXY（用于生成样本对），
+#    每个电路预先生成“训练模式”和“测试模式”两套样本对，放入共享内存
+# 2. 每个任务（一个划分 + 一组超参数）在进程池中独立训练、测试，
+#    划分只决定每个电路取哪一套样本对，不需要重新运行 read_graph
+# 3. 所有结果汇总成一张表，保存为 results.json
+
+_DATA = None  # worker 进程中的共享数据
+
+
+def prepare_dataset(data_file, data_dir, compact=use_compact_feats, wl_feats=use_wl_feats):
+    """读取已准备好的数据集，返回可在进程间共享的张量字典
+    参数：
+        data_file: my_parser 生成的 dataXY_file.txt
+        data_dir: read_graph 的输出目录（node_feats.npy / edge_feats.npy / graph.pkl）
+        compact: 同 load_data，node_feats 为 (cats, sizes)
+        wl_feats: 同 load_data，在节点特征末尾附加 WL 结构特征
+    """
+    with open(data_file, "rb") as f:
+        dataX, dataY = pickle.load(f)
+    if compact:
+        cats, sizes, masks = load_compact_feats(data_dir)
+        node_feats = (torch.from_numpy(cats), torch.from_numpy(sizes.astype(np.float32)))
+        edge_feats = torch.from_numpy(masks)
+        dims = (NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH)
+    else:
+        node_feats = torch.tensor(np.load("{}/node_feats.npy".format(data_dir)), dtype=torch.float32)
+        edge_feats = torch.tensor(np.load("{}/edge_feats.npy".format(data_dir)), dtype=torch.float32)
+        dims = (node_feats.shape[1], edge_feats.shape[1])
+    extra_feats = 0
+    if wl_feats:
+        twin = torch.from_numpy(load_wl_twin_feats(data_dir))
+        extra_feats = twin.shape[1]
+        if compact:
+            node_feats = (node_feats[0], torch.cat((node_feats[1], twin), dim=1))
+        else:
+            node_feats = torch.cat((node_feats, twin), dim=1)
+    g = load_dgl_graph(data_dir, len(cats) if compact else node_feats.shape[0])
+    src, dst = g.edges()
+
+    names = []
+    ranges = []
+    blocks = {True: [], False: []}  # 每个电路的 [pair1, pair2, label, circuit]，正样本在前
+    num_nodes = 0
+    for i in range(len(dataX)):
+        graph = dataX[i]["graph"]
+        names.append(dataX[i]['subckts'][0].name)
+        ranges.append([num_nodes, num_nodes + len(graph.nodes) - 1])
+        for train_mode in [True, False]:
+            pos_pairs, neg_pairs = make_pairs(graph, dataY[i], num_nodes, train_mode)
+            block = np.array([p[:3] + [i] for p in pos_pairs + neg_pairs], dtype=np.int64).reshape(-1, 4)
+            blocks[train_mode].append(block)
+        num_nodes += len(graph.nodes)
+
+    shared = {
+        'node_feats': node_feats,
+        'edge_feats': edge_feats,
+        'src': src,
+        'dst': dst,
+        'train_pairs': torch.from_numpy(np.concatenate(blocks[True])),
+        'test_pairs': torch.from_numpy(np.concatenate(blocks[False])),
+        'rules': {k: torch.from_numpy(v) for k, v in load_node_rule_arrays(data_dir).items()},
+    }
+    for v in itertools.chain(shared.values(), shared['rules'].values(), node_feats if compact else ()):
+        if torch.is_tensor(v):
+            v.share_memory_()
+    shared['num_nodes'] = g.num_nodes()
+    shared['dims'] = dims
+    shared['compact'] = compact
+    shared['extra_feats'] = extra_feats
+    shared['names'] = names
+    shared['ranges'] = ranges
+    return shared
+
+
+def kfold_splits(num_circuits, k):
+    """把电路按顺序分成 k 折，返回每折的训练电路编号"""
+    folds = np.array_split(np.arange(num_circuits), k)
+    return [sorted(set(range(num_circuits)) - set(fold.tolist())) for fold in folds]
+
+
+def make_jobs(splits, param_grid, thresholds=(0.6,)):
+    """划分 × 超参数网格 生成任务列表"""
+    keys = sorted(param_grid)
+    jobs = []
+    for fold, trainset in enumerate(splits):
+        for values in itertools.product(*[param_grid[k] for k in keys]):
+            job = {'fold': fold, 'trainset': list(trainset), 'thresholds': list(thresholds)}
+            job.update(dict(zip(keys, values)))
+            jobs.append(job)
+    return jobs
+
+
+def select_pairs(data, trainset):
+    """按划分组合样本对，顺序与 read_graph + load_data 一致"""
+    in_train = np.isin(np.arange(len(data['names'])), list(trainset))
+    train_pairs = data['train_pairs'].numpy()
+    test_pairs = data['test_pairs'].numpy()
+    pairs = np.concatenate([train_pairs[in_train[train_pairs[:, 3]]], test_pairs[~in_train[test_pairs[:, 3]]]])
+    is_train = in_train[pairs[:, 3]]
+    order = np.argsort(pairs[:, 0], kind='stable')  # labels.txt 按第一个节点排序
+    return pairs[order[is_train[order]]], pairs[order[~is_train[order]]]
+
+
+def _init_worker(shared, num_threads):
+    global _DATA
+    _DATA = shared
+    set_threads(num_threads)
+
+
+def _run_job(job_id, job, out_dir):
+    from my_egat_model_test import predict_pairs
+    data = _DATA
+    job_dir = os.path.join(out_dir, "job{}".format(job_id))
+    os.makedirs(os.path.join(job_dir, "model"), exist_ok=True)
+    train_pairs, test_pairs = select_pairs(data, job['trainset'])
+
+    random.seed(1)
+    fused_train = [list(x) for x in shuffle_list(train_pairs[:, 0].tolist(), train_pairs[:, 1].tolist(),
+                                                 train_pairs[:, 2].tolist())]
+    pair1 = torch.tensor(fused_train[0])
+    pair2 = torch.tensor(fused_train[1])
+    train_label = torch.FloatTensor(np.asarray(fused_train[2]))
+
+    g = dgl.graph((data['src'], data['dst']), num_nodes=data['num_nodes'])
+    feat_data, edge_feat_data = data['node_feats'], data['edge_feats']
+    model = GAT(g=g, node_feats=data['dims'][0], edge_feats=data['dims'][1], compact=data['compact'],
+                extra_feats=data['extra_feats'], net_nodes=use_net_nodes)
+    with open(os.path.join(job_dir, "train.log"), "w") as log, contextlib.redirect_stdout(log):
+        train(job_dir, feat_data, edge_feat_data, model, pair1, pair2, train_label, len(train_pairs), None, None,
+              None, flush_interval=0, epoch=job['epoch'], batch_size=job['batch_size'], lr=job['lr'])
+    model.load_state_dict(torch.load('{}/model/model.pkl'.format(job_dir)))
+
+    rules = {k: v.numpy() for k, v in data['rules'].items()}
+    test_ranges = {data['names'][i]: data['ranges'][i] for i in range(len(data['names']))
+                   if i not in job['trainset']}
+    rows = []
+    for threshold in job['thresholds']:
+        pred = predict_pairs(model, feat_data, edge_feat_data, test_pairs[:, 0], test_pairs[:, 1], rules, threshold)
+        row = {k: v for k, v in job.items() if k not in ['thresholds']}
+        row.update({'job': job_id, 'threshold': threshold})
+        row.update(summarize_metrics(circuit_metrics(test_pairs[:, 0], pred, test_pairs[:, 2], test_ranges)))
+        rows.append(row)
+    return rows
+
+
+def run_experiments(shared, jobs, out_dir, max_workers=2, threads_per_worker=None):
+    """在进程池中并行运行所有任务，返回结果表（list of dict）并保存 results.json"""
+    if threads_per_worker is None:
+        threads_per_worker = max(1, available_cpus() // max_workers)
+    os.makedirs(out_dir, exist_ok=True)
+    ctx = mp.get_context('spawn')
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, initializer=_init_worker,
+                                                initargs=(shared, threads_per_worker)) as pool:
+        futures = [pool.submit(_run_job, job_id, job, out_dir) for job_id, job in enumerate(jobs)]
+        for future in futures:
+            results.extend(future.result())
+    with open(os.path.join(out_dir, "results.json"), "w") as f:
+        json.dump(results, f, indent=1)
+    return results
+
+
+def print_results(results):
+    print("job fold     lr  epoch  batch  thr     TPR     FPR     PPV     ACC      F1")
+    for r in results:
+        print("{:3d} {:4d} {:6.4f} {:6d} {:6d} {:4.2f}  {:.4f}  {:.4f}  {:.4f}  {:.4f}  {:.4f}".format(
+            r['job'], r['fold'], r['lr'], r['epoch'], r['batch_size'], r['threshold'], r['tpr'], r['fpr'],
+            r['ppv'], r['acc'], r['f1']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--folds', type=int, default=0, help='k 折划分，0 表示使用 read_graph 默认划分 [0, 1]')
+    parser.add_argument('--lr', type=float, nargs='+', default=[0.002])
+    parser.add_argument('--epoch', type=int, nargs='+', default=[450])
+    parser.add_argument('--batch_size', type=int, nargs='+', default=[256])
+    parser.add_argument('--threshold', type=float, nargs='+', default=[0.6])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--out', default=os.path.join(file_path, "experiments"))
+    args = parser.parse_args()
+
+    shared = prepare_dataset(dataXY_file_path, file_path)
+    splits = kfold_splits(len(shared['names']), args.folds) if args.folds else [[0, 1]]
+    jobs = make_jobs(splits, {'lr': args.lr, 'epoch': args.epoch, 'batch_size': args.batch_size}, args.threshold)
+    print_results(run_experiments(shared, jobs, args.out, max_workers=args.workers))
@@ -0,0 +1,237 @@
+import os
+import argparse
+import numpy as np
+import my_runtime  # 须在 torch 之前导入（OpenMP 环境变量）
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from my_init import *
+
+# 不依赖 DGL 的推理模型导出（TorchScript，可选 ONNX）
+# EGT 的 apply_edges / edge_softmax / update_all 改写为按 src / dst 下标的 gather / scatter：
+#   score[e] = <k[src[e]], q[dst[e]]> / scale + B[e]
+#   att = 以 dst 分组的 softmax（先减去组内最大值，与 dgl.edge_softmax 相同）
+#   agg[n] = sum_{dst[e] = n} att[e] * (v[src[e]] | v_e[e])
+# 参数与训练好的 GAT 共享（同一套 state_dict），导出的模型只依赖 torch：
+#   module = torch.jit.load('model.pt')
+#   scores = module(node_feats, edge_feats, src, dst, pair1, pair2)
+#   emb = module.embed(node_feats, edge_feats, src, dst)
+# 输入格式见 pack_inputs；load_inputs 只用 numpy / networkx 读取 read_graph 的输出
+
+
+class ScatterEGT(nn.Module):
+    """与 my_Egatnet.EGT 等价的 gather / scatter 实现（共享 egt 的子模块）"""
+
+    def __init__(self, egt):
+        super(ScatterEGT, self).__init__()
+        self.num_heads = egt.num_heads
+        self.scale = float(egt.scale)
+        self.q, self.k, self.v, self.vv = egt.q, egt.k, egt.v, egt.vv
+        self.edge_e, self.edge_b = egt.edge_e, egt.edge_b
+        self.fc_edge0, self.fc_edge1 = egt.fc_edge0, egt.fc_edge1
+        self.norm_node0, self.norm_edge0, self.norm_edge1 = egt.norm_node0, egt.norm_edge0, egt.norm_edge1
+        self.w = egt.w
+        self.up_expert = egt.up_expert
+
+    def forward(self, feat, edge, src, dst):
+        num_nodes, num_edges, heads = feat.shape[0], src.shape[0], self.num_heads
+        h = self.norm_node0(feat)
+        edge_weight = self.norm_edge0(edge)
+        q = self.q(h).reshape(num_nodes, heads, -1)
+        k = self.k(h).reshape(num_nodes, heads, -1)
+        v = self.v(h).reshape(num_nodes, heads, -1)
+        edge_v = self.edge_e(edge_weight).reshape(num_edges, heads, -1)
+        score = (k.index_select(0, src) * q.index_select(0, dst)).sum(-1) / self.scale + self.edge_b(edge_weight)
+        e = score + edge
+        se = torch.cat((v.index_select(0, src), edge_v), dim=-1)
+
+        # 按 dst 分组的 softmax
+        index = dst.unsqueeze(1).expand(num_edges, heads)
+        group_max = torch.full((num_nodes, heads), -1e30, dtype=score.dtype, device=score.device)
+        group_max = group_max.scatter_reduce(0, index, score, reduce='amax', include_self=True)
+        exp = torch.exp(score - group_max.index_select(0, dst))
+        denom = torch.zeros((num_nodes, heads), dtype=score.dtype, device=score.device).scatter_add(0, index, exp)
+        att = exp / denom.index_select(0, dst)
+
+        a = att.unsqueeze(-1) * se
+        agg = torch.zeros((num_nodes, heads, se.shape[2]), dtype=a.dtype, device=a.device)
+        agg = agg.scatter_add(0, dst.reshape(-1, 1, 1).expand(a.shape), a)
+        h = feat * (1 + self.w) + self.vv(agg.reshape(num_nodes, -1))
+        h = self.up_expert(h)
+        e = e + self.fc_edge1(F.relu(self.fc_edge0(self.norm_edge1(e))))
+        return h, e
+
+
+class InferenceGAT(nn.Module):
+    """my_Egatnet.GAT 的推理部分（embed + 余弦打分），图以 src / dst 下标传入
+    参数：
+        model: 训练好的 GAT
+    """
+
+    def __init__(self, model):
+        super(InferenceGAT, self).__init__()
+        self.node_feats = model.node_feats
+        self.compact = model.input is not None
+        self.extra_feats = model.extra.in_features if model.extra is not None else 0
+        # TorchScript 不支持 None 子模块，未使用的输入层用 Identity 占位
+        self.node_type = model.input.node_type if self.compact else nn.Identity()
+        self.gate_flag = model.input.gate_flag if self.compact else nn.Identity()
+        self.edge_role = model.input.edge_role if self.compact else nn.Identity()
+        self.extra = model.extra if model.extra is not None else nn.Identity()
+        self.egt = ScatterEGT(model.egt1)
+        self.rounds = model.rounds
+
+    def _inputs(self, node_feats, edge_feats):
+        if self.compact:
+            # 紧凑特征：node_feats 前两列为类型 / 门连接标志编号，之后为尺寸（与附加特征）
+            cats = node_feats[:, :2].long()
+            node_feats = torch.cat((self.node_type(cats[:, 0]), self.gate_flag(cats[:, 1]), node_feats[:, 2:]),
+                                   dim=1)
+            edge_feats = self.edge_role(edge_feats.long())
+        if self.extra_feats > 0:
+            node_feats = node_feats[:, :self.node_feats] + self.extra(node_feats[:, self.node_feats:])
+        return node_feats, edge_feats
+
+    @torch.jit.export
+    def embed(self, node_feats, edge_feats, src, dst):
+        """最终节点嵌入 [num_nodes, dim]（未单位化）"""
+        h, e = self._inputs(node_feats, edge_feats)
+        for _ in range(self.rounds):
+            h, e = self.egt(h, e, src, dst)
+        return h
+
+    def forward(self, node_feats, edge_feats, src, dst, pair1, pair2):
+        h = self.embed(node_feats, edge_feats, src, dst)
+        return F.cosine_similarity(h.index_select(0, pair1), h.index_select(0, pair2), dim=1, eps=1e-8)
+
+
+def pack_inputs(node_feat_data, edge_feat_data):
+    """load_data 的特征 -> 导出模型的输入
+    稠密特征原样返回；紧凑特征 (cats, sizes) 合并为一个 float32 矩阵 [cats | sizes]（编号在 float32 中精确）
+    """
+    if isinstance(node_feat_data, (tuple, list)):
+        cats, sizes = node_feat_data
+        node_feat_data = torch.cat((cats.float(), sizes), dim=1)
+    return node_feat_data, edge_feat_data
+
+
+def load_graph_arrays(data_dir):
+    """不经过 DGL 读取图的 src / dst，边顺序与 my_load_data.load_dgl_graph 相同（与 edge_feats.npy 逐行对应）"""
+    from my_features import load_feature_edges
+    edges = load_feature_edges(data_dir)
+    return torch.from_numpy(edges[:, 0].copy()), torch.from_numpy(edges[:, 1].copy())
+
+
+def load_inputs(data_dir, compact=use_compact_feats, wl_feats=use_wl_feats):
+    """不经过 DGL 读取导出模型的输入（与 load_data 的特征相同）
+    返回：
+        node_feats, edge_feats, src, dst
+    """
+    if compact:
+        from my_features import load_compact_feats
+        cats, sizes, masks = load_compact_feats(data_dir)
+        node_feats = np.hstack((cats.astype(np.float32), sizes.astype(np.float32)))
+        edge_feats = torch.from_numpy(masks)
+    else:
+        node_feats = np.load("{}/node_feats.npy".format(data_dir)).astype(np.float32)
+        edge_feats = torch.from_numpy(np.load("{}/edge_feats.npy".format(data_dir)).astype(np.float32))
+    if wl_feats:
+        from my_wl import load_wl_twin_feats
+        node_feats = np.hstack((node_feats, load_wl_twin_feats(data_dir)))
+    src, dst = load_graph_arrays(data_dir)
+    return torch.from_numpy(node_feats), edge_feats, src, dst
+
+
+def export_torchscript(model, out_path, int8=False):
+    """导出 TorchScript 模型，返回脚本化的模块
+    参数：
+        int8: True 时 Linear 使用动态 int8 量化（见 my_quantize.py）
+    """
+    module = InferenceGAT(model.cpu()).eval()
+    if int8:
+        from my_quantize import quantize_model
+        module = quantize_model(module)  # 副本：子模块与 model 共享
+    module = torch.jit.script(module)
+    module.save(out_path)
+    return module
+
+
+def export_onnx(model, out_path, node_feats, edge_feats, src, dst, pair1, pair2, opset=18):
+    """导出 ONNX 模型（需要 onnx 包；按 dst 分组的 max 需要 opset >= 18）
+    参数：
+        node_feats, edge_feats, src, dst, pair1, pair2: 示例输入，节点 / 边 / 对的数量导出为动态维度
+    """
+    module = InferenceGAT(model.cpu()).eval()
+    torch.onnx.export(module, (node_feats, edge_feats, src, dst, pair1, pair2), out_path, opset_version=opset,
+                      input_names=['node_feats', 'edge_feats', 'src', 'dst', 'pair1', 'pair2'],
+                      output_names=['scores'],
+                      dynamic_axes={'node_feats': {0: 'nodes'}, 'edge_feats': {0: 'edges'}, 'src': {0: 'edges'},
+                                    'dst': {0: 'edges'}, 'pair1': {0: 'pairs'}, 'pair2': {0: 'pairs'}})
+
+
+@torch.no_grad()
+def parity_check(model, exported, node_feat_data, edge_feat_data, pair1, pair2, atol=1e-5, threshold=None,
+                 min_agreement=0.99):
+    """比较 DGL 模型与导出模型在同一批节点对上的分数
+    参数：
+        model: 训练好的 GAT（图为 model.g）
+        exported: InferenceGAT 或 TorchScript 模块
+        threshold: 给出时（int8 导出）不按 atol 检查分数，改为检查 score >= threshold 的预测一致比例
+        min_agreement: 预测一致比例的下限
+    返回：
+        max_diff: 分数的最大绝对误差
+        agreement: 预测相同的节点对比例
+        （max_diff 超过 atol，或 agreement 低于 min_agreement 时 AssertionError）
+    """
+    model.eval()
+    src, dst = model.g.edges()
+    expected = model(node_feat_data, edge_feat_data, pair1, pair2)
+    node_feats, edge_feats = pack_inputs(node_feat_data, edge_feat_data)
+    scores = exported(node_feats, edge_feats, src, dst, pair1, pair2)
+    max_diff = (scores - expected).abs().max().item() if len(scores) else 0.
+    if threshold is None:
+        assert max_diff <= atol, "exported model differs from the DGL model: max |diff| = {:.3g}".format(max_diff)
+        agreement = 1.
+    else:
+        agreement = ((scores >= threshold) == (expected >= threshold)).float().mean().item() if len(scores) else 1.
+        assert agreement >= min_agreement, \
+            "exported model predicts differently on {:.2%} of the pairs (threshold {})".format(1 - agreement,
+                                                                                              threshold)
+    return max_diff, agreement
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default=file_path, help='read_graph 的输出目录')
+    parser.add_argument('--model', default=os.path.join(file_path, "model", "model.pkl"))
+    parser.add_argument('--out', default=None, help='TorchScript 输出，默认与 --model 同目录的 model.pt')
+    parser.add_argument('--onnx', default=None, help='同时导出 ONNX 到该路径')
+    parser.add_argument('--atol', type=float, default=1e-5)
+    parser.add_argument('--int8', action='store_true',
+                        help='导出动态 int8 量化模型（按 --threshold 下的预测一致比例检查，不按 atol）')
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--min_agreement', type=float, default=0.99)
+    args = parser.parse_args()
+
+    os.environ.setdefault('EGAT_DEVICE', 'cpu')  # 导出与核对都在 cpu 上进行
+    from my_load_data import load_data
+    node_feat_data, edge_feat_data, model, pair1, pair2, _, _, test_pair1, test_pair2 = load_data(args.data)[:9]
+    model = model.cpu()
+    model.load_state_dict(torch.load(args.model, map_location='cpu'))
+    out = args.out or os.path.join(os.path.dirname(args.model), "model.pt")
+    module = export_torchscript(model, out, args.int8)
+    print("saved {}".format(out))
+
+    # 在训练对与测试对上核对分数
+    test_pair1, test_pair2 = torch.tensor(test_pair1), torch.tensor(test_pair2)
+    all_pair1, all_pair2 = torch.cat((pair1.cpu(), test_pair1)), torch.cat((pair2.cpu(), test_pair2))
+    max_diff, agreement = parity_check(model, torch.jit.load(out), node_feat_data, edge_feat_data, all_pair1,
+                                       all_pair2, args.atol, args.threshold if args.int8 else None,
+                                       args.min_agreement)
+    print("parity: {} pairs, max |diff| = {:.3g}, identical predictions: {:.2%}".format(len(all_pair1), max_diff,
+                                                                                     agreement))
+    if args.onnx:
+        src, dst = model.g.edges()
+        export_onnx(model, args.onnx, *pack_inputs(node_feat_data, edge_feat_data), src, dst, all_pair1,
+                    all_pair2)
+        print("saved {}".format(args.onnx))
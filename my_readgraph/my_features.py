@@ -0,0 +1,93 @@
+import os
+import numpy as np
+
+# 紧凑特征编码
+# read_graph 输出的 node_feats.npy 为 [N, 15] float（类型 one-hot 9 + 门连接标志 one-hot 4 + 尺寸 2），
+# edge_feats.npy 为 [E, 5] 的引脚角色 multi-hot。这里改为：
+#   node_cats.npy   [N, 2] int8     类型编号、门连接标志编号
+#   node_sizes.npy  [N, 2] float32  归一化后的 w, l
+#   edge_masks.npy  [E]    uint8    引脚角色位掩码（第 j 位对应 multi-hot 的第 j 列）
+# 模型端由 my_Egatnet.FeatureEmbedding 查表还原为稠密输入，显存占用和拷贝量约为原来的 1/5 ~ 1/20
+
+NODE_TYPE_WIDTH = 9
+GATE_FLAG_WIDTH = 4
+SIZE_WIDTH = 2
+EDGE_ROLE_WIDTH = 5
+NODE_FEATS_WIDTH = NODE_TYPE_WIDTH + GATE_FLAG_WIDTH + SIZE_WIDTH
+
+
+def encode_node_feats(node_feats):
+    """[N, 15] 稠密节点特征 -> (cats [N, 2] int8, sizes [N, 2] float32)"""
+    node_feats = np.asarray(node_feats)
+    cats = np.stack((node_feats[:, :NODE_TYPE_WIDTH].argmax(1),
+                     node_feats[:, NODE_TYPE_WIDTH:NODE_TYPE_WIDTH + GATE_FLAG_WIDTH].argmax(1)), axis=1)
+    return cats.astype(np.int8), node_feats[:, -SIZE_WIDTH:].astype(np.float32)
+
+
+def decode_node_feats(cats, sizes):
+    """encode_node_feats 的逆变换"""
+    return np.hstack((np.eye(NODE_TYPE_WIDTH)[cats[:, 0]], np.eye(GATE_FLAG_WIDTH)[cats[:, 1]], sizes))
+
+
+def encode_edge_feats(edge_feats):
+    """[E, 5] multi-hot -> [E] uint8 位掩码"""
+    edge_feats = np.asarray(edge_feats, dtype=np.uint8)
+    return (edge_feats << np.arange(EDGE_ROLE_WIDTH, dtype=np.uint8)).sum(1, dtype=np.uint8)
+
+
+def decode_edge_feats(masks):
+    """encode_edge_feats 的逆变换"""
+    return (np.asarray(masks, dtype=np.uint8)[:, None] >> np.arange(EDGE_ROLE_WIDTH, dtype=np.uint8)) & 1
+
+
+def edge_role_table():
+    """位掩码 -> multi-hot 的查找表 [32, 5]，用于初始化边嵌入"""
+    return decode_edge_feats(np.arange(1 << EDGE_ROLE_WIDTH))
+
+
+def feature_edges(edges):
+    """边按 (src, dst) 排序，[E, 2] int64
+    read_graph 按排序后的 edge_dic 写 edge_feats.npy，所以第 k 行特征属于排序后的第 k 条边；
+    建模型用的图（DGL 图、导出模型、分片、ECO、WL）都使用这个顺序
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    return edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+
+
+def load_feature_edges(data_dir):
+    """read_graph 输出中与 edge_feats.npy 逐行对应的边（流式输出读 edges.npy，否则读 graph.pkl）"""
+    from my_stream_graph import is_streamed
+    if is_streamed(data_dir):
+        return feature_edges(np.load("{}/edges.npy".format(data_dir)))
+    import networkx as nx
+    return feature_edges(list(nx.read_gpickle("{}/graph.pkl".format(data_dir)).edges()))
+
+
+def _encode_file(src, dst_paths, encode, chunk_rows):
+    # 分块读取（mmap），不把整个稠密矩阵读入内存
+    dense = np.load(src, mmap_mode='r')
+    parts = [encode(dense[start:start + chunk_rows]) for start in range(0, len(dense), chunk_rows)]
+    if not parts:
+        parts = [encode(np.zeros((0, dense.shape[1])))]
+    if not isinstance(parts[0], tuple):
+        parts = [(p,) for p in parts]
+    for k, path in enumerate(dst_paths):
+        np.save(path, np.concatenate([p[k] for p in parts]))
+
+
+def load_compact_feats(data_dir, chunk_rows=1 << 20):
+    """读取紧凑特征；不存在或比 node_feats.npy / edge_feats.npy 旧时先由稠密特征生成
+    返回：
+        cats, sizes, masks
+    """
+    files = {name: "{}/{}.npy".format(data_dir, name) for name in
+             ['node_feats', 'edge_feats', 'node_cats', 'node_sizes', 'edge_masks']}
+
+    def stale(dst, src):
+        return not os.path.exists(files[dst]) or os.path.getmtime(files[dst]) < os.path.getmtime(files[src])
+
+    if stale('node_cats', 'node_feats') or stale('node_sizes', 'node_feats'):
+        _encode_file(files['node_feats'], [files['node_cats'], files['node_sizes']], encode_node_feats, chunk_rows)
+    if stale('edge_masks', 'edge_feats'):
+        _encode_file(files['edge_feats'], [files['edge_masks']], encode_edge_feats, chunk_rows)
+    return np.load(files['node_cats']), np.load(files['node_sizes']), np.load(files['edge_masks'])
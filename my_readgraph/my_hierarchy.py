@@ -0,0 +1,102 @@
+import numpy as np
+from my_stream_graph import iter_dataXY
+
+# 层次化推理：同一子电路（master）的所有实例，其内部器件对只打分一次
+# subckts2graph 把层次完全展开，节点名为 <root>/<inst>/.../<device>。
+# 对每个节点记录它所在的实例链（由外到内），一对节点的“最深公共实例” P 决定它属于哪个 master：
+#   - 把两个节点按相对 P 的名字映射到该 master 的代表实例（第一个实例）中，得到规范对
+#   - 公共实例为空（顶层器件或跨顶层实例）的对保持不变，单独打分
+# 所有规范对去重后只打分、过规则一次，结果按规范对广播回原来的对。
+# 代表实例的嵌入来自展开后的整图，即已包含其边界 net 的上下文；
+# 这里假设同一 master 的各实例等价（外部连接不同时结果沿用代表实例）。
+
+
+def instance_masters(subckts, root):
+    """返回 {实例前缀: master 名}，前缀与 subckts2graph 生成的节点名一致，如 'TOP/xc0/'"""
+    subckts_map = {subckt.name: subckt for subckt in subckts}
+    masters = {}
+
+    def walk(subckt, context):
+        for entry in subckt.entries:
+            if entry.cell in subckts_map:
+                context_sub = context + entry.name + "/"
+                masters[context_sub] = entry.cell
+                walk(subckts_map[entry.cell], context_sub)
+
+    walk(subckts_map[root], root + "/")
+    return masters
+
+
+class HierarchyIndex(object):
+    """全部电路（合并图编号）的层次信息
+    chains [N, D]: 节点所在实例链的编号（由外到内，-1 填充）
+    canon [N, D + 1]: canon[n, d] 为节点 n 以第 d 层实例为公共实例时在代表实例中的对应节点，canon[n, 0] = n
+    """
+
+    def __init__(self):
+        self.chains = []
+        self.canon = []
+        self.num_instances = 0
+        self.instance_counts = {}  # master -> 实例数
+
+    @classmethod
+    def from_dataXY(cls, file_name):
+        """从 dataXY_file.txt / dataXY_stream.pkl 构建，节点编号与 read_graph 一致"""
+        return cls.from_records(iter_dataXY(file_name))
+
+    @classmethod
+    def from_records(cls, records):
+        """从内存中的 (dataX[i], dataY[i]) 序列构建"""
+        index = cls()
+        offset = 0
+        for data, _ in records:
+            index.add_circuit(data["graph"], data["subckts"], offset)
+            offset += len(data["graph"].nodes)
+        return index.finalize()
+
+    def add_circuit(self, graph, subckts, offset):
+        names = [node.attributes["name"] for node in graph.nodes]
+        devices = [name for node, name in zip(graph.nodes, names) if node.attributes["cell"] != "IO"]
+        if not devices:
+            self.chains.extend([[] for _ in names])
+            self.canon.extend([[offset + k] for k in range(len(names))])
+            return
+        root = devices[0].split("/")[0]
+        masters = instance_masters(subckts, root)
+        ids = {name: offset + k for k, name in enumerate(names)}
+        instance_ids = {}
+        representative = {}  # master -> 第一个实例前缀
+        for prefix, master in masters.items():
+            instance_ids[prefix] = self.num_instances
+            self.num_instances += 1
+            representative.setdefault(master, prefix)
+            self.instance_counts[master] = self.instance_counts.get(master, 0) + 1
+        for k, name in enumerate(names):
+            parts = name.split("/")[:-1]
+            prefixes = ["/".join(parts[:d]) + "/" for d in range(2, len(parts) + 1)]
+            prefixes = [p for p in prefixes if p in masters]
+            self.chains.append([instance_ids[p] for p in prefixes])
+            row = [offset + k]
+            for p in prefixes:
+                row.append(ids.get(representative[masters[p]] + name[len(p):], offset + k))
+            self.canon.append(row)
+
+    def finalize(self):
+        depth = max([len(c) for c in self.chains] + [0])
+        chains = np.full((len(self.chains), depth), -1, dtype=np.int64)
+        canon = np.empty((len(self.canon), depth + 1), dtype=np.int64)
+        for n, (chain, row) in enumerate(zip(self.chains, self.canon)):
+            chains[n, :len(chain)] = chain
+            canon[n, :len(row)] = row
+            canon[n, len(row):] = row[-1]
+        self.chains, self.canon = chains, canon
+        return self
+
+    def canonical_pairs(self, pair1, pair2):
+        """把节点对映射为代表实例中的规范对"""
+        pair1 = np.asarray(pair1, dtype=np.int64)
+        pair2 = np.asarray(pair2, dtype=np.int64)
+        c1, c2 = self.chains[pair1], self.chains[pair2]
+        same = np.cumprod((c1 == c2) & (c1 >= 0), axis=1)
+        depth = same.sum(axis=1)  # 最深公共实例的层数，0 表示顶层
+        return self.canon[pair1, depth], self.canon[pair2, depth]
@@ -32,25 +32,30 @@ para_log_path = os.path.join(path_save_logs, "parser.log")  # para日志文件
 
 
 
-# 添加日志类（保持原有变量不变）
-# 添加控制变量（在日志路径下方添加）
+# 日志控制（见 my_logging.py）
 log_to_terminal = False  # 是否在终端显示日志
 log_to_file = True      # 是否写入日志文件
-
-class TeeLogger:
-    """双路日志记录器，可控制输出目标"""
-    def __init__(self, filename, mode='w'):
-        self.terminal = sys.stdout
-        self.logfile = open(filename, mode) if log_to_file else None
-        
-    def write(self, message):
-        if log_to_terminal:
-            self.terminal.write(message)
-        if log_to_file and self.logfile:
-            self.logfile.write(message)
-            
-    def flush(self):
-        if log_to_terminal:
-            self.terminal.flush()
-        if log_to_file and self.logfile:
-            self.logfile.flush()
+log_level = 'INFO'      # 'DEBUG' 时输出 local nets / symmetry_map 等详细信息
+
+# 特征编码（见 my_features.py）
+use_compact_feats = False  # True 时 load_data 使用 int8/uint8 紧凑特征 + 模型内嵌入查表
+use_wl_feats = False  # True 时附加 WL 结构特征（见 my_wl.py）
+use_net_nodes = False  # True 时 read_graph 建器件-net 二部图（边数与引脚数成线性），EGT 轮数加倍；须与训练时一致
+
+# 推理
+hierarchical_inference = False  # True 时重复子电路实例内部的器件对只打分一次（见 my_hierarchy.py）
+use_wl_prefilter = False  # True 时 WL 结构哈希不同的器件对不送入模型（见 my_wl.py）
+score_memory_mb = 64  # 分块打分时每块中间张量的内存上限（见 my_Egatnet.pair_chunk_size）
+quantized_inference = False  # True 时用动态 int8 量化的 Linear 推理（仅 cpu，先用 my_quantize.py 对比精度）
+# 注意：模型宽度只有 15，int8 的动态量化开销大于矩阵乘的收益，在示例数据上 int8 嵌入比 float 慢（0.77x ~ 0.84x），
+# 预测一致约 99.3% ~ 99.8%；目前没有加速效果，保持 False
+
+# 运行时（见 my_runtime.py），启动时应用一次；环境变量 EGAT_DEVICE / EGAT_THREADS / EGAT_INTEROP_THREADS /
+# EGAT_AFFINITY / EGAT_DETERMINISTIC 优先于这里的值
+runtime_device = 'cuda:1'        # 不可用时退回 cuda:0 / cpu
+runtime_threads = None           # torch / DGL 算子内线程数，None 时取 autotune 记录的值（没有记录时为 torch 默认）
+runtime_interop_threads = None   # torch inter-op 线程数，None 时为 torch 默认
+runtime_affinity = None          # OpenMP 线程绑定：'close' / 'spread'（OMP_PROC_BIND，OMP_PLACES=cores），None 时不设置
+runtime_deterministic = False    # True 时固定随机种子并只使用确定性算子（较慢）
+runtime_seed = 826
+runtime_profile = os.path.join(path_save_logs, "runtime.json")  # my_runtime.py --autotune 的结果（按主机名记录）
@@ -1,12 +1,16 @@
 import random
+from my_runtime import apply_runtime  # 须在 torch / dgl 之前导入（OpenMP 环境变量）
 import dgl
-import networkx as nx
 import numpy as np
 import torch
 import torch.nn.functional as F
 from my_Egatnet import GAT
+from my_profile import profiled
+from my_features import load_compact_feats, load_feature_edges, NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH
+from my_wl import load_wl_twin_feats
+from my_init import use_compact_feats, use_wl_feats, use_net_nodes
 
-device = torch.device('cuda:1' if torch.cuda.is_available() else 'cpu')
+device = apply_runtime()  # 设备、线程数等见 my_runtime.py
 
 
 # seed = 826
@@ -21,60 +25,105 @@ def shuffle_list(*ls):
     return zip(*l)
 
 
-def load_data(data_dir):
+def split_validation(pair1, pair2, train_label, val_fraction=0.1):
+    """从（已打乱的）训练对末尾划出验证集
+    返回：
+        pair1, pair2, train_label, val_pair1, val_pair2, val_label
+    """
+    num_val = int(len(pair1) * val_fraction)
+    num_train = len(pair1) - num_val
+    return pair1[:num_train], pair2[:num_train], train_label[:num_train], \
+        pair1[num_train:], pair2[num_train:], train_label[num_train:]
+
+
+def dgl_graph(edges, num_nodes):
+    """feature_edges 顺序的边 -> DGL 图（第 k 条边对应 edge_feats 的第 k 行）"""
+    edges = torch.from_numpy(np.ascontiguousarray(edges))
+    return dgl.graph((edges[:, 0], edges[:, 1]), num_nodes=num_nodes)
+
+
+def load_dgl_graph(data_dir, num_nodes):
+    """读取 read_graph 输出的整图（流式输出为 edges.npy，否则为 graph.pkl），边与 edge_feats.npy 逐行对应"""
+    return dgl_graph(load_feature_edges(data_dir), num_nodes)
+
+
+@profiled('load_data')
+def load_data(data_dir, compact=use_compact_feats, wl_feats=use_wl_feats, net_nodes=use_net_nodes):
+    """读取 read_graph 的输出并构建模型
+    参数：
+        compact: True 时节点/边特征使用紧凑编码（见 my_features），node_feat_data 为 (cats, sizes)
+        wl_feats: True 时在节点特征末尾附加 WL 结构特征（见 my_wl.wl_twin_feats）
+        net_nodes: read_graph 是否使用 net 节点模式（build_graph(net_nodes=True)）
+    """
+    labels = []
+    with open("{}/labels.txt".format(data_dir)) as fp:
+        for line in fp:
+            labels.append([int(x) for x in line.strip().split()])  # 0=pair[0] 1=pair[1] 2=label 3=test or train
+
+    if compact:
+        # 紧凑特征：int8 类别编号 + float32 尺寸，uint8 边位掩码（缓存为 .npy）
+        node_cats, node_sizes, edge_masks = load_compact_feats(data_dir)
+        node_feats, edge_feats = (node_cats, node_sizes), edge_masks
+        num_nodes = len(node_cats)
+    else:
+        # # all features
+        node_feats = np.load("{}/node_feats.npy".format(data_dir))  # [num_all_nodes,feat_dim]
+        edge_feats = np.load("{}/edge_feats.npy".format(data_dir))  # [num_edges,feat_dim]
+        num_nodes = node_feats.shape[0]
+    twin = load_wl_twin_feats(data_dir) if wl_feats else None
+
+    # whole graph
+    G = load_dgl_graph(data_dir, num_nodes)
+    return model_inputs(labels, node_feats, edge_feats, G, compact, twin, net_nodes)
+
+
+def model_inputs(labels, node_feats, edge_feats, G, compact=use_compact_feats, twin=None, net_nodes=use_net_nodes):
+    """由内存中的样本对、特征和 DGL 图构建训练输入与模型，返回值与 load_data 相同
+    参数：
+        labels: labels.txt 的各行 [pair1, pair2, label, train]
+        node_feats, edge_feats: 稠密特征 [N, 15] / [E, 5]；compact=True 时为 ((cats, sizes), masks)
+        twin: wl_twin_feats 的结果，给出时附加到节点特征末尾
+        net_nodes: G 为器件-net 二部图（见 GAT 的 net_nodes）
+    """
+    assert not (compact and net_nodes), "compact features cannot tell net nodes from IO nodes"
     train = []
     test = []
     train_label = []
     test_label = []
-    with open("{}/labels.txt".format(data_dir)) as fp:
-        for i, line in enumerate(fp):
-            info = line.strip().split()
-            if int(info[3]) == 1:  # 0=pair[0] 1=pair[1] 2=label 3=test or train
-                train.append([int(info[0]), int(info[1])])
-                train_label.append(int(info[2]))
-                # test.append([int(info[0]), int(info[1])])
-                # test_label.append(int(info[2]))
-            else:
-                test.append([int(info[0]), int(info[1])])
-                test_label.append(int(info[2]))
-
-    train_pair1 = []
-    train_pair2 = []
-    test_pair1 = []
-    test_pair2 = []
+    for info in labels:
+        if int(info[3]) == 1:  # 0=pair[0] 1=pair[1] 2=label 3=test or train
+            train.append([int(info[0]), int(info[1])])
+            train_label.append(int(info[2]))
+        else:
+            test.append([int(info[0]), int(info[1])])
+            test_label.append(int(info[2]))
+
+    train_pair1 = [x[0] for x in train]
+    train_pair2 = [x[1] for x in train]
+    test_pair1 = [x[0] for x in test]
+    test_pair2 = [x[1] for x in test]
     train_len = len(train)
-    for x in train:
-        train_pair1.append(x[0])  # pair[0]
-        train_pair2.append(x[1])  # pair[1]
-    for x in test:
-        test_pair1.append(x[0])
-        test_pair2.append(x[1])
-
-    # # all features
-    node_feat_data = np.load("{}/node_feats.npy".format(data_dir))  # [num_all_nodes,feat_dim]
-    node_feat_data = torch.tensor(node_feat_data, dtype=torch.float32)
-    node_feat_data = node_feat_data.to(device)
-    node_feat_dim = node_feat_data.shape[1]
-
-    # out degree node feats
-    # od_node_feat_data = np.load("{}/out_node_feats.npy".format(data_dir))  # [num_nodes,feat_dim]
-    # od_node_feat_data = torch.tensor(od_node_feat_data, dtype=torch.float32)
-    # od_node_feat_data = od_node_feat_data.to(device)
-    # od_node_feat_dim = od_node_feat_data.shape[1]
-
-    # in degree node feats
-    # ind_node_feat_data = np.load("{}/in_node_feats.npy".format(data_dir))  # [num_nodes,feat_dim]
-    # ind_node_feat_data = torch.tensor(ind_node_feat_data, dtype=torch.float32)
-    # ind_node_feat_data = ind_node_feat_data.to(device)
-    # ind_node_feat_dim = ind_node_feat_data.shape[1]
-
-    # feat_data = (od_node_feat_data, ind_node_feat_data)
-
-    # edge feats
-    edge_feat_data = np.load("{}/edge_feats.npy".format(data_dir))  # [num_edges,feat_dim]
-    edge_feat_data = torch.tensor(edge_feat_data, dtype=torch.float32)
-    edge_feat_data = edge_feat_data.to(device)
-    edge_feat_dim = edge_feat_data.shape[1]
+
+    if compact:
+        node_cats, node_sizes = node_feats
+        node_feat_data = (torch.from_numpy(np.asarray(node_cats)).to(device),
+                          torch.from_numpy(np.asarray(node_sizes, dtype=np.float32)).to(device))
+        edge_feat_data = torch.from_numpy(np.asarray(edge_feats)).to(device)
+        node_feat_dim, edge_feat_dim = NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH
+    else:
+        node_feat_data = torch.tensor(node_feats, dtype=torch.float32).to(device)
+        node_feat_dim = node_feat_data.shape[1]
+        edge_feat_data = torch.tensor(edge_feats, dtype=torch.float32).to(device)
+        edge_feat_dim = edge_feat_data.shape[1]
+
+    extra_feats = 0
+    if twin is not None:
+        twin = torch.from_numpy(twin).to(device)
+        extra_feats = twin.shape[1]
+        if compact:
+            node_feat_data = (node_feat_data[0], torch.cat((node_feat_data[1], twin), dim=1))
+        else:
+            node_feat_data = torch.cat((node_feat_data, twin), dim=1)
 
     np.random.seed(1)
     random.seed(1)
@@ -88,17 +137,9 @@ def load_data(data_dir):
     train_label = torch.FloatTensor(np.asarray(train_label_list))
     train_label = train_label.to(device)
 
-    # test_pair1 = torch.tensor(test_pair1).to(device)
-    # test_pair2 = torch.tensor(test_pair2).to(device)
-    # test_label = torch.FloatTensor(np.asarray(test_label))
-    # test_label = test_label.to(device)
-
-    # whole graph
-    G = nx.read_gpickle('{}/graph.pkl'.format(data_dir))
-    G = dgl.from_networkx(G)
     G = G.to(device)
-
-    model = GAT(g=G, node_feats=node_feat_dim, edge_feats=edge_feat_dim)
+    model = GAT(g=G, node_feats=node_feat_dim, edge_feats=edge_feat_dim, compact=compact, extra_feats=extra_feats,
+                net_nodes=net_nodes)
     model = model.to(device)
 
     return node_feat_data, edge_feat_data, model, pair1, pair2, train_label, test_label, test_pair1, test_pair2, train_len
@@ -0,0 +1,48 @@
+import os
+import logging
+import threading
+import contextlib
+from my_init import log_to_terminal, log_to_file, log_level
+
+# 分级日志（替代 TeeLogger 替换 sys.stdout 的做法）
+# - 各模块使用 get_logger(name) 得到 egat.<name> 日志器，消息使用 %s 延迟格式化
+# - 详细的中间结果（local nets、symmetry_map 等）为 DEBUG 级别，默认 INFO 级别下不会格式化
+# - log_run 为一次运行临时挂载文件/终端 handler，只记录当前线程的日志，可在多线程中同时使用
+# 级别由 my_init.log_level 或环境变量 EGAT_LOG_LEVEL 控制
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_root = logging.getLogger("egat")
+_root.setLevel(os.environ.get("EGAT_LOG_LEVEL", log_level).upper())
+_root.propagate = False
+_root.addHandler(logging.NullHandler())
+
+
+def get_logger(name):
+    return logging.getLogger("egat." + name)
+
+
+def set_level(level):
+    """运行时修改级别，如 set_level('DEBUG') 打开详细输出"""
+    _root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+@contextlib.contextmanager
+def log_run(filename, mode='w', to_file=log_to_file, to_terminal=log_to_terminal):
+    """在 with 块内把当前线程的 egat.* 日志写入 filename（及终端）"""
+    thread_id = threading.get_ident()
+    handlers = []
+    if to_file:
+        handlers.append(logging.FileHandler(filename, mode))
+    if to_terminal:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(lambda record: record.thread == thread_id)
+        _root.addHandler(handler)
+    try:
+        yield _root
+    finally:
+        for handler in handlers:
+            _root.removeHandler(handler)
+            handler.close()
@@ -0,0 +1,175 @@
+import re
+import ast
+import math
+import functools
+
+# .param 参数与器件尺寸表达式
+# 作用域（由外到内，内层覆盖外层）：
+#   1. 全局：子电路外的 .param（含 .include / .lib 引入的），按出现顺序求值
+#   2. 子电路默认值：.subckt NAME pins... wn=1u 中的参数
+#   3. 实例参数：x1 a b NAME wn=2u，在父电路的作用域中求值，覆盖默认值
+#   4. 子电路内的 .param：在上述作用域中按顺序求值
+# 表达式只允许数字（含 SPICE 单位后缀）、参数名、四则运算 / 乘方和少量数学函数，
+# 编译为 Python AST 后白名单检查，不使用 builtins；乘方按浮点数计算（溢出时报错，不会构造巨大的整数）。
+# 缓存：每个不同的表达式只编译一次；求值按 (表达式, 用到的参数值) 缓存；
+# 每个 (master, 参数环境) 的器件尺寸只计算一次，所有参数相同的实例共享（见 ParamResolver）
+
+SUFFIXES = {'t': 1e12, 'g': 1e9, 'meg': 1e6, 'k': 1e3, 'mil': 25.4e-6, 'm': 1e-3, 'u': 1e-6, 'n': 1e-9,
+            'p': 1e-12, 'f': 1e-15, 'a': 1e-18}
+SIZE_KEYS = {'w': 'w', 'wr': 'w', 'wt': 'w', 'l': 'l', 'lr': 'l', 'lt': 'l', 'nf': 'nf', 'mf': 'nf'}
+
+def _pow(base, exponent):
+    """乘方按浮点数计算：结果超出 float 范围时报错，不会像整数乘方（如 int(10) ** int(10) ** int(10)）那样
+    构造巨大的整数而卡住"""
+    try:
+        result = float(base) ** float(exponent)
+    except OverflowError:
+        raise ValueError("parameter expression overflows: {} ** {}".format(base, exponent))
+    if isinstance(result, complex):  # 负数的非整数次方
+        raise ValueError("parameter expression is not real: {} ** {}".format(base, exponent))
+    return result
+
+
+FUNCTIONS = {'sqrt': math.sqrt, 'abs': abs, 'min': min, 'max': max, 'pow': _pow, 'exp': math.exp, 'log': math.log,
+             'log10': math.log10, 'int': int, 'floor': math.floor, 'ceil': math.ceil, 'sin': math.sin,
+             'cos': math.cos, 'tan': math.tan}
+_ALLOWED = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call, ast.Add, ast.Sub,
+            ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.UAdd, ast.USub)
+_NUMBER = re.compile(r"^([+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)([a-z]*)$")
+_NUMBER_IN_EXPR = re.compile(r"(?<![\w.])((?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)([a-z]*)")
+_LEGACY_SIZE = re.compile(r"^[wl]\d+(\.\d*)?$")  # read_netlist 原有的 w1 / l2 写法
+
+
+def _scale(suffix):
+    # SPICE 单位：meg / mil 优先，其余只看首字母（如 um 取 u），不是后缀的字母视为单位名，倍率为 1
+    if suffix.startswith('meg'):
+        return SUFFIXES['meg']
+    if suffix.startswith('mil'):
+        return SUFFIXES['mil']
+    return SUFFIXES.get(suffix[:1], 1.)
+
+
+def parse_number(text):
+    """SPICE 数字（如 2u、0.5meg、1e-6），不是数字时返回 None"""
+    match = _NUMBER.match(text.strip().lower())
+    if match is None:
+        return None
+    return float(match.group(1)) * _scale(match.group(2))
+
+
+def is_expression(value):
+    """尺寸值是否需要按参数求值（不是数字，也不是原有的 w1 / l2 写法）"""
+    return parse_number(value) is None and _LEGACY_SIZE.match(value) is None
+
+
+def _to_python(text):
+    text = text.strip().strip("'\"{}").lower().replace('^', '**')
+    return _NUMBER_IN_EXPR.sub(lambda m: repr(float(m.group(1)) * _scale(m.group(2))), text)
+
+
+class _PowToCall(ast.NodeTransformer):
+    """a ** b 改写为 pow(a, b)（_pow，浮点乘方）"""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(ast.Call(func=ast.Name(id='pow', ctx=ast.Load()), args=[node.left, node.right],
+                                              keywords=[]), node)
+        return node
+
+
+@functools.lru_cache(maxsize=None)
+def compile_expression(text):
+    """编译表达式（每个不同的表达式只编译一次）
+    返回：
+        code, names: 代码对象与用到的参数名（有序）
+    """
+    tree = ast.parse(_to_python(text), mode='eval')
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED):
+            raise ValueError("unsupported parameter expression: {}".format(text))
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise ValueError("unsupported function in parameter expression: {}".format(text))
+        elif isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            names.add(node.id)
+    tree = ast.fix_missing_locations(_PowToCall().visit(tree))
+    return compile(tree, '<param>', 'eval'), tuple(sorted(names))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _evaluate(text, values):
+    code, names = compile_expression(text)
+    env = dict(FUNCTIONS)
+    env.update(zip(names, values))
+    return float(eval(code, {'__builtins__': {}}, env))
+
+
+def evaluate(text, scope):
+    """在参数作用域 scope（{名字: 数值}）中求值，结果按 (表达式, 用到的参数值) 缓存"""
+    _, names = compile_expression(text)
+    missing = [name for name in names if name not in scope]
+    if missing:
+        raise ValueError("undefined parameter {} in expression {}".format(", ".join(missing), text))
+    return _evaluate(text, tuple(scope[name] for name in names))
+
+
+def resolve_params(params, scope):
+    """按顺序求值 [(名字, 表达式)]，后面的参数可以引用前面的，返回新的作用域"""
+    scope = dict(scope)
+    for name, expr in params:
+        scope[name] = evaluate(expr, scope)
+    return scope
+
+
+class ParamResolver(object):
+    """展开层次时的参数作用域与器件尺寸
+    参数：
+        global_params: 全局 .param [(名字, 表达式)]
+    """
+
+    def __init__(self, global_params=()):
+        self.globals = resolve_params(global_params, {})
+        self._scopes = {}  # (master, 实例参数值) -> 作用域
+        self._sizes = {}   # (master, 实例参数值) -> {元件序号: {'w' / 'l' / 'nf': 字符串}}
+
+    def scope(self, subckt, values=None):
+        """subckt 的一个实例的作用域
+        参数：
+            values: 实例参数 {名字: 数值}（已在父电路作用域中求值）
+        返回：
+            key, scope: key 标识 (master, 参数环境)，用于 device_sizes
+        """
+        values = values or {}
+        key = (subckt.name, tuple(sorted(values.items())))
+        if key not in self._scopes:
+            # 默认值按顺序求值，被实例覆盖的直接取实例值（后面的默认值可以引用它）
+            scope = dict(self.globals)
+            scope.update(values)
+            for name, expr in subckt.params.items():
+                if name not in values:
+                    scope[name] = evaluate(expr, scope)
+            self._scopes[key] = resolve_params(subckt.local_params, scope)
+        return key, self._scopes[key]
+
+    def instance_values(self, entry, scope):
+        """子电路实例行上的参数值（在父电路作用域中求值）"""
+        return {name: evaluate(expr, scope) for name, expr in entry.params.items()}
+
+    def device_sizes(self, subckt, key):
+        """subckt 中尺寸为表达式的元件在该参数环境下的 w / l / nf，每个 (master, 参数环境) 只计算一次"""
+        if key not in self._sizes:
+            scope = self._scopes[key]
+            sizes = {}
+            for k, entry in enumerate(subckt.entries):
+                resolved = {}
+                for name, expr in entry.params.items():  # 与 read_netlist 相同：同类参数以行中靠前的为准
+                    attr = SIZE_KEYS.get(name)
+                    if attr is not None and is_expression(expr):
+                        value = evaluate(expr, scope)
+                        resolved[attr] = str(int(round(value))) if attr == 'nf' else repr(value)
+                if resolved:
+                    sizes[k] = resolved
+            self._sizes[key] = sizes
+        return self._sizes[key]
@@ -1,36 +1,243 @@
 import pickle
+import contextlib
 from netlist import *
 import re
+import logging
 from my_init import *
+from my_profile import profiled
+from my_logging import get_logger, log_run
+from my_params import ParamResolver, SIZE_KEYS, is_expression, parse_number
+
+logger = get_logger('parser')
 
 inductance_types = []
 
-def read_netlist(filename):
-    """解析SPICE网表文件,取子电路及其元件信息
+_LIBRARY_CACHE = {}  # 绝对路径 -> (mtime, {段名: (subckts, potential, own, params)})，同一进程中所有网表共享
+_QUOTED = re.compile(r"('[^']*'|\"[^\"]*\"|\{[^}]*\})")
+
+
+def _unquote(token):
+    return token.strip("'\"{}")
+
+
+def _clean_line(line):
+    """移除引脚列表等处的括号和首尾空格，name = value 合并为 name=value；
+    参数值中的括号与逗号保留（如 w=max(wn, 2u)，去掉括号内的空白），引号 / 花括号中的表达式去掉空白
+    """
+    parts = _QUOTED.split(line)
+    for k in range(0, len(parts), 2):
+        parts[k] = re.sub(r"\s*=\s*", "=", parts[k])
+    out = []
+    token = ""  # 当前单词（到上一个空白为止），含 '=' 时其后的括号属于参数值
+    depth = 0  # 参数值中括号的深度
+    for k, part in enumerate(parts):
+        if k % 2:
+            part = re.sub(r"\s+", "", part)
+            out.append(part)
+            token += part
+            continue
+        for c in part:
+            if depth:
+                depth += (c == '(') - (c == ')')
+                if not c.isspace():
+                    out.append(c)
+            elif c == '(' and '=' in token:
+                depth = 1
+                out.append(c)
+            elif c not in '()':
+                token = "" if c.isspace() else token + c
+                out.append(c)
+    return "".join(out).strip()
+
+
+def _size_literal(value):
+    # 普通数字保持原字符串，其他单位后缀（如 0.5p、1meg）换算为数值
+    try:
+        float(value)
+        return value
+    except ValueError:
+        return repr(parse_number(value))
+
+
+def _parse_entry(tokens, potential):
+    """解析子电路中的一行元件定义
     参数：
-        filename: SPICE网表文件路径
+        tokens: 按空白切分后的行
+        potential: 电势分组列表（3阱工艺），新分组追加到末尾
+    """
+    # class SpiceEntry(object):
+    #   def __init__(self):
+    #     self.name = ""
+    #     self.pins = []
+    #     self.cell = None
+    #     self.attributes = {}
+    potential_flag = False  # 标记当前行是否包含电势参数
+    entry = SpiceEntry()
+    entry.name = tokens[0]  # 元件实例名（如M1、R2等）
+    # 设置默认参数值
+    entry.attributes['w'] = '1.0e-6'   # 默认宽度
+    entry.attributes['l'] = '1.0e-6'   # 默认长度
+    entry.attributes['nf'] = '1'       # 默认finger数
+
+    # 反向解析参数（从后往前找器件类型）
+    for i in range(len(tokens) - 1, 0, -1):
+        token = tokens[i]
+        if '=' in token:  # 处理参数赋值（如w=2u）
+            potential_flag = True
+            a_eq_b = token.split('=', 1)
+            a_eq_b[1] = _unquote(a_eq_b[1])
+            entry.params[a_eq_b[0].lower()] = a_eq_b[1]
+
+            # 参数表达式（如 w='wn*2'）在展开层次时求值（见 my_params），这里保留默认值
+            if a_eq_b[0] in SIZE_KEYS and is_expression(a_eq_b[1]):
+                continue
+
+            # 处理宽度参数（w/wr/wt）
+            if a_eq_b[0] == 'w' or a_eq_b[0] == 'wr' or a_eq_b[0] == 'wt':
+                # 处理不同单位表示（w1 -> 1e-6，2u -> 2e-6，5n ->5e-9）
+                if a_eq_b[1][0] == 'w':
+                    entry.attributes['w'] = str((float(a_eq_b[1][1:]) + 1)) + 'e' + '-6'
+                elif a_eq_b[1][-1] == 'u':
+                    entry.attributes['w'] = a_eq_b[1][0:-1] + 'e-6'
+                elif a_eq_b[1][-1] == 'n':
+                    entry.attributes['w'] = a_eq_b[1][0:-1] + 'e-9'
+                else:
+                    entry.attributes['w'] = _size_literal(a_eq_b[1])
+
+            # 处理长度参数（l/lr/lt）逻辑同上
+            elif a_eq_b[0] == 'l' or a_eq_b[0] == 'lr' or a_eq_b[0] == 'lt':
+                if a_eq_b[1][0] == 'l':
+                    entry.attributes['l'] = str((float(a_eq_b[1][1:]) + 1)) + 'e' + '-6'
+                elif a_eq_b[1][-1] == 'u':
+                    entry.attributes['l'] = a_eq_b[1][0:-1] + 'e-6'
+                elif a_eq_b[1][-1] == 'n':
+                    entry.attributes['l'] = a_eq_b[1][0:-1] + 'e-9'
+                else:
+                    entry.attributes['l'] = _size_literal(a_eq_b[1])
+
+            # 处理finger数参数
+            elif a_eq_b[0] == 'mf' or a_eq_b[0] == 'nf':
+                entry.attributes['nf'] = a_eq_b[1]
+
+        else:  # 遇到非参数项时确定器件类型
+            entry.cell = tokens[i]  # 器件类型（nmos/pmos等）
+            temp_pin = tokens[1:i]  # 提取引脚信息
+
+            # 处理3阱工艺的特殊情况（引脚数>4，子电路实例 x... 除外）
+            if len(temp_pin) > 4 and potential_flag and not entry.name.lower().startswith('x'):
+                entry.pins = temp_pin[:4]  # 前4个为真实引脚
+                # 剩余引脚存入potential分组
+                index = next((i for i, sublist in enumerate(potential) if sublist == [temp_pin[4:]]), None)
+                if index is None:
+                    potential.append([temp_pin[4:]])
+                    entry.attributes['potential'] = len(potential) - 1
+                else:
+                    entry.attributes['potential'] = index
+            else:  # 普通情况直接存储引脚
+                entry.pins = tokens[1:i]
+                entry.attributes['potential'] = 0  # 默认分组
+            break  # 结束参数解析循环
+    return entry
+
+
+def _merge_library(subckts, potential, lib_subckts, lib_potential):
+    """把库文件中的子电路并入当前网表，电势分组编号映射到当前网表的 potential 列表
+    分组编号不变时直接共享缓存中的对象，否则只复制需要改编号的元件
+    """
+    mapping = []
+    for group in lib_potential:
+        if group not in potential:
+            potential.append(group)
+        mapping.append(potential.index(group))
+    if mapping == list(range(len(mapping))):
+        subckts.extend(lib_subckts)
+        return
+    for lib_subckt in lib_subckts:
+        tmpckt = SpiceSubckt()
+        tmpckt.name = lib_subckt.name
+        tmpckt.pins = lib_subckt.pins
+        tmpckt.params, tmpckt.local_params = lib_subckt.params, lib_subckt.local_params
+        for lib_entry in lib_subckt.entries:
+            entry = lib_entry
+            if 'potential' in lib_entry.attributes and mapping[lib_entry.attributes['potential']] != \
+                    lib_entry.attributes['potential']:
+                entry = SpiceEntry()
+                entry.name, entry.pins, entry.cell = lib_entry.name, lib_entry.pins, lib_entry.cell
+                entry.params = lib_entry.params
+                entry.attributes = dict(lib_entry.attributes)
+                entry.attributes['potential'] = mapping[lib_entry.attributes['potential']]
+            tmpckt.entries.append(entry)
+        subckts.append(tmpckt)
+
+
+def load_library(filename, section=None, stack=()):
+    """解析 .include / .lib 引用的库文件（按路径 + mtime 缓存，每个文件在进程中只解析一次）
+    参数：
+        section: .lib 段名，None 表示段外的内容（.include）
+    返回：
+        subckts, potential, params: 子电路列表（与缓存共享，不应修改）、电势分组及全局 .param
+    """
+    path = os.path.abspath(filename)
+    mtime = os.path.getmtime(path)
+    cached = _LIBRARY_CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        assert path not in stack, "recursive include: %s" % path
+        logger.info("read library file: %s", path)
+        cached = (mtime, _parse_spice(path, stack + (path,)))
+        _LIBRARY_CACHE[path] = cached
+    sections = cached[1]
+    assert section in sections, "section %s not found in %s" % (section, path)
+    subckts, potential, _, params = sections[section]
+    return subckts, potential, params
+
+
+def clear_library_cache():
+    _LIBRARY_CACHE.clear()
+
+
+def _parse_spice(filename, stack=()):
+    """逐行解析一个 SPICE 文件
     返回：
-        subckts: 包含所有子电路信息的列表
+        {段名: (subckts, potential, own, params)}，段外的内容对应段名 None，
+        own 为该段中直接定义的子电路，params 为全局 .param [(名字, 表达式)]
     """
-    subckts = []        # 存储所有子电路的列表
+    sections = {None: ([], [[]], [], [])}  # 子电路、电势分组（3阱工艺）、本文件中定义的子电路、全局参数
+    section = None      # 当前 .lib 段
     subckt_flag = False  # 标记是否处于子电路定义块中
-    potential = [[]]    # 存储电势分组信息，用于处理3阱工艺
+    included = set()    # 已并入的 (库文件, 段)，避免重复引用时子电路重复
     with open(filename, "r") as f:
         for line in f:
-            potential_flag = False  # 标记当前行是否包含电势参数
             # 预处理行内容：移除括号和首尾空格
-            line = re.sub(r"[\(\)]", "", line)
-            line = line.strip()  # 去除空格
-            
+            line = _clean_line(line)
+
             if not line:  # 跳过空行
                 continue
-                
+
             tokens = line.split()
+            keyword = tokens[0].lower()
+            subckts, potential, own, params = sections[section]
             if line.startswith("*"):  # 跳过注释行
                 continue
-                
+
+            # 引用库文件：.include 'file' / .lib 'file' section
+            elif keyword in ['.include', '.inc'] or (keyword == '.lib' and len(tokens) >= 3):
+                lib_path = os.path.join(os.path.dirname(filename), _unquote(tokens[1]))
+                lib_section = tokens[2] if keyword == '.lib' else None
+                if (os.path.abspath(lib_path), lib_section) not in included:
+                    included.add((os.path.abspath(lib_path), lib_section))
+                    lib_subckts, lib_potential, lib_params = load_library(lib_path, lib_section, stack)
+                    _merge_library(subckts, potential, lib_subckts, lib_potential)
+                    params.extend(lib_params)
+
+            # .lib 段定义开始 / 结束
+            elif keyword == '.lib':
+                section = tokens[1]
+                sections.setdefault(section, ([], [[]], [], []))
+            elif keyword == '.endl':
+                section = None
+
             # 处理子电路定义开始
-            elif line.startswith(".subckt") or line.startswith(".SUBCKT") or line.startswith(".topckt"):
+            elif keyword in ['.subckt', '.topckt']:
                 # class SpiceSubckt(object):
                 #   def __init__(self):
                 #       self.name = ""
@@ -38,90 +245,62 @@ def read_netlist(filename):
                 #       self.entries = []
                 tmpckt = SpiceSubckt()
                 tmpckt.name = tokens[1]    # 子电路名称
-                tmpckt.pins = tokens[2:]   # 子电路引脚列表
+                tmpckt.pins = [t for t in tokens[2:] if '=' not in t and t.lower() != 'params:']  # 子电路引脚列表
+                tmpckt.params = dict(_param_items(tokens[2:]))  # 参数默认值
                 subckts.append(tmpckt)
+                own.append(tmpckt)
                 subckt_flag = True
-                
-            # 处理子电路定义结束    
-            elif line.startswith(".ends") or line.startswith(".ENDS"):
+
+            # 处理子电路定义结束
+            elif keyword == '.ends':
                 subckt_flag = False
-                
+
+            # 参数定义：子电路内为局部参数，否则为全局参数
+            elif keyword == '.param':
+                (subckts[-1].local_params if subckt_flag else params).extend(_param_items(tokens[1:]))
+
+            elif keyword.startswith('.'):  # 其他控制语句（.option / .global / .model / .end 等）不影响图结构
+                logger.debug("skip statement: %s", line)
+
             else:
-                if subckt_flag:  # 处理子电路内部的元件定义
-                    # class SpiceEntry(object):
-                    #   def __init__(self):
-                    #     self.name = ""
-                    #     self.pins = []
-                    #     self.cell = None
-                    #     self.attributes = {}
-                    entry = SpiceEntry()
-                    entry.name = tokens[0]  # 元件实例名（如M1、R2等）
-                    # 设置默认参数值
-                    entry.attributes['w'] = '1.0e-6'   # 默认宽度
-                    entry.attributes['l'] = '1.0e-6'   # 默认长度
-                    entry.attributes['nf'] = '1'       # 默认finger数
-                    
-                    # 反向解析参数（从后往前找器件类型）
-                    for i in range(len(tokens) - 1, 0, -1):
-                        token = tokens[i]
-                        if '=' in token:  # 处理参数赋值（如w=2u）
-                            potential_flag = True
-                            a_eq_b = token.split('=')
-                            assert len(a_eq_b) == 2  # 确保参数格式正确
-                            
-                            # 处理宽度参数（w/wr/wt）
-                            if a_eq_b[0] == 'w' or a_eq_b[0] == 'wr' or a_eq_b[0] == 'wt':
-                                # 处理不同单位表示（w1 -> 1e-6，2u -> 2e-6，5n ->5e-9）
-                                if a_eq_b[1][0] == 'w':
-                                    entry.attributes['w'] = str((float(a_eq_b[1][1:]) + 1)) + 'e' + '-6'
-                                elif a_eq_b[1][-1] == 'u':
-                                    entry.attributes['w'] = a_eq_b[1][0:-1] + 'e-6'
-                                elif a_eq_b[1][-1] == 'n':
-                                    entry.attributes['w'] = a_eq_b[1][0:-1] + 'e-9'
-                                else:
-                                    entry.attributes['w'] = a_eq_b[1]
-                                    
-                            # 处理长度参数（l/lr/lt）逻辑同上
-                            elif a_eq_b[0] == 'l' or a_eq_b[0] == 'lr' or a_eq_b[0] == 'lt':
-                                if a_eq_b[1][0] == 'l':
-                                    entry.attributes['l'] = str((float(a_eq_b[1][1:]) + 1)) + 'e' + '-6'
-                                elif a_eq_b[1][-1] == 'u':
-                                    entry.attributes['l'] = a_eq_b[1][0:-1] + 'e-6'
-                                elif a_eq_b[1][-1] == 'n':
-                                    entry.attributes['l'] = a_eq_b[1][0:-1] + 'e-9'
-                                else:
-                                    entry.attributes['l'] = a_eq_b[1]
-                                    
-                            # 处理finger数参数    
-                            elif a_eq_b[0] == 'mf' or a_eq_b[0] == 'nf':
-                                entry.attributes['nf'] = a_eq_b[1]
-                                
-                        else:  # 遇到非参数项时确定器件类型
-                            entry.cell = tokens[i]  # 器件类型（nmos/pmos等）
-                            temp_pin = tokens[1:i]  # 提取引脚信息
-                            
-                            # 处理3阱工艺的特殊情况（引脚数>4）
-                            if len(temp_pin) > 4 and potential_flag:  
-                                entry.pins = temp_pin[:4]  # 前4个为真实引脚
-                                # 剩余引脚存入potential分组
-                                index = next((i for i, sublist in enumerate(potential) if sublist == [temp_pin[4:]]), None)
-                                if index is None:
-                                    potential.append([temp_pin[4:]])
-                                    entry.attributes['potential'] = len(potential) - 1
-                                else:
-                                    entry.attributes['potential'] = index
-                            else:  # 普通情况直接存储引脚
-                                entry.pins = tokens[1:i]
-                                entry.attributes['potential'] = 0  # 默认分组
-                            break  # 结束参数解析循环
-                            
-                    subckts[-1].entries.append(entry)  # 将元件添加到当前子电路
-                else:
-                    assert 0, "not in a subckt: %s" % line  # 异常：非子电路内容
+                assert subckt_flag, "not in a subckt: %s" % line  # 异常：非子电路内容
+                subckts[-1].entries.append(_parse_entry(tokens, potential))  # 将元件添加到当前子电路
 
-                pass
+    return sections
 
-    return subckts
+
+def _param_items(tokens):
+    return [(a_eq_b[0].lower(), _unquote(a_eq_b[1])) for a_eq_b in (t.split('=', 1) for t in tokens if '=' in t)]
+
+
+def _used_subckts(subckts, own):
+    """去掉库文件中未被 own（网表自身定义的子电路）直接或间接引用的子电路"""
+    subckts_map = {subckt.name: subckt for subckt in subckts}
+    used = set()
+    todo = [subckt.name for subckt in own]
+    while todo:
+        name = todo.pop()
+        if name in used or name not in subckts_map:
+            continue
+        used.add(name)
+        todo.extend(entry.cell for entry in subckts_map[name].entries)
+    return [subckt for subckt in subckts if subckt.name in used]
+
+
+@profiled('parse')
+def read_netlist(filename):
+    """解析SPICE网表文件,取子电路及其元件信息
+    .include / .lib 引用的库文件按路径 + mtime 缓存，只保留网表中实际用到的库子电路
+    参数：
+        filename: SPICE网表文件路径
+    返回：
+        subckts: 包含所有子电路信息的列表（SpiceSubcktList，params 为全局 .param）
+    """
+    path = os.path.abspath(filename)
+    subckts, _, own, params = _parse_spice(path, (path,))[None]
+    if len(own) != len(subckts):
+        subckts = _used_subckts(subckts, own)
+    return SpiceSubcktList(subckts, params)
 
 
 def read_symfile(filename):
@@ -199,31 +378,30 @@ def print_graph_subckt(subckt, graph):
     print(content)
 
 
+@profiled('flatten')
 def subckts2graph(subckts, root_hint):  # subckts
-    hierarchy_graph = nx.DiGraph()
     subckts_map = {}
     subckts2nodes_map = {}
 
     for subckt in subckts:
         subckts_map[subckt.name] = subckt  # subckt
-        hierarchy_graph.add_node(subckt.name)
         subckts2nodes_map[subckt.name] = []
 
+    instantiated = set()  # 层次图中入度不为 0 的子电路
     for subckt in subckts:
         for entry in subckt.entries:
             if entry.cell in subckts_map:
-                hierarchy_graph.add_edge(subckt.name, entry.cell)
+                instantiated.add(entry.cell)
 
-    roots = []
-    for n, d in hierarchy_graph.in_degree():  # d in
-        if d == 0:
-            roots.append(n)
-    print("roots", roots)
+    roots = [name for name in subckts_map if name not in instantiated]
+    logger.debug("roots %s", roots)
 
     graph = SpiceGraph()
+    resolver = ParamResolver(getattr(subckts, 'params', []))  # .param 作用域，尺寸表达式每个 (master, 参数) 只求值一次
 
-    def build_flat(subckt, context, context_nets):
+    def build_flat(subckt, context, context_nets, scope_key, scope):
         local_nets = {}
+        sizes = resolver.device_sizes(subckt, scope_key)
         for entry in subckt.entries:
             for pin in entry.pins:
                 if pin not in subckt.pins:
@@ -234,7 +412,7 @@ def subckts2graph(subckts, root_hint):  # subckts
                         tmpnet.attributes["name"] = context + pin
                         graph.nets.append(tmpnet)
                         local_nets[pin] = tmpnet
-        print("local nets", local_nets.keys())
+        logger.debug("local nets %s", local_nets.keys())
 
         def entry_pins(entry, pin):
             if len(entry.pins) == 4 and (entry.cell in p_types or entry.cell in n_types):  # MOS
@@ -280,13 +458,14 @@ def subckts2graph(subckts, root_hint):  # subckts
                 # pdb.set_trace()
                 assert 0, "unknown device: %s" % entry.cell
 
-        for entry in subckt.entries:
+        for k, entry in enumerate(subckt.entries):
             if entry.cell not in subckts_map:
                 tmpnode = SpiceNode()
                 tmpnode.id = len(graph.nodes)
                 tmpnode.attributes["name"] = context + entry.name
                 tmpnode.attributes["cell"] = entry.cell
                 tmpnode.attributes.update(entry.attributes)
+                tmpnode.attributes.update(sizes.get(k, {}))
                 graph.nodes.append(tmpnode)
                 for i, pin in enumerate(entry.pins):
                     if pin in subckt.pins:
@@ -322,7 +501,8 @@ def subckts2graph(subckts, root_hint):  # subckts
                     else:
                         # assert pin not in context_nets, "%s not in %s failed" % (pin, str(context_nets.keys()))
                         context_nets_sub[subckt_sub.pins[i]] = local_nets[pin]
-                build_flat(subckt_sub, context_sub, context_nets_sub)
+                build_flat(subckt_sub, context_sub, context_nets_sub,
+                           *resolver.scope(subckt_sub, resolver.instance_values(entry, scope)))
 
     if root_hint in roots:
         roots = [root_hint]
@@ -354,118 +534,139 @@ def subckts2graph(subckts, root_hint):  # subckts
             graph.pins.append(tmppin)
             context_nets[pin] = tmpnet
 
-        build_flat(subckt, subckt.name + "/", context_nets)
-        print("recovered")
+        build_flat(subckt, subckt.name + "/", context_nets, *resolver.scope(subckt))
+        logger.debug("recovered")
         # print_graph_subckt(subckt, graph)
 
     return graph, roots
 
 
-def parse_all(filedir, save_dir):
-    sys.stdout = TeeLogger(para_log_path)
-    try:
-        dataX = []
-        dataY = []
+def parse_netlist(netlist, symfiles):
+    """解析单个网表及其对称信息
+    参数：
+        netlist: .sp 文件路径
+        symfiles: 可用的对称文件（.txt）列表，同名的 .txt 存在时优先使用，否则从网表属性中读取
+    返回：
+        ({"subckts": subckts, "graph": graph}, symmetry_id_array)，即 dataX / dataY 中的一项
+    """
+    logger.info("read netlist file: %s", netlist)
+    root_hint = netlist.split('/')[-1].split('.')[0]
+    subckts = read_netlist(netlist)
+
+    # parse symfile
+    # 生成对应的对称文件路径
+    txt_file = netlist.replace(".sp", ".txt")
+    symfile = txt_file if txt_file in symfiles else None  # 检查是否存在对应txt文件
+
+    if symfile:
+        logger.info("read symmetry file: %s", symfile)
+        symmetry_map = read_symfile(symfile)
+    else:
+        logger.info("parse symmetry info from attributes")
+        symmetry_map = read_symattr(subckts)
+        pass
+
+    # spice graph
+    graph, roots = subckts2graph(subckts, root_hint)
+
+    symmetry_id_array = []
+
+    def add_symmetry_pairs(subckt_inst, pairs):
+        for pair in pairs:
+            skip_flag = False
+            if len(pair) == 1:
+                for subckt in subckts:
+                    for entry in subckt.entries:
+                        if entry.name == pair[0] and entry.cell in symmetry_map:
+                            skip_flag = True
+                            break
+                    if skip_flag:
+                        break
+            if skip_flag:
+                continue
 
-        netlists = glob.glob(os.path.join(filedir, "*.sp"))
-        netlists = sorted(netlists)
-        symfiles = glob.glob(os.path.join(filedir, "*.txt"))
+            names = pair  # (M1,M2)...
+            node_id_pair = []
+            groups = {}
+            for name in names:
+                groups[name] = []
+            for tmpnode in graph.nodes:
+                for name in names:  # M1 M2...
+                    if subckt_inst in roots:
+                        if root_hint + "/" + name == tmpnode.attributes["name"]:
+                            groups[name].append(tmpnode.id)  # group[M1]:1 group[M2]:2
+                    elif subckt_inst not in roots:
+                        if root_hint + "/" + subckt_inst + "/" + name == tmpnode.attributes["name"]:
+                            groups[name].append(tmpnode.id)  # group[M1]:1 group[M2]:2
+            for key, value in groups.items():
+                assert len(value) == 1
+                node_id_pair.append(value[0])
+            symmetry_id_array.append(node_id_pair)  # M1,M2) to [1,2]
+
+    for subckt_sym, pairs in symmetry_map.items():
+        if subckt_sym in roots:  # roots is the topckt
+            add_symmetry_pairs(subckt_sym, pairs)
+        else:
+            for subckt in subckts:
+                for entry in subckt.entries:
+                    if entry.cell == subckt_sym:
+                        add_symmetry_pairs(entry.name, pairs)
+
+    logger.debug("symmetry_map %s", symmetry_map)
+    logger.debug("symmetry_id_array %s", symmetry_id_array)
+
+    if logger.isEnabledFor(logging.DEBUG):  # 名字拼接只在 DEBUG 时进行
+        content = ""
+        for pair in symmetry_id_array:
+            content += "("
+            for node_id in pair:
+                if isinstance(node_id, tuple):
+                    content += " { "
+                    for nid in node_id:
+                        content += " " + graph.nodes[nid].attributes["name"]
+                    content += " } "
+                else:
+                    content += " " + graph.nodes[node_id].attributes["name"]
+            content += " ) "
+        logger.debug("symmetry pairs %s", content)
+    return {"subckts": subckts, "graph": graph}, symmetry_id_array
 
-        for netlist in netlists:
-            print("read netlist file: %s" % netlist)
-            root_hint = netlist.split('/')[-1].split('.')[0]
-            subckts = read_netlist(netlist)
 
-            # parse symfile
-            # 生成对应的对称文件路径
-            txt_file = netlist.replace(".sp", ".txt")
-            symfile = txt_file if txt_file in symfiles else None  # 检查是否存在对应txt文件
+def iter_parse(filedir):
+    """按文件名顺序逐个解析 filedir 下的网表，生成 (dataX[i], dataY[i])"""
+    netlists = sorted(glob.glob(os.path.join(filedir, "*.sp")))
+    symfiles = glob.glob(os.path.join(filedir, "*.txt"))
+    for netlist in netlists:
+        yield parse_netlist(netlist, symfiles)
 
-            if symfile:
-                print("read symmetry file: %s" % symfile)
-                symmetry_map = read_symfile(symfile)
-            else:
-                print("parse symmetry info from attributes")
-                symmetry_map = read_symattr(subckts)
-                pass
-
-            # spice graph
-            graph, roots = subckts2graph(subckts, root_hint)
-
-            symmetry_id_array = []
-
-            def add_symmetry_pairs(subckt_inst, pairs):
-                for pair in pairs:
-                    skip_flag = False
-                    if len(pair) == 1:
-                        for subckt in subckts:
-                            for entry in subckt.entries:
-                                if entry.name == pair[0] and entry.cell in symmetry_map:
-                                    skip_flag = True
-                                    break
-                            if skip_flag:
-                                break
-                    if skip_flag:
-                        continue
 
-                    names = pair  # (M1,M2)...
-                    node_id_pair = []
-                    groups = {}
-                    for name in names:
-                        groups[name] = []
-                    for tmpnode in graph.nodes:
-                        for name in names:  # M1 M2...
-                            if subckt_inst in roots:
-                                if root_hint + "/" + name == tmpnode.attributes["name"]:
-                                    groups[name].append(tmpnode.id)  # group[M1]:1 group[M2]:2
-                            elif subckt_inst not in roots:
-                                if root_hint + "/" + subckt_inst + "/" + name == tmpnode.attributes["name"]:
-                                    groups[name].append(tmpnode.id)  # group[M1]:1 group[M2]:2
-                    for key, value in groups.items():
-                        assert len(value) == 1
-                        node_id_pair.append(value[0])
-                    symmetry_id_array.append(node_id_pair)  # M1,M2) to [1,2]
-
-            for subckt_sym, pairs in symmetry_map.items():
-                if subckt_sym in roots:  # roots is the topckt
-                    add_symmetry_pairs(subckt_sym, pairs)
-                else:
-                    for subckt in subckts:
-                        for entry in subckt.entries:
-                            if entry.cell == subckt_sym:
-                                add_symmetry_pairs(entry.name, pairs)
-
-            print("symmetry_map")
-            print(symmetry_map)
-            print("symmetry_id_array")
-            print(symmetry_id_array)
-
-            content = ""
-            for pair in symmetry_id_array:
-                content += "("
-                for node_id in pair:
-                    if isinstance(node_id, tuple):
-                        content += " { "
-                        for nid in node_id:
-                            content += " " + graph.nodes[nid].attributes["name"]
-                        content += " } "
-                    else:
-                        content += " " + graph.nodes[node_id].attributes["name"]
-                content += " ) "
-            print(content)
-            print("----------------------------------------------------------------------------------")
+@profiled('parse_all')
+def parse_all(filedir, save_dir, log_path=para_log_path, stream=False):
+    """解析 filedir 下所有网表及对称文件
+    参数：
+        stream: False 时一次性保存 (dataX, dataY) 到 dataXY_file.txt；
+                True 时每解析完一个电路就把 (dataX[i], dataY[i]) 追加写入 dataXY_stream.pkl，
+                不在内存中累积（供 my_stream_graph.read_graph_streaming 使用）
+    """
+    with log_run(log_path), contextlib.ExitStack() as stack:
+        dataX = []
+        dataY = []
+        stream_file = stack.enter_context(open(save_dir + "/" + "dataXY_stream.pkl", 'wb')) if stream else None
+
+        for data, symmetry_id_array in iter_parse(filedir):
+            if stream:
+                pickle.dump((data, symmetry_id_array), stream_file)
+                continue
             # 将当前电路数据添加到数据集中  
-            dataX.append({"subckts": subckts, "graph": graph})
+            dataX.append(data)
             # 添加对应的对称关系标签
             dataY.append(symmetry_id_array)
-        with open(save_dir + "/" + "dataXY_file.txt", 'wb') as f:
-            pickle.dump((dataX, dataY), f)
+        if not stream:
+            with open(save_dir + "/" + "dataXY_file.txt", 'wb') as f:
+                pickle.dump((dataX, dataY), f)
         # return dataX, dataY
         # dataX:[{'subckts':subgraph1,'graph':graph1},{'subckts':subgraph2,'graph':graph2},.....]
         # dataY:[[labels1],[labels2],.....]
-    finally:
-        sys.stdout.logfile.close()
-        sys.stdout = sys.stdout.terminal
 
 
 if __name__ == '__main__':
@@ -0,0 +1,386 @@
+import os
+import json
+import math
+import argparse
+import concurrent.futures
+import numpy as np
+from my_runtime import available_cpus, set_threads  # 须在 torch / dgl 之前导入（OpenMP 环境变量）
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from my_init import *
+
+# 图划分：整图放不进单个进程时，把 read_graph 的输出切成若干分片，各 worker 进程并行训练 / 推理
+# 1. 节点划分为节点数均衡的 num_parts 份（BFS 顺序切块，或 METIS）
+# 2. 每个样本对归属于 pair1 所在的分片；分片需要计算嵌入的节点 targets = 本分片节点 ∪ 所属对的 pair2
+# 3. halo：targets 的 rounds 跳（EGT 次数，器件图 3，net 节点图 6）邻域；分片为 targets ∪ halo 的导出子图，
+#    在子图上跑 rounds 次 EGT，targets 的嵌入与整图完全相同
+# 4. max_halo_degree 给出时度数超过它的节点（电源 / 地 net）进入 halo 但不再向外扩展，halo 有界但结果为近似
+# 分片目录 <out>/part<k>/：
+#   nodes.npy       [n] 全局节点编号（本分片节点、其余 targets、halo 依次排列）
+#   edges.npy       [e, 2] 局部编号的边，edge_feats.npy 与之逐行对应
+#   node_feats.npy  [n, F] 稠密节点特征（twin.npy：WL 结构特征，wl_feats=True 时）
+#   pairs.npy       [p, 5] 局部 pair1、局部 pair2、label、train、labels.txt 中的行号
+#   meta.json       各部分的数量与 rounds
+# <out>/partition.json 记录全部分片，<out>/labels.npy 为 labels.txt 的内容（推理结果按其行号合并）
+
+
+def _csr(edges, num_nodes):
+    order = np.argsort(edges[:, 0], kind='stable')
+    indptr = np.searchsorted(edges[order, 0], np.arange(num_nodes + 1))
+    return indptr, edges[order, 1]
+
+
+def _neighbors(indptr, indices, frontier):
+    starts, lens = indptr[frontier], indptr[frontier + 1] - indptr[frontier]
+    offsets = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    return indices[np.repeat(starts, lens) + offsets]
+
+
+def bfs_order(edges, num_nodes):
+    """按连通分量依次 BFS 的节点顺序（相邻节点在顺序中靠近，各电路连续）"""
+    indptr, indices = _csr(edges, num_nodes)
+    visited = np.zeros(num_nodes, dtype=bool)
+    order = []
+    seed = 0
+    while seed < num_nodes:
+        if visited[seed]:
+            seed += 1
+            continue
+        frontier = np.array([seed])
+        visited[seed] = True
+        while len(frontier):
+            order.append(frontier)
+            nbrs = _neighbors(indptr, indices, frontier)
+            frontier = np.unique(nbrs[~visited[nbrs]])
+            visited[frontier] = True
+    return np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+
+
+def partition_nodes(edges, num_nodes, num_parts, method='bfs'):
+    """节点 -> 分片编号 [num_nodes]
+    参数：
+        method: 'bfs'（BFS 顺序等分，只用 numpy）或 'metis'（dgl.metis_partition_assignment，边割更小）
+    """
+    if method == 'metis':
+        import dgl
+        g = dgl.graph((torch.from_numpy(edges[:, 0]), torch.from_numpy(edges[:, 1])), num_nodes=num_nodes)
+        return dgl.metis_partition_assignment(g, num_parts).numpy().astype(np.int64)
+    owner = np.empty(num_nodes, dtype=np.int64)
+    owner[bfs_order(edges, num_nodes)] = np.arange(num_nodes) * num_parts // max(num_nodes, 1)
+    return owner
+
+
+def halo_ball(edges, seeds, num_nodes, hops, expandable=None):
+    """seeds 的 hops 跳（无向）邻域，布尔数组
+    参数：
+        expandable: [num_nodes] 布尔，False 的节点可以被加入但不再向外扩展（None 表示全部扩展）
+    """
+    inside = np.zeros(num_nodes, dtype=bool)
+    inside[seeds] = True
+    frontier = inside.copy()
+    for _ in range(hops):
+        active = frontier if expandable is None else frontier & expandable
+        touched = active[edges[:, 0]] | active[edges[:, 1]]
+        reached = np.zeros(num_nodes, dtype=bool)
+        reached[edges[touched].reshape(-1)] = True
+        frontier = reached & ~inside
+        if not frontier.any():
+            break
+        inside |= frontier
+    return inside
+
+
+def partition_graph(data_dir, out_dir, num_parts, method='bfs', rounds=None, max_halo_degree=None,
+                    wl_feats=use_wl_feats):
+    """把 read_graph 的输出切成 num_parts 个分片
+    参数：
+        rounds: halo 的跳数，默认为模型的 EGT 次数（use_net_nodes 时 6，否则 3）
+        max_halo_degree: 见文件头说明，None 时 halo 精确
+        wl_feats: 同时保存 WL 结构特征（load_data(wl_feats=True) 训练的模型需要）
+    返回：
+        partition.json 的内容
+    """
+    from my_export import load_graph_arrays
+    if rounds is None:
+        rounds = 6 if use_net_nodes else 3
+    src, dst = load_graph_arrays(data_dir)
+    edges = np.stack((src.numpy(), dst.numpy()), axis=1)
+    node_feats = np.load("{}/node_feats.npy".format(data_dir), mmap_mode='r')
+    edge_feats = np.load("{}/edge_feats.npy".format(data_dir), mmap_mode='r')
+    assert len(edge_feats) == len(edges), "edge_feats.npy does not match the graph"
+    num_nodes = len(node_feats)
+    labels = np.loadtxt("{}/labels.txt".format(data_dir), dtype=np.int64, ndmin=2).reshape(-1, 4)
+    twin = None
+    if wl_feats:
+        from my_wl import load_wl_twin_feats
+        twin = load_wl_twin_feats(data_dir)
+    expandable = None
+    if max_halo_degree is not None:
+        expandable = np.bincount(edges[:, 1], minlength=num_nodes) <= max_halo_degree
+
+    owner = partition_nodes(edges, num_nodes, num_parts, method)
+    pair_part = owner[labels[:, 0]]
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "labels.npy"), labels)
+    np.save(os.path.join(out_dir, "owner.npy"), owner)
+    parts = []
+    for k in range(num_parts):
+        owned = np.flatnonzero(owner == k)
+        rows = np.flatnonzero(pair_part == k)
+        targets = np.union1d(owned, labels[rows, 1])
+        inside = halo_ball(edges, targets, num_nodes, rounds, expandable)
+        extra = np.setdiff1d(targets, owned, assume_unique=True)
+        halo = np.setdiff1d(np.flatnonzero(inside), targets, assume_unique=True)
+        nodes = np.concatenate((owned, extra, halo))
+        local = np.full(num_nodes, -1, dtype=np.int64)
+        local[nodes] = np.arange(len(nodes))
+        edge_ids = np.flatnonzero(inside[edges[:, 0]] & inside[edges[:, 1]])
+
+        part_dir = os.path.join(out_dir, "part{}".format(k))
+        os.makedirs(part_dir, exist_ok=True)
+        np.save(os.path.join(part_dir, "nodes.npy"), nodes)
+        np.save(os.path.join(part_dir, "edges.npy"), local[edges[edge_ids]])
+        np.save(os.path.join(part_dir, "node_feats.npy"), node_feats[nodes])
+        np.save(os.path.join(part_dir, "edge_feats.npy"), edge_feats[edge_ids])
+        if twin is not None:
+            np.save(os.path.join(part_dir, "twin.npy"), twin[nodes])
+        pairs = np.stack((local[labels[rows, 0]], local[labels[rows, 1]], labels[rows, 2], labels[rows, 3], rows),
+                         axis=1)
+        np.save(os.path.join(part_dir, "pairs.npy"), pairs)
+        meta = {'part': k, 'owned': len(owned), 'targets': len(targets), 'halo': len(halo), 'edges': len(edge_ids),
+                'pairs': len(rows), 'train_pairs': int((pairs[:, 3] == 1).sum()), 'rounds': rounds,
+                'exact': max_halo_degree is None, 'wl_feats': twin is not None}
+        with open(os.path.join(part_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+        parts.append(meta)
+        print("part {}: {} owned, {} halo, {} edges, {} pairs".format(k, meta['owned'], meta['halo'], meta['edges'],
+                                                                      meta['pairs']))
+    info = {'data_dir': os.path.abspath(data_dir), 'num_parts': num_parts, 'num_nodes': num_nodes,
+            'num_edges': len(edges), 'method': method, 'rounds': rounds, 'max_halo_degree': max_halo_degree,
+            'parts': parts}
+    with open(os.path.join(out_dir, "partition.json"), "w") as f:
+        json.dump(info, f, indent=1)
+    return info
+
+
+def load_shard(part_dir, compact=use_compact_feats, wl_feats=use_wl_feats, device='cpu'):
+    """读取一个分片，特征的格式与 load_data 相同
+    返回：
+        字典：g（局部 DGL 图）, node_feats, edge_feats, pairs, nodes, meta, extra_feats
+    """
+    import dgl
+    from my_features import encode_node_feats, encode_edge_feats
+    with open(os.path.join(part_dir, "meta.json")) as f:
+        meta = json.load(f)
+    edges = torch.from_numpy(np.load(os.path.join(part_dir, "edges.npy")).reshape(-1, 2))
+    nodes = np.load(os.path.join(part_dir, "nodes.npy"))
+    node_feats = np.load(os.path.join(part_dir, "node_feats.npy"))
+    edge_feats = np.load(os.path.join(part_dir, "edge_feats.npy"))
+    if compact:
+        cats, sizes = encode_node_feats(node_feats)
+        node_feats = (torch.from_numpy(cats).to(device), torch.from_numpy(sizes.astype(np.float32)).to(device))
+        edge_feats = torch.from_numpy(encode_edge_feats(edge_feats)).to(device)
+    else:
+        node_feats = torch.tensor(node_feats, dtype=torch.float32).to(device)
+        edge_feats = torch.tensor(edge_feats, dtype=torch.float32).to(device)
+    extra_feats = 0
+    if wl_feats:
+        assert meta['wl_feats'], "partition was written without WL features (partition_graph(wl_feats=True))"
+        twin = torch.from_numpy(np.load(os.path.join(part_dir, "twin.npy"))).to(device)
+        extra_feats = twin.shape[1]
+        if compact:
+            node_feats = (node_feats[0], torch.cat((node_feats[1], twin), dim=1))
+        else:
+            node_feats = torch.cat((node_feats, twin), dim=1)
+    g = dgl.graph((edges[:, 0], edges[:, 1]), num_nodes=len(nodes)).to(device)
+    return {'g': g, 'node_feats': node_feats, 'edge_feats': edge_feats, 'nodes': nodes, 'meta': meta,
+            'pairs': np.load(os.path.join(part_dir, "pairs.npy")).reshape(-1, 5), 'extra_feats': extra_feats}
+
+
+def shard_model(shard, compact=use_compact_feats):
+    """与分片特征匹配的 GAT（图在调用 embed 时传入）"""
+    from my_Egatnet import GAT
+    from my_features import NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH
+    if compact:
+        node_dim, edge_dim = NODE_FEATS_WIDTH, EDGE_ROLE_WIDTH
+    else:
+        node_dim = shard['node_feats'].shape[1] - shard['extra_feats']
+        edge_dim = shard['edge_feats'].shape[1]
+    model = GAT(g=None, node_feats=node_dim, edge_feats=edge_dim, compact=compact, extra_feats=shard['extra_feats'],
+                net_nodes=use_net_nodes)
+    assert model.rounds <= shard['meta']['rounds'], "partition halo is smaller than the model receptive field"
+    return model
+
+
+def part_dirs(out_dir):
+    with open(os.path.join(out_dir, "partition.json")) as f:
+        info = json.load(f)
+    return [os.path.join(out_dir, "part{}".format(k)) for k in range(info['num_parts'])], info
+
+
+def _train_worker(rank, world_size, dirs, save_dir, num_threads, epoch, batch_size, lr, flush_interval, num_steps):
+    from my_Egatnet import cos
+    from my_checkpoint import CheckpointManager
+    set_threads(num_threads)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    shards = [load_shard(d) for d in dirs[rank::world_size]]
+    model = shard_model(shards[0] if shards else load_shard(dirs[0]))
+    for value in model.state_dict().values():  # 所有 rank 从 rank 0 的初始参数开始
+        dist.broadcast(value, 0)
+    params = [p for p in model.parameters() if p.requires_grad]
+    optimizer = torch.optim.Adam(params, lr=lr, weight_decay=1e-5)
+    ckpt = CheckpointManager(save_dir, flush_interval=flush_interval) if rank == 0 else None
+
+    shard_ids = list(range(len(dirs)))[rank::world_size]
+    train_pairs = [torch.from_numpy(shard['pairs'][shard['pairs'][:, 3] == 1]) for shard in shards]
+
+    # 每步：每个分片取下一个 batch（每个 epoch 每个 batch 只训练一次，batch 用完的分片不再参与），
+    # 各 rank 的梯度与 loss 求和后除以全局对数（= 整个全局 batch 的平均 loss）
+    # 同一步内一个 rank 可能有多次前向，所以不用 DistributedDataParallel，手动 all-reduce 梯度
+    for e in range(epoch):
+        model.train()
+        batches = []
+        for k, pairs in zip(shard_ids, train_pairs):  # 每个 epoch 重新打乱（种子由 epoch 与分片编号决定）
+            pairs = pairs[np.random.RandomState([1, e, k]).permutation(len(pairs))]
+            batches.append([pairs[b:b + batch_size] for b in range(0, len(pairs), batch_size)])
+        for s in range(num_steps):
+            optimizer.zero_grad()
+            total = torch.zeros(2)
+            for shard, shard_batches in zip(shards, batches):
+                if s >= len(shard_batches):
+                    continue
+                batch = shard_batches[s]
+                emb = model.embed(shard['node_feats'], shard['edge_feats'], shard['g'])
+                scores = cos(emb[batch[:, 0]], emb[batch[:, 1]])
+                loss = model.xent(scores, batch[:, 2].float()) * len(batch)
+                loss.backward()
+                total += torch.tensor([loss.item(), len(batch)])
+            dist.all_reduce(total)
+            for p in params:
+                if p.grad is None:
+                    p.grad = torch.zeros_like(p)
+                dist.all_reduce(p.grad)
+                p.grad /= max(total[1].item(), 1.)
+            mean_loss = total[0] / max(total[1].item(), 1.)
+            if ckpt is not None:
+                ckpt.track(model, mean_loss, e * num_steps + s)
+            optimizer.step()
+        if ckpt is not None:
+            ckpt.snapshot(model, optimizer, e + 1)
+            print("The {}-th epoch, ".format(e + 1), "Train Loss:{:.4f} ".format(mean_loss.item()))
+    if ckpt is not None:
+        ckpt.close()
+        _, best_step = ckpt.best_info()
+        print('Loading {}th epoch {}th step'.format(best_step // num_steps + 1, best_step % num_steps + 1))
+    dist.destroy_process_group()
+
+
+def train_partitions(out_dir, save_dir, num_workers=None, threads_per_worker=None, epoch=450, batch_size=256,
+                     lr=0.002, flush_interval=60., master_addr='127.0.0.1', master_port='29501'):
+    """在分片上多进程训练（gloo），最优模型由 rank 0 保存到 save_dir/model/model.pkl
+    参数：
+        num_workers: worker 进程数，默认每个分片一个；少于分片数时每个 worker 轮流处理多个分片
+    """
+    dirs, info = part_dirs(out_dir)
+    num_workers = min(num_workers or len(dirs), len(dirs))
+    if threads_per_worker is None:
+        threads_per_worker = max(1, available_cpus() // num_workers)
+    num_steps = max([math.ceil(part['train_pairs'] / batch_size) for part in info['parts']] + [1])
+    os.environ.setdefault('MASTER_ADDR', master_addr)
+    os.environ.setdefault('MASTER_PORT', str(master_port))
+    mp.spawn(_train_worker, args=(num_workers, dirs, save_dir, threads_per_worker, epoch, batch_size, lr,
+                                  flush_interval, num_steps), nprocs=num_workers, join=True)
+
+
+def _init_infer_worker(num_threads):
+    set_threads(num_threads)
+
+
+@torch.no_grad()
+def _infer_shard(part_dir, model_path):
+    shard = load_shard(part_dir)
+    model = shard_model(shard)
+    model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    model.eval()
+    emb = F.normalize(model.embed(shard['node_feats'], shard['edge_feats'], shard['g']), dim=1, eps=1e-8)
+    pairs = torch.from_numpy(shard['pairs'])
+    scores = (emb[pairs[:, 0]] * emb[pairs[:, 1]]).sum(-1)
+    owned = shard['meta']['owned']
+    return shard['pairs'][:, 4], scores.numpy(), shard['nodes'][:owned], emb[:owned].numpy()
+
+
+def infer_partitions(out_dir, model_path, num_workers=2, threads_per_worker=None, scores_out=None, emb_out=None):
+    """各分片并行计算嵌入与所属对的分数，按 labels.npy 的行号合并
+    参数：
+        scores_out, emb_out: .npy 路径，给出时结果写成 memmap
+    返回：
+        scores: [num_pairs] float32（labels.npy 的行顺序）
+        embeddings: [num_nodes, dim] 单位化嵌入（每个节点取自所属分片）
+    """
+    dirs, info = part_dirs(out_dir)
+    if threads_per_worker is None:
+        threads_per_worker = max(1, available_cpus() // num_workers)
+    num_pairs = len(np.load(os.path.join(out_dir, "labels.npy"), mmap_mode='r'))
+    scores = embeddings = None
+    ctx = mp.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx,
+                                                initializer=_init_infer_worker,
+                                                initargs=(threads_per_worker,)) as pool:
+        futures = [pool.submit(_infer_shard, d, model_path) for d in dirs]
+        for future in futures:
+            rows, part_scores, nodes, part_emb = future.result()
+            if scores is None:
+                shape = (info['num_nodes'], part_emb.shape[1])
+                scores = np.full(num_pairs, np.nan, dtype=np.float32) if scores_out is None else \
+                    np.lib.format.open_memmap(scores_out, mode='w+', dtype=np.float32, shape=(num_pairs,))
+                embeddings = np.zeros(shape, dtype=np.float32) if emb_out is None else \
+                    np.lib.format.open_memmap(emb_out, mode='w+', dtype=np.float32, shape=shape)
+            scores[rows] = part_scores
+            embeddings[nodes] = part_emb
+    return scores, embeddings
+
+
+def evaluate_partitions(out_dir, scores, threshold=0.6):
+    """测试对的阈值 + 规则过滤与每个电路的指标（规则属性与电路区间读自原 read_graph 输出目录）"""
+    from my_rules import load_node_rule_arrays, fused_rule_mask
+    from my_eval import circuit_metrics, print_metrics, load_circuit_ranges
+    _, info = part_dirs(out_dir)
+    labels = np.load(os.path.join(out_dir, "labels.npy"))
+    test = labels[:, 3] != 1
+    p1, p2 = labels[test, 0], labels[test, 1]
+    keep = (np.asarray(scores)[test] >= threshold) & fused_rule_mask(load_node_rule_arrays(info['data_dir']), p1, p2)
+    table = circuit_metrics(p1, np.where(keep, 1, -1), labels[test, 2], load_circuit_ranges(info['data_dir']))
+    print_metrics(table)
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['partition', 'train', 'infer'])
+    parser.add_argument('--data', default=file_path, help='read_graph 的输出目录（partition）')
+    parser.add_argument('--out', default=os.path.join(file_path, "partitions"), help='分片目录')
+    parser.add_argument('--parts', type=int, default=4)
+    parser.add_argument('--method', choices=['bfs', 'metis'], default='bfs')
+    parser.add_argument('--max_halo_degree', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--save', default=file_path, help='训练输出目录（model/model.pkl）')
+    parser.add_argument('--epoch', type=int, default=450)
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--lr', type=float, default=0.002)
+    parser.add_argument('--model', default=os.path.join(file_path, "model", "model.pkl"))
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--scores', default=None, help='推理分数保存为 .npy（memmap）')
+    parser.add_argument('--embeddings', default=None, help='节点嵌入保存为 .npy（memmap）')
+    args = parser.parse_args()
+
+    if args.command == 'partition':
+        partition_graph(args.data, args.out, args.parts, args.method, max_halo_degree=args.max_halo_degree)
+    elif args.command == 'train':
+        train_partitions(args.out, args.save, args.workers, args.threads, args.epoch, args.batch_size, args.lr)
+    else:
+        scores, _ = infer_partitions(args.out, args.model, args.workers or 2, args.threads, args.scores,
+                                     args.embeddings)
+        evaluate_partitions(args.out, scores, args.threshold)
@@ -0,0 +1,183 @@
+import os
+import pickle
+import argparse
+from my_parser import iter_parse
+from my_init import *
+
+# 进程内的端到端流程：parse → featurize → train → evaluate / predict
+# 原流程由三个脚本组成，每一步把结果写盘（dataXY_file.txt、node_feats.npy、graph.pkl、labels.txt ...），
+# 下一步再从 my_init 中的绝对路径读回；这里各阶段直接传递内存中的对象：
+#   parse      -> records：[(dataX[i], dataY[i])]（my_parser.iter_parse）
+#   featurize  -> dataset：my_readgraph.build_graph 的结果
+#   train      -> 模型（最优参数直接从内存中载入）
+#   evaluate   -> 每个测试电路的指标表（my_eval.circuit_metrics）
+#   predict    -> 任意节点对的 1 / -1 预测
+# save_dir 给出时每个阶段同时写出与原脚本相同的文件，可与原脚本混用
+# 各阶段用到的模块在阶段内导入：只做 parse / featurize 时不加载 torch / dgl
+
+
+class Pipeline(object):
+    """端到端流程
+    参数：
+        save_dir: 中间结果保存目录，None 时不写盘
+        trainset: 训练电路序号，默认 [0, 1]
+        compact, wl_feats, net_nodes: 同 load_data
+    """
+
+    def __init__(self, save_dir=None, trainset=None, compact=use_compact_feats, wl_feats=use_wl_feats,
+                 net_nodes=use_net_nodes):
+        self.save_dir = save_dir
+        self.trainset = trainset
+        self.compact = compact
+        self.wl_feats = wl_feats
+        self.net_nodes = net_nodes
+        self.records = None  # parse 的结果
+        self.dataset = None  # featurize 的结果
+        self.inputs = None   # model_inputs 的结果（特征张量、模型、样本对）
+        self.model = None
+        self._rules = None
+        self._hierarchy = None
+        if save_dir is not None:
+            os.makedirs(save_dir, exist_ok=True)
+
+    def parse(self, filedir):
+        """解析 filedir 下所有网表，返回 [(dataX[i], dataY[i])]"""
+        self.records = list(iter_parse(filedir))
+        if self.save_dir is not None:
+            with open(os.path.join(self.save_dir, "dataXY_file.txt"), 'wb') as f:
+                pickle.dump(([data for data, _ in self.records], [label for _, label in self.records]), f)
+        return self.records
+
+    def featurize(self, records=None):
+        """建图、特征与样本对，返回 build_graph 的 dataset 字典"""
+        from my_readgraph import build_graph, save_graph
+        if records is not None:
+            self.records = records
+        self.dataset = build_graph([data for data, _ in self.records], [label for _, label in self.records],
+                                   self.trainset, self.net_nodes)
+        self.inputs = self.model = self._rules = self._hierarchy = None
+        if self.save_dir is not None:
+            save_graph(self.dataset, self.save_dir)
+        return self.dataset
+
+    def model_inputs(self):
+        """特征张量、模型和样本对（与 load_data 的返回值相同），首次调用时构建"""
+        if self.inputs is None:
+            from my_load_data import model_inputs, dgl_graph  # 先于 dgl 导入（my_runtime）
+            from my_features import encode_node_feats, encode_edge_feats, feature_edges
+            from my_wl import wl_twin_feats, graph_node_circuits
+            node_feats, edge_feats = self.dataset['node_feats'], self.dataset['edge_feats']
+            if self.compact:
+                node_feats, edge_feats = encode_node_feats(node_feats), encode_edge_feats(edge_feats)
+            twin = None
+            if self.wl_feats:
+                twin = wl_twin_feats(self.dataset['wl_colors'], graph_node_circuits(self.dataset['graph']))
+            self.inputs = model_inputs(self.dataset['pairs'], node_feats, edge_feats,
+                                       dgl_graph(feature_edges(list(self.dataset['graph'].edges())),
+                                                 len(self.dataset['graph'])), self.compact, twin,
+                                       self.net_nodes)
+        return self.inputs
+
+    def train(self, validation=True, threshold=0.6, wl=use_wl_prefilter, **kwargs):
+        """训练并载入最优参数
+        参数：
+            validation: True 时划出 10% 训练对做验证 / 提前停止（同 my_egat_model_test）
+            threshold, wl: 验证时的阈值与 WL 预筛选（同 predict），规则过滤总是使用
+            kwargs: 传给 my_Egatnet.train（epoch, batch_size, lr, ...）
+        """
+        from my_load_data import split_validation
+        from my_Egatnet import train as train_model
+        from my_rules import node_rule_arrays
+        node_feat_data, edge_feat_data, model, pair1, pair2, train_label = self.model_inputs()[:6]
+        if validation:
+            pair1, pair2, train_label, val_pair1, val_pair2, val_label = split_validation(pair1, pair2, train_label)
+            if self._rules is None:
+                self._rules = node_rule_arrays(self.dataset['graph'])
+            kwargs.update(val_pair1=val_pair1, val_pair2=val_pair2, val_label=val_label, val_threshold=threshold,
+                          val_rules=self._rules, val_wl=self.dataset['wl_colors'] if wl else None)
+        best_state = train_model(self.save_dir, node_feat_data, edge_feat_data, model, pair1, pair2, train_label,
+                                 len(pair1), None, None, None, **kwargs)
+        model.load_state_dict(best_state)
+        self.model = model
+        return model
+
+    def load_model(self, model_path, quantized=quantized_inference):
+        """载入已训练的参数（代替 train）
+        参数：
+            quantized: True 时推理使用动态 int8 量化的副本（仅 cpu，见 my_quantize.py；设备不是 cpu 时报错）
+        """
+        import torch
+        from my_load_data import device
+        if quantized:
+            from my_quantize import check_quantized_device
+            check_quantized_device(device)
+        model = self.model_inputs()[2]
+        model.load_state_dict(torch.load(model_path, map_location=device))
+        if quantized:
+            from my_quantize import quantize_model
+            model = quantize_model(model)
+        self.model = model
+        return model
+
+    def predict(self, pair1=None, pair2=None, threshold=0.6, hierarchy=hierarchical_inference,
+                wl=use_wl_prefilter, scores_out=None):
+        """模型打分 + 规则过滤，返回 1 / -1 预测
+        参数：
+            pair1, pair2: 节点编号，默认为全部测试对
+            hierarchy, wl: 同 my_egat_model_test.predict_pairs（使用内存中的层次信息 / WL 颜色）
+            scores_out: 同 predict_pairs（.npy 路径或预分配数组，保存模型分数）
+        """
+        from my_egat_model_test import predict_pairs
+        from my_hierarchy import HierarchyIndex
+        from my_rules import node_rule_arrays
+        node_feat_data, edge_feat_data = self.model_inputs()[:2]
+        if pair1 is None:
+            pair1, pair2 = self.model_inputs()[7:9]
+        if self._rules is None:
+            self._rules = node_rule_arrays(self.dataset['graph'])
+        index = None
+        if hierarchy:
+            if self._hierarchy is None:
+                self._hierarchy = HierarchyIndex.from_records(self.records)
+            index = self._hierarchy
+        colors = self.dataset['wl_colors'] if wl else None
+        return predict_pairs(self.model, node_feat_data, edge_feat_data, pair1, pair2, self._rules, threshold,
+                             index, colors, scores_out=scores_out)
+
+    def evaluate(self, threshold=0.6, **kwargs):
+        """在测试对上评估，打印并返回每个测试电路的指标表"""
+        from my_eval import circuit_metrics, print_metrics
+        test_label, test_pair1, test_pair2 = self.model_inputs()[6:9]
+        pred = self.predict(test_pair1, test_pair2, threshold, **kwargs)
+        table = circuit_metrics(test_pair1, pred, test_label, self.dataset['test_ranges'])
+        print_metrics(table)
+        return table
+
+    def run(self, filedir, threshold=0.6, **train_kwargs):
+        """parse → featurize → train → evaluate"""
+        self.parse(filedir)
+        self.featurize()
+        self.train(threshold=threshold, **train_kwargs)
+        return self.evaluate(threshold)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default=path_read_SPICE, help='网表（.sp）与对称文件（.txt）目录')
+    parser.add_argument('--save', default=None, help='中间结果保存目录，默认不写盘')
+    parser.add_argument('--trainset', type=int, nargs='+', default=[0, 1])
+    parser.add_argument('--model', default=None, help='已训练的 model.pkl，给出时跳过训练')
+    parser.add_argument('--epoch', type=int, default=450)
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--lr', type=float, default=0.002)
+    parser.add_argument('--threshold', type=float, default=0.6)
+    args = parser.parse_args()
+
+    pipeline = Pipeline(args.save, args.trainset)
+    pipeline.parse(args.data)
+    pipeline.featurize()
+    if args.model is not None:
+        pipeline.load_model(args.model)
+    else:
+        pipeline.train(threshold=args.threshold, epoch=args.epoch, batch_size=args.batch_size, lr=args.lr)
+    pipeline.evaluate(args.threshold)
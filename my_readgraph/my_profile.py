@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import functools
+import tracemalloc
+
+# 可选的阶段计时与内存统计（默认关闭，关闭时开销只有一次标志判断）
+# 环境变量：
+#   EGAT_PROFILE=1            开启计时、调用次数、RSS 峰值统计，程序退出时打印汇总
+#   EGAT_PROFILE_MEM=1        同时用 tracemalloc 统计每个阶段的 python 内存峰值（较慢）
+#   EGAT_PROFILE_OUT=x.json   退出时把汇总写入 json
+#   EGAT_TORCH_TRACE=x.json   训练时用 torch.profiler 记录若干 step 并导出 chrome trace
+# 也可以在代码中调用 enable() 开启
+# 注意：GPU 上的计时是异步的，EGT 前向/反向的时间只包含 kernel 启动
+
+ENABLED = os.environ.get('EGAT_PROFILE', '0') not in ['', '0']
+TRACE_MEMORY = os.environ.get('EGAT_PROFILE_MEM', '0') not in ['', '0']
+
+_stats = {}   # name -> {'calls', 'seconds', 'py_peak_mb', 'rss_peak_mb'}
+_stack = []   # 嵌套阶段的 tracemalloc 峰值
+_report_registered = False
+
+
+def enable(memory=False):
+    """在代码中开启统计（等价于设置 EGAT_PROFILE=1）"""
+    global ENABLED, TRACE_MEMORY
+    ENABLED = True
+    TRACE_MEMORY = TRACE_MEMORY or memory
+    _register_report()
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    _stats.clear()
+
+
+class stage(object):
+    """with stage('name'): ... 统计一个代码块"""
+    __slots__ = ['name', 'start', 'active']
+
+    def __init__(self, name):
+        self.name = name
+        self.active = False
+
+    def __enter__(self):
+        if not ENABLED:
+            return self
+        self.active = True
+        if TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if _stack:
+                _stack[-1][1] = max(_stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            _stack.append([current, current])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return False
+        self.active = False
+        seconds = time.perf_counter() - self.start
+        record = _stats.setdefault(self.name, {'calls': 0, 'seconds': 0., 'py_peak_mb': 0., 'rss_peak_mb': 0.})
+        record['calls'] += 1
+        record['seconds'] += seconds
+        record['rss_peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+        if TRACE_MEMORY and _stack:
+            start_current, running_peak = _stack.pop()
+            peak = max(running_peak, tracemalloc.get_traced_memory()[1])
+            record['py_peak_mb'] = max(record['py_peak_mb'], (peak - start_current) / 2 ** 20)
+            if _stack:
+                _stack[-1][1] = max(_stack[-1][1], peak)
+        return False
+
+
+def profiled(name):
+    """装饰器：统计函数的耗时、调用次数和内存峰值"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _NullProfiler(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def step(self):
+        pass
+
+
+def torch_profiler(wait=1, warmup=1, active=3):
+    """EGAT_TORCH_TRACE 设置时返回 torch.profiler（每个 batch 调用 prof.step()），否则返回空实现
+    只记录一次：跳过 wait 个 step、预热 warmup 个 step 后记录 active 个 step，导出一次 chrome trace
+    """
+    trace_path = os.environ.get('EGAT_TORCH_TRACE')
+    if not trace_path:
+        return _NullProfiler()
+    import torch
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    return torch.profiler.profile(activities=activities,
+                                  schedule=torch.profiler.schedule(wait=wait, warmup=warmup, active=active,
+                                                                   repeat=1),
+                                  on_trace_ready=lambda prof: prof.export_chrome_trace(trace_path),
+                                  record_shapes=True, profile_memory=True)
+
+
+def summary():
+    return {name: dict(record) for name, record in _stats.items()}
+
+
+def report(file=sys.stderr):
+    if not _stats:
+        return
+    print("{:<20s} {:>8s} {:>11s} {:>11s} {:>11s}".format('stage', 'calls', 'seconds', 'py_peak_MB', 'rss_MB'),
+          file=file)
+    for name, r in sorted(_stats.items(), key=lambda x: -x[1]['seconds']):
+        print("{:<20s} {:>8d} {:>11.3f} {:>11.1f} {:>11.1f}".format(name, r['calls'], r['seconds'], r['py_peak_mb'],
+                                                                    r['rss_peak_mb']), file=file)
+    out = os.environ.get('EGAT_PROFILE_OUT')
+    if out:
+        with open(out, 'w') as f:
+            json.dump(summary(), f, indent=1)
+
+
+def _register_report():
+    global _report_registered
+    if not _report_registered:
+        atexit.register(report)
+        _report_registered = True
+
+
+if ENABLED:
+    _register_report()
@@ -0,0 +1,103 @@
+import time
+import argparse
+import numpy as np
+import my_runtime  # 须在 torch 之前导入（OpenMP 环境变量）
+import torch
+import torch.nn as nn
+from my_eval import circuit_metrics, summarize_metrics, load_circuit_ranges
+from my_init import *
+
+# 动态 int8 量化推理（cpu）
+# EGT / Mlp 中的 Linear（q, k, v, vv, edge_e, edge_b, fc_edge0/1, fc0/fc1，以及 WL 特征投影 extra）
+# 换成 torch.ao.nn.quantized.dynamic.Linear：权重离线量化为 int8，激活逐次动态量化，矩阵乘走 int8 内核；
+# LayerNorm、嵌入表、注意力 softmax / 聚合和余弦打分仍为 float。
+# 只用于推理（量化后的模型不能继续训练）；是否采用由 accuracy_report 在测试电路上对比 float 与 int8 的
+# TPR / FPR / F1 和嵌入计算耗时后决定，开启方式见 my_init.quantized_inference
+
+
+def check_quantized_device(device):
+    """quantized_inference 只支持 cpu：device 不是 cpu 时报错（在训练 / 载入模型之前调用）"""
+    if torch.device(device).type != 'cpu':
+        raise ValueError("quantized_inference runs on cpu only, but the runtime device is {}; set runtime_device = "
+                         "'cpu' in my_init.py (or EGAT_DEVICE=cpu) or quantized_inference = False".format(device))
+
+
+def quantize_model(model, inplace=False):
+    """动态 int8 量化的推理模型
+    参数：
+        model: cpu 上的 GAT 或 my_export.InferenceGAT
+        inplace: False 时返回量化后的副本，原模型不变
+    """
+    assert all(p.device.type == 'cpu' for p in model.parameters()), "dynamic int8 quantization runs on cpu only"
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=inplace)
+
+
+def _timed_predict(model, feat_data, edge_feat_data, test_pair1, test_pair2, rules, threshold, hierarchy, wl,
+                   repeats):
+    from my_egat_model_test import predict_pairs
+    model.eval()
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.cache_embeddings(feat_data, edge_feat_data)
+        seconds.append(time.perf_counter() - start)
+    pred = predict_pairs(model, feat_data, edge_feat_data, test_pair1, test_pair2, rules, threshold, hierarchy, wl)
+    return pred, float(np.median(seconds))
+
+
+def accuracy_report(model, feat_data, edge_feat_data, test_pair1, test_pair2, test_label, rules, circuit_ranges,
+                    threshold=0.6, hierarchy=None, wl=None, repeats=3):
+    """float 与 int8 模型在测试电路上的指标和嵌入耗时对比
+    参数：
+        model: 已载入参数的 float GAT（cpu）
+        rules, hierarchy, wl: 同 my_egat_model_test.predict_pairs
+        repeats: 嵌入计算计时的重复次数（取中位数）
+    返回：
+        report: {'float', 'int8': 每个电路的指标表, 'float_seconds', 'int8_seconds': 嵌入耗时,
+                 'agreement': 两者预测相同的测试对比例}
+    """
+    qmodel = quantize_model(model)
+    pred, float_seconds = _timed_predict(model, feat_data, edge_feat_data, test_pair1, test_pair2, rules, threshold,
+                                         hierarchy, wl, repeats)
+    qpred, int8_seconds = _timed_predict(qmodel, feat_data, edge_feat_data, test_pair1, test_pair2, rules,
+                                         threshold, hierarchy, wl, repeats)
+    return {'float': circuit_metrics(test_pair1, pred, test_label, circuit_ranges),
+            'int8': circuit_metrics(test_pair1, qpred, test_label, circuit_ranges),
+            'float_seconds': float_seconds, 'int8_seconds': int8_seconds,
+            'agreement': float(np.mean(np.asarray(pred) == np.asarray(qpred))) if len(pred) else 1.}
+
+
+def print_report(report):
+    print("{:<40s} {:>15s} {:>15s} {:>15s}".format('circuit', 'TPR f32/int8', 'FPR f32/int8', 'F1 f32/int8'))
+    for row, qrow in zip(report['float'], report['int8']):
+        print("{:<40s} {:>7.4f}/{:<7.4f} {:>7.4f}/{:<7.4f} {:>7.4f}/{:<7.4f}".format(
+            row['name'], row['tpr'], qrow['tpr'], row['fpr'], qrow['fpr'], row['f1'], qrow['f1']))
+    s, q = summarize_metrics(report['float']), summarize_metrics(report['int8'])
+    print("{:<40s} {:>7.4f}/{:<7.4f} {:>7.4f}/{:<7.4f} {:>7.4f}/{:<7.4f}".format(
+        'mean', s['tpr'], q['tpr'], s['fpr'], q['fpr'], s['f1'], q['f1']))
+    print("embedding: float {:.4f}s, int8 {:.4f}s ({:.2f}x); identical predictions: {:.2%}".format(
+        report['float_seconds'], report['int8_seconds'], report['float_seconds'] / max(report['int8_seconds'], 1e-9),
+        report['agreement']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default=file_path, help='read_graph 的输出目录')
+    parser.add_argument('--model', default=os.path.join(file_path, "model", "model.pkl"))
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.setdefault('EGAT_DEVICE', 'cpu')
+    from my_load_data import load_data
+    from my_rules import load_node_rule_arrays
+    from my_hierarchy import HierarchyIndex
+    from my_wl import load_wl_colors
+    node_feat_data, edge_feat_data, model, _, _, _, test_label, test_pair1, test_pair2 = load_data(args.data)[:9]
+    model.load_state_dict(torch.load(args.model, map_location='cpu'))
+    hierarchy = HierarchyIndex.from_dataXY(dataXY_file_path) if hierarchical_inference else None
+    wl = load_wl_colors(args.data) if use_wl_prefilter else None
+    print_report(accuracy_report(model, node_feat_data, edge_feat_data, test_pair1, test_pair2, test_label,
+                                 load_node_rule_arrays(args.data), load_circuit_ranges(args.data), args.threshold,
+                                 hierarchy, wl, args.repeats))
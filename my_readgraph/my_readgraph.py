@@ -2,12 +2,12 @@ import numpy as np
 import pickle
 import networkx as nx
 from itertools import combinations
-import matplotlib
 import operator
 import json
 from my_init import *
-import matplotlib.pyplot as plt
-matplotlib.use('Agg')
+from my_profile import profiled
+from my_features import encode_edge_feats
+from my_wl import wl_colors, WL_FILTER_ROUND
 # 主要功能：
 # 1. 将SPICE网表转换为图结构数据
 # 2. 提取电路元件的几何特征和电气特征
@@ -25,6 +25,7 @@ matplotlib.use('Agg')
 # │ SpiceGraph            │ 完整的电路图结构容器                          │
 # ├───────────────────────┼──────────────────────────────────────────────┤
 # │ read_graph()          │ 主处理函数，执行数据转换流程                   │
+# │ build_graph()         │ 内存中的数据转换（read_graph 不读写文件的部分）│
 # │ type_filter()         │ 器件类型分类器                                │
 # │ pin_filter()          │ 引脚连接关系编码器                            │
 # │ noramlization()       │ 器件尺寸参数归一化处理器                      │
@@ -264,13 +265,24 @@ def pin_filter2(p):
         return 0
 
 
+@profiled('shortest_paths')
 def get_nodes_weights(g, snode, left, right):
+    # 每个源点只做一次单源 Dijkstra（结果与逐节点 shortest_path_length 相同）
+    lengths = {}
+
+    def path_length(source, node):
+        if source not in lengths:
+            lengths[source] = nx.single_source_dijkstra_path_length(g, source, weight='weight')
+        if node not in lengths[source]:
+            raise nx.NetworkXNoPath("Node {} not reachable from {}".format(node, source))
+        return lengths[source][node]
+
     nodes_weights = []
     for node in range(left, right):
         if (g.nodes[node]['device'] in p_types) or (g.nodes[node]['device'] in vdd_types):
-            path_len = nx.shortest_path_length(g, source=snode[1], target=node, weight='weight')
+            path_len = path_length(snode[1], node)
         elif (g.nodes[node]['device'] in n_types) or (g.nodes[node]['device'] in gnd_types):
-            path_len = nx.shortest_path_length(g, source=snode[0], target=node, weight='weight')
+            path_len = path_length(snode[0], node)
         else:
             path_len = 0
         nodes_weights.append(path_len)
@@ -296,11 +308,256 @@ def noramlization(data):
     return new_data
 
 
-def read_graph(file_name, save_dir):
+@profiled('pair_generation')
+def make_pairs(graph, label, num_nodes, train, neg_size=10):
+    """生成单个电路的正负样本对
+    参数：
+        graph: 电路的 SpiceGraph
+        label: 对称节点对（电路内编号）
+        num_nodes: 该电路在合并图中的节点编号偏移
+        train: 是否为训练电路（训练电路的负样本数限制为 neg_size * len(label)）
+    返回：
+        pos_pairs, neg_pairs: [node1, node2, label(1/-1), train(1/0)] 列表，节点为合并图编号
+    """
+    flag = 1 if train else 0
+    label_set = set(tuple(l) for l in label)
+    node_ids = [g.id + num_nodes for g in graph.nodes]
+    neg_pairs = []
+    for pair in combinations(node_ids, 2):
+        if (pair[0] - num_nodes, pair[1] - num_nodes) in label_set or \
+                (pair[1] - num_nodes, pair[0] - num_nodes) in label_set:
+            continue
+        if graph.nodes[pair[0] - num_nodes].attributes['cell'] == 'IO' or \
+                graph.nodes[pair[0] - num_nodes].attributes['cell'] == 'IO':
+            continue
+        type1, type2 = graph.nodes[pair[0] - num_nodes].attributes['cell'], \
+                       graph.nodes[pair[1] - num_nodes].attributes['cell']
+        poten1, poten2 = graph.nodes[pair[0] - num_nodes].attributes['potential'], \
+                         graph.nodes[pair[1] - num_nodes].attributes['potential']
+        if (not type_rule2(type1, type2)) or poten1 != poten2:
+            continue
+        if train and len(neg_pairs) > neg_size * len(label):
+            break
+        # first two cols are node ids, the third col is the label, the last col is train or test
+        neg_pairs.append([pair[0], pair[1], -1, flag])
+    pos_pairs = []
+    for l in label:
+        if len(l) == 1:
+            continue
+        type1, type2 = graph.nodes[l[0]].attributes['cell'], graph.nodes[l[1]].attributes['cell']
+        poten1, poten2 = graph.nodes[l[0]].attributes['potential'], graph.nodes[l[1]].attributes['potential']
+        if (not type_rule2(type1, type2)) or poten1 != poten2:
+            continue
+        w1, l1 = float(graph.nodes[l[0]].attributes['w']) / int(graph.nodes[l[0]].attributes['nf']), float(
+            graph.nodes[l[0]].attributes['l'])
+        w2, l2 = float(graph.nodes[l[1]].attributes['w']) / int(graph.nodes[l[1]].attributes['nf']), float(
+            graph.nodes[l[1]].attributes['l'])
+        if w1 != w2 or l1 != l2:
+            continue
+        pos_pairs.append([l[0] + num_nodes, l[1] + num_nodes, 1, flag])
+    return pos_pairs, neg_pairs
+
+
+@profiled('edge_building')
+def add_circuit_edges(G, graph, edge_dic, offset):
+    """把一个电路中共享 net 的器件两两连边（substrate/hbeta 端口不参与）
+    参数：
+        G: 合并图，节点编号为 电路内编号 + offset
+        graph: 电路的 SpiceGraph
+        edge_dic: {(src, dst): [pin_filter2(src 端口类型), ...]}，原地更新
+        offset: 该电路的节点编号偏移
+    """
+    for nets in graph.nets:
+        for i in range(len(nets.pins)):
+            if graph.pins[nets.pins[i]].attributes['type'] in ['substrate', 'hbeta']:  # 第四个端口不参与相连
+                continue
+            for j in range(i + 1, len(nets.pins)):
+                if graph.pins[nets.pins[j]].attributes['type'] in ['substrate', 'hbeta']:
+                    continue
+                if i != j:
+                    device_id1, device_id2 = graph.pins[nets.pins[i]].node_id, graph.pins[nets.pins[j]].node_id
+                    if device_id1 != device_id2:
+                        pin_type1 = graph.pins[nets.pins[i]].attributes['type']
+                        pin_type2 = graph.pins[nets.pins[j]].attributes['type']
+                        # if (pin_filter2(pin_type1)) not in pin_con_type:
+                        #     pin_con_type.append(pin_filter2(pin_type1))
+                        # if (pin_filter2(pin_type2)) not in pin_con_type:
+                        #     pin_con_type.append(pin_filter2(pin_type2))
+                        device_tu1 = (device_id1 + offset, device_id2 + offset)
+                        if edge_dic.__contains__(device_tu1):
+                            edge_dic[device_tu1].append(pin_filter2(pin_type1))
+                        else:
+                            new_list = [pin_filter2(pin_type1)]
+                            edge_dic[device_tu1] = new_list
+                        device_tu2 = (device_id2 + offset, device_id1 + offset)
+                        if edge_dic.__contains__(device_tu2):
+                            edge_dic[device_tu2].append(pin_filter2(pin_type2))
+                        else:
+                            new_list = [pin_filter2(pin_type2)]
+                            edge_dic[device_tu2] = new_list
+                        if graph.nodes[device_id1].attributes['cell'] in passive_types and \
+                                graph.nodes[device_id2].attributes['cell'] in passive_types:
+                            G.add_edge(device_id1 + offset, device_id2 + offset, weight=0)
+                            G.add_edge(device_id2 + offset, device_id1 + offset, weight=0)
+                        elif graph.nodes[device_id1].attributes['cell'] in passive_types or \
+                                graph.nodes[device_id2].attributes['cell'] in passive_types:
+                            G.add_edge(device_id1 + offset, device_id2 + offset, weight=0.5)
+                            G.add_edge(device_id2 + offset, device_id1 + offset, weight=0.5)
+                        else:
+                            G.add_edge(device_id1 + offset, device_id2 + offset, weight=1)
+                            G.add_edge(device_id2 + offset, device_id1 + offset, weight=1)
+
+
+@profiled('edge_building')
+def add_circuit_net_edges(edge_dic, graph, offset, net_offset):
+    """net 节点模式：每个器件引脚连到所在 net 的节点（双向，substrate/hbeta 端口不参与），边数与引脚数成线性
+    参数：
+        edge_dic: {(src, dst): [pin_filter2(引脚类型), ...]}，两个方向都记录该引脚的类型，原地更新
+        offset: 该电路器件的编号偏移
+        net_offset: 该电路 net 节点的编号偏移（net 节点编号排在所有器件之后）
+    """
+    for pin in graph.pins:
+        if pin.attributes['type'] in ['substrate', 'hbeta']:
+            continue
+        role = pin_filter2(pin.attributes['type'])
+        device, net = pin.node_id + offset, pin.net_id + net_offset
+        edge_dic.setdefault((device, net), []).append(role)
+        edge_dic.setdefault((net, device), []).append(role)
+
+
+def add_net_nodes(G, circuits, edge_dic):
+    """把 net 节点和器件-net 边加入 G
+    器件-net 边的权重：无源器件 0，其他 0.5，使 器件-net-器件 路径的长度与 add_circuit_edges 的器件边相同（0 / 0.5 / 1），
+    符号电势（add_circuit_weights）不变
+    参数：
+        circuits: [(电路序号, SpiceGraph, net 节点编号偏移)]
+    """
+    for i, graph, net_offset in circuits:
+        for net in graph.nets:
+            G.add_node(net.id + net_offset, name=net.attributes.get('name'), graph=i, type='net', w=-1, l=-1,
+                       device='-1', nets=[])
+    for src, dst in sorted(edge_dic):  # 与 edge_feats 的行顺序相同
+        device = src if G.nodes[src]['type'] != 'net' else dst
+        weight = 0 if G.nodes[device]['device'] in passive_types else 0.5
+        G.add_edge(src, dst, weight=weight)
+
+
+def add_circuit_nodes(G, graph, i, num_nodes):
+    """把一个电路的节点加入 G，并记录尺寸、连接的 nets 及门连接标志
+    参数：
+        G: 合并图
+        graph: 电路的 SpiceGraph
+        i: 电路序号
+        num_nodes: 该电路的节点编号偏移
+    返回：
+        node_type, node_size_feats_w, node_size_feats_l: 该电路各节点的类型与（未归一化的）尺寸
+    """
+    node_type = []
+    node_size_feats_w = []
+    node_size_feats_l = []
+    for g in graph.nodes:  # 每个sp文件的所有节点
+        # if not (g.attributes['cell'] == 'IO' and g.attributes['name'] not in power_types):
+        node_type.append(type_filter(g.attributes['cell']))
+        G.add_node(g.id + num_nodes)
+        G.nodes[g.id + num_nodes]['name'] = g.attributes['name']
+        G.nodes[g.id + num_nodes]['graph'] = i
+        if g.attributes['cell'] == 'IO':  # power nodes or GND nodes
+            G.nodes[g.id + num_nodes]['type'] = 'IO'
+        else:
+            G.nodes[g.id + num_nodes]['type'] = 'device'  # device
+        if g.attributes['cell'] in mosfet_types or g.attributes['cell'] in passive_types:  # nmos pmos
+            G.nodes[g.id + num_nodes]['w'] = (float(g.attributes['w']) / int(g.attributes['nf'])) * 1e7
+            G.nodes[g.id + num_nodes]['l'] = float(g.attributes['l']) * 1e7
+            G.nodes[g.id + num_nodes]['device'] = g.attributes['cell']
+        else:
+            G.nodes[g.id + num_nodes]['w'] = -1
+            G.nodes[g.id + num_nodes]['l'] = -1
+            G.nodes[g.id + num_nodes]['device'] = '-1'
+        # node_size_feats.append(np.array([G.nodes[g.id + num_nodes]['w'], G.nodes[g.id + num_nodes]['l']]))
+        node_size_feats_w.append(G.nodes[g.id + num_nodes]['w'])
+        node_size_feats_l.append(G.nodes[g.id + num_nodes]['l'])
+    for p in graph.pins:
+        if p.attributes['type'] not in ['substrate', 'hbeta']:
+            if G.nodes[p.node_id + num_nodes].__contains__('nets'):
+                G.nodes[p.node_id + num_nodes]['nets'].append(p.net_id)
+            else:
+                net_list = [p.net_id]
+                G.nodes[p.node_id + num_nodes]['nets'] = net_list
+        if len(G.nodes[p.node_id + num_nodes]['nets']) == 3 and not all(
+                x == G.nodes[p.node_id + num_nodes]['nets'][0] for x in G.nodes[p.node_id + num_nodes]['nets']):
+            # if graph.pins[G.nodes[p.node_id + num_nodes]['nets'][1]].attributes['type'] == 'IO':
+            # G.nodes[p.node_id + num_nodes]['nets'].append(-1)
+            # else:
+            one_node_type = graph.nodes[p.node_id].attributes['cell']
+            gate_flag = False
+            for pin_order in graph.nets[G.nodes[p.node_id + num_nodes]['nets'][1]].pins:
+                if graph.pins[pin_order].node_id != p.node_id:
+                    else_gate_type = graph.pins[pin_order].attributes['type']
+                    else_node_type = graph.nodes[graph.pins[pin_order].node_id].attributes['cell']
+                    if one_node_type == else_node_type and else_gate_type == 'gate':
+                        G.nodes[p.node_id + num_nodes]['nets'].append(1)
+                        gate_flag = True
+                        break
+            if not gate_flag:
+                if graph.pins[G.nodes[p.node_id + num_nodes]['nets'][1]].attributes['type'] == 'IO':
+                    G.nodes[p.node_id + num_nodes]['nets'].append(-1)
+                else:
+                    G.nodes[p.node_id + num_nodes]['nets'].append(0)
+        elif len(G.nodes[p.node_id + num_nodes]['nets']) == 3 and all(
+                x == G.nodes[p.node_id + num_nodes]['nets'][0] for x in G.nodes[p.node_id + num_nodes]['nets']):
+            G.nodes[p.node_id + num_nodes]['nets'].append(0)
+    return node_type, node_size_feats_w, node_size_feats_l
+
+
+def add_circuit_weights(G, graph, offset):
+    """以电路中第一个地/电源 IO 节点为起点计算各节点的符号电势，写入 G.nodes[...]['weights']"""
+    snode = []
+    for g in graph.nodes:
+        if ground_name_filter(g.attributes['name']) == 1:
+            snode.append(g.id + offset)
+            break
+    for g in graph.nodes:
+        if power_name_filter(g.attributes['name']) == 1:
+            snode.append(g.id + offset)
+            break
+
+    node_weight = get_nodes_weights(G, snode, offset, offset + len(graph.nodes))
+    for num, g in enumerate(graph.nodes):
+        G.nodes[g.id + offset]['weights'] = node_weight[num]
+    return node_weight
+
+
+def node_gat_feat(attr):
+    """MOS 管门连接标志的 one-hot（非 MOS 为 [1, 0, 0, 0]）"""
+    if attr['device'] in mosfet_types and attr['nets'][-1] == 1:
+        return [0, 0, 0, 1]
+    elif attr['device'] in mosfet_types and attr['nets'][-1] == 0:
+        return [0, 0, 1, 0]
+    elif attr['device'] in mosfet_types and attr['nets'][-1] == -1:
+        return [0, 1, 0, 0]
+    else:
+        return [1, 0, 0, 0]
+
+
+@profiled('read_graph')
+def read_graph(file_name, save_dir, trainset=None):
     # 加载预处理数据（包含电路结构数据和对称标签）
     with open(file_name, "rb") as f:
         dataX, dataY = pickle.load(f)  # dataX: 电路图对象列表，dataY: 对称约束标签
-
+    save_graph(build_graph(dataX, dataY, trainset), save_dir)
+
+
+def build_graph(dataX, dataY, trainset=None, net_nodes=use_net_nodes):
+    """在内存中完成 read_graph 的全部计算
+    参数：
+        dataX, dataY: my_parser 的解析结果（dataXY_file.txt 的内容）
+        trainset: 训练电路的序号，默认 [0, 1]
+        net_nodes: True 时用器件-net 二部图代替共享 net 的器件两两连边：
+                   net 节点编号排在所有器件之后（特征为全 0 行），边特征为该引脚的类型
+    返回：
+        dataset 字典：node_feats, edge_feats, graph（合并后的 nx.DiGraph）, pairs（labels.txt 的各行）,
+                      test_ranges（test_pair_name.json 的内容）, wl_colors
+    """
     G = nx.DiGraph()  # 使用NetworkX库创建有向图（Directed Graph）数据结构
     num_nodes = 0  # used to merge subgraphs by changing node indices
     all_pairs = []  # store all pos and neg node pairs
@@ -310,193 +567,49 @@ def read_graph(file_name, save_dir):
     node_size_feats_w = []
     node_size_feats_l = []
     edge_dic = {}  # this dictionary is to store mutil_edge information
-    trainset = [0,1]  # train
+    if trainset is None:
+        trainset = [0,1]  # train
     my_test_name = {}
     valid_pair_num = 0
     neg_pair_num = 0
+    net_offset = sum(len(data["graph"].nodes) for data in dataX)  # net 节点模式：下一个 net 节点的编号
+    circuits = []
     for i in range(len(dataX)):
         single_valid_pair = 0
         train = i in trainset
-        sub_G = nx.Graph()
         graph = dataX[i]["graph"]  # hypergraph
         label = dataY[i]  # symmetry pairs of node indices, self-symmetry if a pair only has one element
         small = len(G.nodes)
-        for g in graph.nodes:  # 每个sp文件的所有节点
-            # if not (g.attributes['cell'] == 'IO' and g.attributes['name'] not in power_types):
-            node_type.append(type_filter(g.attributes['cell']))
-            G.add_node(g.id + num_nodes)
-            sub_G.add_node(g.id + num_nodes)
-            G.nodes[g.id + num_nodes]['name'] = g.attributes['name']
-            G.nodes[g.id + num_nodes]['graph'] = i
-            if g.attributes['cell'] == 'IO':  # power nodes or GND nodes
-                G.nodes[g.id + num_nodes]['type'] = 'IO'
-                sub_G.nodes[g.id + num_nodes]['type'] = 'IO'
-            else:
-                G.nodes[g.id + num_nodes]['type'] = 'device'  # device
-                sub_G.nodes[g.id + num_nodes]['type'] = 'device'
-            if g.attributes['cell'] in mosfet_types or g.attributes['cell'] in passive_types:  # nmos pmos
-                G.nodes[g.id + num_nodes]['w'] = (float(g.attributes['w']) / int(g.attributes['nf'])) * 1e7
-                G.nodes[g.id + num_nodes]['l'] = float(g.attributes['l']) * 1e7
-                G.nodes[g.id + num_nodes]['device'] = g.attributes['cell']
-            else:
-                G.nodes[g.id + num_nodes]['w'] = -1
-                G.nodes[g.id + num_nodes]['l'] = -1
-                G.nodes[g.id + num_nodes]['device'] = '-1'
-            # node_size_feats.append(np.array([G.nodes[g.id + num_nodes]['w'], G.nodes[g.id + num_nodes]['l']]))
-            node_size_feats_w.append(G.nodes[g.id + num_nodes]['w'])
-            node_size_feats_l.append(G.nodes[g.id + num_nodes]['l'])
-        for p in graph.pins:
-            if p.attributes['type'] not in ['substrate', 'hbeta']:
-                if G.nodes[p.node_id + num_nodes].__contains__('nets'):
-                    G.nodes[p.node_id + num_nodes]['nets'].append(p.net_id)
-                else:
-                    net_list = [p.net_id]
-                    G.nodes[p.node_id + num_nodes]['nets'] = net_list
-            if len(G.nodes[p.node_id + num_nodes]['nets']) == 3 and not all(
-                    x == G.nodes[p.node_id + num_nodes]['nets'][0] for x in G.nodes[p.node_id + num_nodes]['nets']):
-                # if graph.pins[G.nodes[p.node_id + num_nodes]['nets'][1]].attributes['type'] == 'IO':
-                # G.nodes[p.node_id + num_nodes]['nets'].append(-1)
-                # else:
-                one_node_type = graph.nodes[p.node_id].attributes['cell']
-                gate_flag = False
-                for pin_order in graph.nets[G.nodes[p.node_id + num_nodes]['nets'][1]].pins:
-                    if graph.pins[pin_order].node_id != p.node_id:
-                        else_gate_type = graph.pins[pin_order].attributes['type']
-                        else_node_type = graph.nodes[graph.pins[pin_order].node_id].attributes['cell']
-                        if one_node_type == else_node_type and else_gate_type == 'gate':
-                            G.nodes[p.node_id + num_nodes]['nets'].append(1)
-                            gate_flag = True
-                            break
-                if not gate_flag:
-                    if graph.pins[G.nodes[p.node_id + num_nodes]['nets'][1]].attributes['type'] == 'IO':
-                        G.nodes[p.node_id + num_nodes]['nets'].append(-1)
-                    else:
-                        G.nodes[p.node_id + num_nodes]['nets'].append(0)
-            elif len(G.nodes[p.node_id + num_nodes]['nets']) == 3 and all(
-                    x == G.nodes[p.node_id + num_nodes]['nets'][0] for x in G.nodes[p.node_id + num_nodes]['nets']):
-                G.nodes[p.node_id + num_nodes]['nets'].append(0)
+        types, ws, ls = add_circuit_nodes(G, graph, i, num_nodes)
+        node_type.extend(types)
+        node_size_feats_w.extend(ws)
+        node_size_feats_l.extend(ls)
         big = len(G.nodes)
         if not train:
             my_test_name[dataX[i]['subckts'][0].name] = [small, big - 1]
-        node_pairs = list(combinations(list(sub_G.nodes()), 2))  # 
-        neg_pairs = []
-        neg_size = 10
-        for pair in node_pairs:
-            if [pair[0] - num_nodes, pair[1] - num_nodes] in label or [pair[1] - num_nodes,
-                                                                       pair[0] - num_nodes] in label:
-                continue
-            if graph.nodes[pair[0] - num_nodes].attributes['cell'] == 'IO' or \
-                    graph.nodes[pair[0] - num_nodes].attributes['cell'] == 'IO':
-                continue
-            type1, type2 = graph.nodes[pair[0] - num_nodes].attributes['cell'], \
-                           graph.nodes[pair[1] - num_nodes].attributes['cell']
-            poten1, poten2 = graph.nodes[pair[0] - num_nodes].attributes['potential'], \
-                             graph.nodes[pair[1] - num_nodes].attributes['potential']
-            if (not type_rule2(type1, type2)) or poten1 != poten2:
-                continue
-
-            if train:
-                if len(neg_pairs) > neg_size * len(label):
-                    break
-                else:
-                    neg_pairs.append([pair[0], pair[1], -1, 1])
-                # first two cols are node ids, the third col is the label, the last col is train or test
-            else:
-                neg_pairs.append([pair[0], pair[1], -1, 0])
-            valid_pair_num += 1
-            single_valid_pair += 1
-            neg_pair_num += 1
-        pos_pairs = []
-        for l in label:
-            if len(l) == 1:
-                continue
-            type1, type2 = graph.nodes[l[0]].attributes['cell'], graph.nodes[l[1]].attributes['cell']
-            poten1, poten2 = graph.nodes[l[0]].attributes['potential'], graph.nodes[l[1]].attributes['potential']
-            if (not type_rule2(type1, type2)) or poten1 != poten2:
-                continue
-            w1, l1 = float(graph.nodes[l[0]].attributes['w']) / int(graph.nodes[l[0]].attributes['nf']), float(
-                graph.nodes[l[0]].attributes['l'])
-            w2, l2 = float(graph.nodes[l[1]].attributes['w']) / int(graph.nodes[l[1]].attributes['nf']), float(
-                graph.nodes[l[1]].attributes['l'])
-            if w1 != w2 or l1 != l2:
-                continue
-            if train:
-                pos_pairs.append([l[0] + num_nodes, l[1] + num_nodes, 1, 1])
-                # pos_pairs.append([l[0] + num_nodes, l[1] + num_nodes, 1, 1])
-                # valid_pair_num += 1
-            else:
-                pos_pairs.append([l[0] + num_nodes, l[1] + num_nodes, 1, 0])
-            valid_pair_num += 1
-            single_valid_pair += 1
+        pos_pairs, neg_pairs = make_pairs(graph, label, num_nodes, train)
+        valid_pair_num += len(pos_pairs) + len(neg_pairs)
+        single_valid_pair += len(pos_pairs) + len(neg_pairs)
+        neg_pair_num += len(neg_pairs)
         all_pairs += pos_pairs + neg_pairs
         num_nodes += len(graph.nodes)
         print("{} valid pair:{}".format(dataX[i]['subckts'][0].name, single_valid_pair))
 
         # add edges
-        for nets in graph.nets:
-            for i in range(len(nets.pins)):
-                if graph.pins[nets.pins[i]].attributes['type'] in ['substrate', 'hbeta']:  # 第四个端口不参与相连
-                    continue
-                for j in range(i + 1, len(nets.pins)):
-                    if graph.pins[nets.pins[j]].attributes['type'] in ['substrate', 'hbeta']:
-                        continue
-                    if i != j:
-                        device_id1, device_id2 = graph.pins[nets.pins[i]].node_id, graph.pins[nets.pins[j]].node_id
-                        if device_id1 != device_id2:
-                            pin_type1 = graph.pins[nets.pins[i]].attributes['type']
-                            pin_type2 = graph.pins[nets.pins[j]].attributes['type']
-                            # if (pin_filter2(pin_type1)) not in pin_con_type:
-                            #     pin_con_type.append(pin_filter2(pin_type1))
-                            # if (pin_filter2(pin_type2)) not in pin_con_type:
-                            #     pin_con_type.append(pin_filter2(pin_type2))
-                            device_tu1 = (
-                                device_id1 + num_nodes - len(graph.nodes),
-                                device_id2 + num_nodes - len(graph.nodes))
-                            if edge_dic.__contains__(device_tu1):
-                                edge_dic[device_tu1].append(pin_filter2(pin_type1))
-                            else:
-                                new_list = [pin_filter2(pin_type1)]
-                                edge_dic[device_tu1] = new_list
-                            device_tu2 = (
-                                device_id2 + num_nodes - len(graph.nodes),
-                                device_id1 + num_nodes - len(graph.nodes))
-                            if edge_dic.__contains__(device_tu2):
-                                edge_dic[device_tu2].append(pin_filter2(pin_type2))
-                            else:
-                                new_list = [pin_filter2(pin_type2)]
-                                edge_dic[device_tu2] = new_list
-                            if graph.nodes[device_id1].attributes['cell'] in passive_types and \
-                                    graph.nodes[device_id2].attributes['cell'] in passive_types:
-                                G.add_edge(device_id1 + num_nodes - len(graph.nodes),
-                                           device_id2 + num_nodes - len(graph.nodes), weight=0)
-                                G.add_edge(device_id2 + num_nodes - len(graph.nodes),
-                                           device_id1 + num_nodes - len(graph.nodes), weight=0)
-                            elif graph.nodes[device_id1].attributes['cell'] in passive_types or \
-                                    graph.nodes[device_id2].attributes['cell'] in passive_types:
-                                G.add_edge(device_id1 + num_nodes - len(graph.nodes),
-                                           device_id2 + num_nodes - len(graph.nodes), weight=0.5)
-                                G.add_edge(device_id2 + num_nodes - len(graph.nodes),
-                                           device_id1 + num_nodes - len(graph.nodes), weight=0.5)
-                            else:
-                                G.add_edge(device_id1 + num_nodes - len(graph.nodes),
-                                           device_id2 + num_nodes - len(graph.nodes), weight=1)
-                                G.add_edge(device_id2 + num_nodes - len(graph.nodes),
-                                           device_id1 + num_nodes - len(graph.nodes), weight=1)
-
-        snode = []
-        for g in graph.nodes:
-            if ground_name_filter(g.attributes['name']) == 1:
-                snode.append(g.id + num_nodes - len(graph.nodes))
-                break
-        for g in graph.nodes:
-            if power_name_filter(g.attributes['name']) == 1:
-                snode.append(g.id + num_nodes - len(graph.nodes))
-                break
-
-        node_weight = get_nodes_weights(G, snode, num_nodes - len(graph.nodes), num_nodes)
-        node_weights.extend(node_weight)
-        for num, g in enumerate(graph.nodes):
-            G.nodes[g.id + num_nodes - len(graph.nodes)]['weights'] = node_weight[num]
+        if net_nodes:
+            add_circuit_net_edges(edge_dic, graph, num_nodes - len(graph.nodes), net_offset)
+            circuits.append((i, graph, net_offset))
+            net_offset += len(graph.nets)
+            continue
+        add_circuit_edges(G, graph, edge_dic, num_nodes - len(graph.nodes))
+
+        node_weights.extend(add_circuit_weights(G, graph, num_nodes - len(graph.nodes)))
+    if net_nodes:
+        add_net_nodes(G, circuits, edge_dic)
+        offset = 0
+        for _, graph, _ in circuits:
+            node_weights.extend(add_circuit_weights(G, graph, offset))
+            offset += len(graph.nodes)
     # convert node feats to one-hot
     node_size_feats_wn = noramlization(node_size_feats_w)
     node_size_feats_ln = noramlization(node_size_feats_l)
@@ -516,18 +629,14 @@ def read_graph(file_name, save_dir):
     #     else:
     #         node_gat.append(0)
     for gnet in G.nodes:
-        if G.nodes[gnet]['device'] in mosfet_types and G.nodes[gnet]['nets'][-1] == 1:
-            node_gat.append([0, 0, 0, 1])
-        elif G.nodes[gnet]['device'] in mosfet_types and G.nodes[gnet]['nets'][-1] == 0:
-            node_gat.append([0, 0, 1, 0])
-        elif G.nodes[gnet]['device'] in mosfet_types and G.nodes[gnet]['nets'][-1] == -1:
-            node_gat.append([0, 1, 0, 0])
-        else:
-            node_gat.append([1, 0, 0, 0])
+        if G.nodes[gnet]['type'] != 'net':
+            node_gat.append(node_gat_feat(G.nodes[gnet]))
 
     node_feats = np.array(
         [np.hstack((np.array(node_feat[t]), np.array(node_gat[t]), node_size_feats[t])) for t in
          range(len(node_feat))])
+    if net_nodes:
+        node_feats = np.vstack((node_feats, np.zeros((len(G.nodes) - len(node_feats), node_feats.shape[1]))))
     print(node_feats.shape)
 
     # convert edge feats to one-hot
@@ -545,15 +654,26 @@ def read_graph(file_name, save_dir):
     print("number of valid_pair:{}".format(valid_pair_num))
     print("number of neg_pair:{}".format(neg_pair_num))
 
-    # save all files
-    np.save(save_dir + "/" + "node_feats.npy", node_feats)
-    np.save(save_dir + "/" + "edge_feats.npy", edge_feats)
-    nx.write_gpickle(G, save_dir + "/" + 'graph.pkl')
-    with open(save_dir + "/" + "test_pair_name.json", 'w') as file:
-        json.dump(my_test_name, file)
+    # structural hashes (WL colour refinement), edges in the same sorted order as edge_feats
+    edges = np.array(list(edge_dic.keys()), dtype=np.int64).reshape(-1, 2)
+    colors = wl_colors(node_feats, edges[:, 0], edges[:, 1], encode_edge_feats(edge_feats.reshape(-1, 5)))
+    print("number of WL colors:{}".format(len(np.unique(colors[:, WL_FILTER_ROUND]))))
+
     all_pairs = sorted(all_pairs, key=lambda x: x[0])
+    return {'node_feats': node_feats, 'edge_feats': edge_feats, 'graph': G, 'pairs': all_pairs,
+            'test_ranges': my_test_name, 'wl_colors': colors}
+
+
+def save_graph(dataset, save_dir):
+    """把 build_graph 的结果保存为 read_graph 的输出文件"""
+    np.save(save_dir + "/" + "node_feats.npy", dataset['node_feats'])
+    np.save(save_dir + "/" + "wl_colors.npy", dataset['wl_colors'])
+    np.save(save_dir + "/" + "edge_feats.npy", dataset['edge_feats'])
+    nx.write_gpickle(dataset['graph'], save_dir + "/" + 'graph.pkl')
+    with open(save_dir + "/" + "test_pair_name.json", 'w') as file:
+        json.dump(dataset['test_ranges'], file)
     with open(save_dir + "/" + "labels.txt", "w") as ff:
-        for pair in all_pairs:
+        for pair in dataset['pairs']:
             ff.write((str(pair[0]) + " " + str(pair[1]) + " " + str(pair[2]) + " " + str(pair[3]) + "\n"))
 
 
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+from my_profile import profiled
+
+# 后处理规则（尺寸 / 电势 / 共享net / dummy）的向量化实现
+# 原 filter_*_rule 逐对访问 G.nodes[...]，这里先把节点属性收集成数组，
+# 再对所有测试对做一次性的 gather + 比较，得到融合后的布尔掩码
+
+NET_PAD = -2  # nets矩阵的填充值（不会与net编号或门连接标志冲突）
+
+
+@profiled('rule_arrays')
+def node_rule_arrays(G):
+    """从 graph.pkl 的 networkx 图中提取规则所需的节点属性数组
+    参数：
+        G: read_graph 生成的 networkx 图（节点编号为 0..N-1）
+    返回：
+        rules: 字典
+            'w', 'l'          : [N] 归一化前的尺寸
+            'weights'         : [N] 符号电势（到电源/地的最短路径长度）
+            'nets'            : [N, K] 连接的net编号，右侧用 NET_PAD 填充
+            'nets_len'        : [N] 每个节点 nets 的实际长度
+            'uniform'         : [N] nets 全部相同（dummy 器件）
+            'uniform_strip'   : [N] 去掉末位门连接标志后 nets 全部相同
+    """
+    num_nodes = max(G.nodes) + 1 if len(G.nodes) else 0
+    width = max([len(G.nodes[n].get('nets', [])) for n in G.nodes] + [1])
+    w = np.full(num_nodes, -1., dtype=np.float64)
+    l = np.full(num_nodes, -1., dtype=np.float64)
+    weights = np.zeros(num_nodes, dtype=np.float64)
+    nets = np.full((num_nodes, width), NET_PAD, dtype=np.int64)
+    nets_len = np.zeros(num_nodes, dtype=np.int64)
+    for n in G.nodes:
+        attr = G.nodes[n]
+        w[n] = float(attr['w'])
+        l[n] = float(attr['l'])
+        weights[n] = attr.get('weights', 0)
+        node_nets = attr.get('nets', [])
+        nets[n, :len(node_nets)] = node_nets
+        nets_len[n] = len(node_nets)
+    return {'w': w, 'l': l, 'weights': weights, 'nets': nets, 'nets_len': nets_len,
+            'uniform': _uniform_prefix(nets, nets_len),
+            'uniform_strip': _uniform_prefix(nets, nets_len - 1)}
+
+
+def load_node_rule_arrays(data_dir):
+    """读取 read_graph 输出目录中的规则属性（流式输出读 rule_*.npy，否则读 graph.pkl）"""
+    from my_stream_graph import is_streamed
+    if not is_streamed(data_dir):
+        import networkx as nx
+        return node_rule_arrays(nx.read_gpickle('{}/graph.pkl'.format(data_dir)))
+    return rule_arrays_from_table(np.load('{}/rule_attrs.npy'.format(data_dir)),
+                                  np.load('{}/rule_nets.npy'.format(data_dir)))
+
+
+def rule_arrays_from_table(attrs, nets):
+    """由 my_stream_graph.circuit_rows 的 attrs [N, 3]（w, l, weights）与 nets [N, 1 + K]（长度 + nets）构建规则数组"""
+    nets_len = nets[:, 0]
+    nets = np.ascontiguousarray(nets[:, 1:1 + max(int(nets_len.max(initial=0)), 1)])
+    return {'w': attrs[:, 0], 'l': attrs[:, 1], 'weights': attrs[:, 2], 'nets': nets, 'nets_len': nets_len,
+            'uniform': _uniform_prefix(nets, nets_len),
+            'uniform_strip': _uniform_prefix(nets, nets_len - 1)}
+
+
+def _uniform_prefix(nets, length):
+    """前 length 个 net 是否都等于第一个 net"""
+    cols = np.arange(nets.shape[1])
+    same = (nets == nets[:, :1]) | (cols[None, :] >= length[:, None])
+    return same.all(axis=1)
+
+
+def _strip_flag(rules, p0, p1):
+    # 两个节点 nets 都为4（3个端口+门连接标志）时才去掉末位标志，与原规则一致
+    return (rules['nets_len'][p0] == 4) & (rules['nets_len'][p1] == 4)
+
+
+def size_rule_mask(rules, p0, p1):
+    """尺寸规则：w、l 都相等"""
+    return (rules['w'][p0] == rules['w'][p1]) & (rules['l'][p0] == rules['l'][p1])
+
+
+def weights_rule_mask(rules, p0, p1):
+    """电势规则：符号电势相等"""
+    return rules['weights'][p0] == rules['weights'][p1]
+
+
+def nets_rule_mask(rules, p0, p1):
+    """共享net规则：两个节点至少连接同一个net"""
+    strip = _strip_flag(rules, p0, p1)
+    len0 = rules['nets_len'][p0] - strip
+    len1 = rules['nets_len'][p1] - strip
+    nets0 = rules['nets'][p0]
+    nets1 = rules['nets'][p1]
+    width = rules['nets'].shape[1]
+    shared = np.zeros(len(p0), dtype=bool)
+    for i in range(width):
+        valid_i = i < len0
+        for j in range(width):
+            shared |= valid_i & (j < len1) & (nets0[:, i] == nets1[:, j])
+    return shared
+
+
+def dummy_rule_mask(rules, p0, p1):
+    """dummy规则：任一节点的所有端口接在同一个net上即判为非对称"""
+    strip = _strip_flag(rules, p0, p1)
+    dummy0 = np.where(strip, rules['uniform_strip'][p0], rules['uniform'][p0])
+    dummy1 = np.where(strip, rules['uniform_strip'][p1], rules['uniform'][p1])
+    return ~(dummy0 | dummy1)
+
+
+@profiled('rule_filters')
+def fused_rule_mask(rules, p0, p1, chunk_size=1 << 20):
+    """四条规则融合后的掩码，True 表示该对通过所有规则
+    参数：
+        rules: node_rule_arrays 的返回值
+        p0, p1: 测试对的节点编号（list 或 numpy 数组）
+        chunk_size: 每次处理的测试对数量，限制中间数组的内存
+    返回：
+        mask: [num_pairs] 布尔数组
+    """
+    p0 = np.asarray(p0, dtype=np.int64)
+    p1 = np.asarray(p1, dtype=np.int64)
+    mask = np.empty(len(p0), dtype=bool)
+    for start in range(0, len(p0), chunk_size):
+        a = p0[start:start + chunk_size]
+        b = p1[start:start + chunk_size]
+        mask[start:start + chunk_size] = size_rule_mask(rules, a, b) & weights_rule_mask(rules, a, b) & \
+            nets_rule_mask(rules, a, b) & dummy_rule_mask(rules, a, b)
+    return mask
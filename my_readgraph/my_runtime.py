@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import warnings
+from my_init import *
+
+# 运行时配置：设备、torch / DGL 线程数、OpenMP 线程绑定、确定性模式
+# 优先级：环境变量 > my_init（runtime_*）> autotune 记录（只用于线程数）
+#   EGAT_DEVICE=cpu|cuda:0|...   EGAT_THREADS=n   EGAT_INTEROP_THREADS=n
+#   EGAT_AFFINITY=close|spread   EGAT_DETERMINISTIC=1
+# 同一主机上并发多个任务时，给每个任务设置 EGAT_THREADS（总数不超过核数），避免线程超额订阅。
+# OpenMP 在运行库加载时读取 OMP_PROC_BIND / OMP_PLACES，所以本模块必须在 torch / dgl 之前导入：
+# 导入时只设置环境变量，apply_runtime() 在第一次调用时设置线程数、种子并返回 torch.device。
+# python my_runtime.py --autotune：在若干线程数下测量 EGT 训练 / 推理吞吐，把最优线程数记录到 runtime_profile
+
+_device = None
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name, '')
+    return cast(value) if value != '' else default
+
+
+def available_cpus():
+    """当前进程可用的 cpu 数（考虑 taskset / cgroup 的 cpu 绑定）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_profile(path=runtime_profile):
+    """autotune 在本主机上的记录，没有时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(platform.node())
+
+
+def settings():
+    """当前生效的运行时配置"""
+    cfg = {
+        'device': _env('EGAT_DEVICE', runtime_device),
+        'threads': _env('EGAT_THREADS', runtime_threads, int),
+        'interop_threads': _env('EGAT_INTEROP_THREADS', runtime_interop_threads, int),
+        'affinity': _env('EGAT_AFFINITY', runtime_affinity),
+        'deterministic': _env('EGAT_DETERMINISTIC', runtime_deterministic, lambda v: v not in ['0', 'false']),
+        'seed': runtime_seed,
+    }
+    if cfg['threads'] is None:
+        profile = load_profile()
+        if profile is not None:
+            cfg['threads'] = min(profile['num_threads'], available_cpus())
+    return cfg
+
+
+def _set_environment(cfg):
+    # 只设置用户没有显式给出的变量
+    if cfg['affinity']:
+        if 'torch' in sys.modules:
+            warnings.warn("my_runtime imported after torch, OpenMP affinity ({}) may not take effect"
+                          .format(cfg['affinity']))
+        os.environ.setdefault('OMP_PROC_BIND', cfg['affinity'])
+        os.environ.setdefault('OMP_PLACES', 'cores')
+    if cfg['threads']:
+        os.environ.setdefault('OMP_NUM_THREADS', str(cfg['threads']))
+    if cfg['deterministic']:
+        os.environ.setdefault('CUBLAS_WORKSPACE_CONFIG', ':4096:8')  # cuBLAS 确定性要求
+
+
+_set_environment(settings())
+
+
+def set_threads(num_threads):
+    """同时设置 torch 与 DGL（OpenMP）的算子内线程数"""
+    import torch
+    import dgl
+    torch.set_num_threads(num_threads)
+    dgl.utils.set_num_threads(num_threads)
+
+
+def resolve_device(name):
+    """设备名 -> torch.device，cuda 不可用时退回 cpu，编号超出时退回 cuda:0"""
+    import torch
+    device = torch.device(name)
+    if device.type == 'cuda':
+        if not torch.cuda.is_available():
+            return torch.device('cpu')
+        if device.index is not None and device.index >= torch.cuda.device_count():
+            return torch.device('cuda:0')
+    return device
+
+
+def apply_runtime():
+    """应用运行时配置（只在第一次调用时生效），返回 torch.device"""
+    global _device
+    if _device is not None:
+        return _device
+    import torch
+    cfg = settings()
+    if cfg['threads']:
+        set_threads(cfg['threads'])
+    if cfg['interop_threads']:
+        try:
+            torch.set_num_interop_threads(cfg['interop_threads'])
+        except RuntimeError:  # inter-op 线程池已经启动
+            warnings.warn("inter-op thread count can only be set before any parallel work starts")
+    if cfg['deterministic']:
+        import numpy as np
+        import dgl
+        random.seed(cfg['seed'])
+        np.random.seed(cfg['seed'])
+        torch.manual_seed(cfg['seed'])
+        dgl.seed(cfg['seed'])
+        torch.use_deterministic_algorithms(True)
+        torch.backends.cudnn.deterministic = True
+        torch.backends.cudnn.benchmark = False
+    _device = resolve_device(cfg['device'])
+    return _device
+
+
+def _throughput(func, pairs, steps, device):
+    import torch
+    func()  # 预热
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(steps):
+        func()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return pairs * steps / (time.perf_counter() - start)
+
+
+def autotune(data_dir=file_path, thread_counts=None, steps=10, batch_size=256, out_path=runtime_profile):
+    """在若干线程数下测量 EGT 吞吐（pairs/s），把训练吞吐最高的线程数记录到 out_path
+    参数：
+        data_dir: read_graph 的输出目录
+        thread_counts: 候选线程数，默认为 1, 2, 4, ... 与可用 cpu 数
+        steps: 每个线程数计时的 batch 数
+    返回：
+        本主机的记录 {'num_threads', 'results', ...}
+    """
+    import torch
+    from my_load_data import load_data
+    device = apply_runtime()
+    node_feat_data, edge_feat_data, model, pair1, pair2, train_label = load_data(data_dir)[:6]
+    if thread_counts is None:
+        cpus = available_cpus()
+        thread_counts = sorted({2 ** k for k in range(cpus.bit_length()) if 2 ** k <= cpus} | {cpus})
+    batch_size = min(batch_size, len(pair1))
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.002, weight_decay=1e-5)
+
+    def train_step():
+        model.train()
+        optimizer.zero_grad()
+        model.loss(node_feat_data, edge_feat_data, pair1[:batch_size], pair2[:batch_size],
+                   train_label[:batch_size]).backward()
+        optimizer.step()
+
+    def inference():
+        model.eval()
+        with torch.no_grad():
+            model.cache_embeddings(node_feat_data, edge_feat_data)
+            model.score_pairs(pair1, pair2)
+
+    results = []
+    for n in thread_counts:
+        set_threads(n)
+        record = {'threads': n, 'train_pairs_per_s': _throughput(train_step, batch_size, steps, device),
+                  'infer_pairs_per_s': _throughput(inference, len(pair1), max(1, steps // 5), device)}
+        print("threads {:>3d}  train {:>10.1f} pairs/s  inference {:>12.1f} pairs/s".format(
+            n, record['train_pairs_per_s'], record['infer_pairs_per_s']))
+        results.append(record)
+    best = max(results, key=lambda r: r['train_pairs_per_s'])
+    profile = {'num_threads': best['threads'], 'cpus': available_cpus(), 'device': str(device),
+               'date': time.strftime("%Y-%m-%d %H:%M:%S"), 'results': results}
+
+    profiles = {}
+    if os.path.exists(out_path):
+        with open(out_path) as f:
+            profiles = json.load(f)
+    profiles[platform.node()] = profile
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'w') as f:
+        json.dump(profiles, f, indent=1)
+    print("best: {} threads (recorded in {})".format(best['threads'], out_path))
+    return profile
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--autotune', action='store_true', help='测量不同线程数下的吞吐并记录最优值')
+    parser.add_argument('--data', default=file_path, help='read_graph 的输出目录')
+    parser.add_argument('--threads', type=int, nargs='+', default=None, help='候选线程数')
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--out', default=runtime_profile)
+    args = parser.parse_args()
+    if args.autotune:
+        autotune(args.data, args.threads, args.steps, args.batch_size, args.out)
+    else:
+        print(json.dumps(settings(), indent=1))
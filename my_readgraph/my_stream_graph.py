@@ -0,0 +1,267 @@
+import os
+import json
+import pickle
+import argparse
+import operator
+import numpy as np
+import networkx as nx
+from my_readgraph import add_circuit_nodes, add_circuit_edges, add_circuit_weights, make_pairs, node_gat_feat, \
+    convert, convert_list
+from my_profile import profiled, stage
+from my_rules import NET_PAD
+from my_features import feature_edges
+from my_init import *
+
+# 流式 read_graph：逐个电路处理，峰值内存只取决于最大的单个电路
+# 1. 每个电路单独建一个 networkx 图（使用全局节点编号），处理完即释放
+# 2. 节点特征、边、边特征、规则属性按行追加到 <name>.raw 二进制文件，labels.txt 逐电路追加
+# 3. 第二遍通过 np.memmap 分块读取原始列，完成尺寸归一化并写出 .npy（np.lib.format.open_memmap）
+# 输出与 read_graph 相同（node_feats.npy / edge_feats.npy / labels.txt / test_pair_name.json），
+# 但不保存 graph.pkl，改为：
+#   edges.npy       [E, 2] 边（src, dst），按 (src, dst) 排序，与 edge_feats.npy 逐行对应（my_features.feature_edges）
+#   rule_attrs.npy  [N, 3] w, l, weights（后处理规则使用，见 my_rules.load_node_rule_arrays）
+#   rule_nets.npy   [N, 1 + K] nets 长度 + nets（右侧用 NET_PAD 填充，K 为最长的 nets，至少 RULE_NETS_WIDTH）
+#   node_circuits.npy [N, 1] 节点所属电路的序号（graph.pkl 的节点属性 graph，见 my_wl.load_node_circuits）
+
+ALL_TYPE = {'IO': 0, 'nmos': 1, 'pmos': 2, 'cap': 3, 'diode': 4, 'npn': 5, 'pnp': 6, 'res': 7, 'inductance': 8}
+RULE_NETS_WIDTH = 6  # rule_nets 的最小宽度，更长的 nets 按实际长度加宽；读取时按实际最大长度截断
+
+
+def iter_dataXY(file_name):
+    """逐个电路读取 (dataX[i], dataY[i])，同时支持 dataXY_file.txt 与 parse_all(stream=True) 的输出"""
+    with open(file_name, "rb") as f:
+        first = pickle.load(f)
+        if isinstance(first[0], list):  # (dataX, dataY)
+            dataX, dataY = first
+            del first
+            for i in range(len(dataX)):
+                yield dataX[i], dataY[i]
+            return
+        yield first
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def is_streamed(data_dir):
+    """data_dir 中的 read_graph 输出是否来自流式模式（两种输出并存时以较新的为准）"""
+    edges = "{}/edges.npy".format(data_dir)
+    graph = "{}/graph.pkl".format(data_dir)
+    if not os.path.exists(edges):
+        return False
+    return not os.path.exists(graph) or os.path.getmtime(edges) >= os.path.getmtime(graph)
+
+
+class AppendArray(object):
+    """按行追加写入的二进制文件，finalize 时分块转存为 .npy"""
+
+    def __init__(self, npy_path, dtype, width):
+        self.npy_path = npy_path
+        self.raw_path = npy_path + ".raw"
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.rows = 0
+        self.file = open(self.raw_path, "wb")
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.width)
+        self.file.write(rows.tobytes())
+        self.rows += rows.shape[0]
+
+    def finalize(self, transform=None, chunk_rows=1 << 20):
+        """写出 [rows, width] 的 .npy，transform(block) 可在写出前修改每一块"""
+        self.file.close()
+        out = np.lib.format.open_memmap(self.npy_path, mode="w+", dtype=self.dtype, shape=(self.rows, self.width))
+        if self.rows:
+            raw = np.memmap(self.raw_path, dtype=self.dtype, mode="r", shape=(self.rows, self.width))
+            for start in range(0, self.rows, chunk_rows):
+                block = np.array(raw[start:start + chunk_rows])
+                out[start:start + chunk_rows] = block if transform is None else transform(block)
+            del raw
+        out.flush()
+        del out
+        os.remove(self.raw_path)
+
+
+class RaggedRows(object):
+    """按行追加的变长整数行（长度与值分别写入二进制文件），finalize 时写出 [rows, 1 + width] 的 .npy：
+    第 0 列为长度，其后为值，右侧用 pad 填充；width 为最长的行，至少 min_width
+    """
+
+    def __init__(self, npy_path, pad, min_width=0):
+        self.npy_path = npy_path
+        self.pad = pad
+        self.width = min_width
+        self.rows = 0
+        self.lengths = AppendArray(npy_path + ".len", np.int64, 1)
+        self.values = AppendArray(npy_path + ".val", np.int64, 1)
+
+    def append(self, table):
+        """table: [n, 1 + K] 长度 + 值（circuit_rows 的 nets），K 可以与之前的行不同"""
+        table = np.asarray(table, dtype=np.int64)
+        lengths = table[:, 0]
+        self.lengths.append(lengths)
+        self.values.append(table[:, 1:][np.arange(table.shape[1] - 1) < lengths[:, None]])
+        self.rows += len(table)
+        self.width = max(self.width, int(lengths.max(initial=0)))
+
+    def finalize(self, chunk_rows=1 << 20):
+        for array in [self.lengths, self.values]:
+            array.file.close()
+        out = np.lib.format.open_memmap(self.npy_path, mode="w+", dtype=np.int64, shape=(self.rows, 1 + self.width))
+        if self.rows:
+            lengths = np.memmap(self.lengths.raw_path, dtype=np.int64, mode="r", shape=(self.rows,))
+            values = np.memmap(self.values.raw_path, dtype=np.int64, mode="r", shape=(self.values.rows,)) \
+                if self.values.rows else np.empty(0, dtype=np.int64)
+            offset = 0
+            for start in range(0, self.rows, chunk_rows):
+                length = np.array(lengths[start:start + chunk_rows])
+                block = np.full((len(length), 1 + self.width), self.pad, dtype=np.int64)
+                block[:, 0] = length
+                block[:, 1:][np.arange(self.width) < length[:, None]] = values[offset:offset + length.sum()]
+                out[start:start + chunk_rows] = block
+                offset += int(length.sum())
+            del lengths, values
+        out.flush()
+        del out
+        for array in [self.lengths, self.values]:
+            os.remove(array.raw_path)
+
+
+class NormStats(object):
+    """增量统计 read_graph.noramlization 所需的最小值、次小值、最大值"""
+
+    def __init__(self):
+        self.min = None
+        self.second = None  # 严格大于最小值的最小值
+        self.max = None
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        values = np.unique(np.asarray(values, dtype=np.float64))
+        cand = sorted(set(values[:2].tolist()) | {v for v in [self.min, self.second] if v is not None})
+        self.min = cand[0]
+        self.second = cand[1] if len(cand) > 1 else None
+        self.max = max(values[-1], self.max) if self.max is not None else values[-1]
+
+    def apply(self, column):
+        """与 noramlization 相同：最小值替换为最大值后再取最小值作为下界，-1 保持不变"""
+        minvals = self.second if self.second is not None else self.max
+        ranges = self.max - minvals
+        return np.where(column != -1, (column - minvals) / ranges, -1.)
+
+
+def circuit_rows(G_c, graph, offset, types, ws, ls):
+    """单个电路的节点特征（尺寸未归一化）、规则属性
+    返回：
+        feats [n, 15], attrs [n, 3]（w, l, weights）, nets [n, 1 + K]（长度 + nets，K 为该电路最长的 nets，
+        至少 RULE_NETS_WIDTH）
+    """
+    n = len(types)
+    feats = np.zeros((n, len(ALL_TYPE) + 4 + 2), dtype=np.float64)
+    attrs = np.empty((n, 3), dtype=np.float64)
+    width = max([RULE_NETS_WIDTH] + [len(G_c.nodes[g.id + offset].get('nets', [])) for g in graph.nodes])
+    nets = np.full((n, 1 + width), NET_PAD, dtype=np.int64)
+    for k, g in enumerate(graph.nodes):
+        attr = G_c.nodes[g.id + offset]
+        feats[k, :len(ALL_TYPE)] = convert(ALL_TYPE[types[k]], len(ALL_TYPE))
+        feats[k, len(ALL_TYPE):len(ALL_TYPE) + 4] = node_gat_feat(attr)
+        node_nets = attr.get('nets', [])
+        nets[k, 0] = len(node_nets)
+        nets[k, 1:1 + len(node_nets)] = node_nets
+        attrs[k] = [float(attr['w']), float(attr['l']), attr.get('weights', 0)]
+    feats[:, -2] = ws
+    feats[:, -1] = ls
+    return feats, attrs, nets
+
+
+@profiled('read_graph_streaming')
+def read_graph_streaming(file_name, save_dir, trainset=None):
+    """流式版本的 read_graph，参数与输出含义相同
+    参数：
+        file_name: dataXY_file.txt 或 parse_all(stream=True) 生成的 dataXY_stream.pkl
+        save_dir: 输出目录
+        trainset: 训练电路的序号，默认 [0, 1]
+    """
+    assert not use_net_nodes, "streaming read_graph builds the device graph only"
+    if trainset is None:
+        trainset = [0, 1]
+    node_feats = AppendArray(save_dir + "/" + "node_feats.npy", np.float64, len(ALL_TYPE) + 4 + 2)
+    edge_feats = AppendArray(save_dir + "/" + "edge_feats.npy", np.int64, 5)
+    edges = AppendArray(save_dir + "/" + "edges.npy", np.int64, 2)
+    rule_attrs = AppendArray(save_dir + "/" + "rule_attrs.npy", np.float64, 3)
+    rule_nets = RaggedRows(save_dir + "/" + "rule_nets.npy", NET_PAD, RULE_NETS_WIDTH)
+    node_circuits = AppendArray(save_dir + "/" + "node_circuits.npy", np.int64, 1)
+    w_stats, l_stats = NormStats(), NormStats()
+    my_test_name = {}
+    num_nodes = 0
+    num_edges = 0
+    valid_pair_num = 0
+    neg_pair_num = 0
+    with open(save_dir + "/" + "labels.txt", "w") as ff:
+        for i, (data, label) in enumerate(iter_dataXY(file_name)):
+            with stage('stream_circuit'):
+                train = i in trainset
+                graph = data["graph"]
+                G_c = nx.DiGraph()
+                edge_dic = {}
+                types, ws, ls = add_circuit_nodes(G_c, graph, i, num_nodes)
+                if not train:
+                    my_test_name[data['subckts'][0].name] = [num_nodes, num_nodes + len(graph.nodes) - 1]
+                pos_pairs, neg_pairs = make_pairs(graph, label, num_nodes, train)
+                valid_pair_num += len(pos_pairs) + len(neg_pairs)
+                neg_pair_num += len(neg_pairs)
+                print("{} valid pair:{}".format(data['subckts'][0].name, len(pos_pairs) + len(neg_pairs)))
+                for pair in sorted(pos_pairs + neg_pairs, key=lambda x: x[0]):
+                    ff.write((str(pair[0]) + " " + str(pair[1]) + " " + str(pair[2]) + " " + str(pair[3]) + "\n"))
+
+                add_circuit_edges(G_c, graph, edge_dic, num_nodes)
+                add_circuit_weights(G_c, graph, num_nodes)
+
+                feats, attrs, nets = circuit_rows(G_c, graph, num_nodes, types, ws, ls)
+                node_feats.append(feats)
+                rule_attrs.append(attrs)
+                rule_nets.append(nets)
+                node_circuits.append(np.full(len(graph.nodes), i))
+                w_stats.update(ws)
+                l_stats.update(ls)
+                # 边与边特征都按 (src, dst) 排序，与 read_graph 一致
+                edges.append(feature_edges(list(G_c.edges())))
+                edge_feats.append([convert_list(f, 5) for _, f in sorted(edge_dic.items(),
+                                                                         key=operator.itemgetter(0))])
+                num_nodes += len(graph.nodes)
+                num_edges += G_c.number_of_edges()
+                del G_c, edge_dic, data, graph
+
+    # 第二遍：归一化尺寸列
+    def normalize(block):
+        block[:, -2] = w_stats.apply(block[:, -2])
+        block[:, -1] = l_stats.apply(block[:, -1])
+        return block
+
+    with stage('stream_finalize'):
+        node_feats.finalize(normalize)
+        for array in [edge_feats, edges, rule_attrs, rule_nets, node_circuits]:
+            array.finalize()
+    with open(save_dir + "/" + "test_pair_name.json", 'w') as file:
+        json.dump(my_test_name, file)
+
+    print(ALL_TYPE)
+    print((node_feats.rows, node_feats.width))
+    print((edge_feats.rows, edge_feats.width))
+    print("number of nodes:{}".format(num_nodes))
+    print("number of edges:{}".format(num_edges))
+    print("number of valid_pair:{}".format(valid_pair_num))
+    print("number of neg_pair:{}".format(neg_pair_num))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default=dataXY_file_path, help='dataXY_file.txt 或 dataXY_stream.pkl')
+    parser.add_argument('--out', default=save_file)
+    parser.add_argument('--trainset', type=int, nargs='+', default=[0, 1])
+    args = parser.parse_args()
+    read_graph_streaming(args.data, args.out, args.trainset)
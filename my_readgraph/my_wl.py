@@ -0,0 +1,126 @@
+import os
+import numpy as np
+from my_features import encode_edge_feats, load_feature_edges
+
+# Weisfeiler-Lehman 颜色细化（结构哈希）
+# 初始颜色：node_feats 的一行（器件类型、门连接标志、尺寸）；
+# 每轮：新颜色 = hash(旧颜色, 入边邻居 {(颜色, 引脚角色)} 的多重集, 出边邻居的多重集)，
+# 多重集用可交换的 64 位哈希和表示，每轮 O(N + E)（重新编号为一次排序）。
+# 镜像的器件（差分对、电流镜）在 k 轮后颜色相同，用于：
+#   1. 候选对预筛选：颜色不同的对直接判为非对称，不送入 GAT 打分（wl_pair_mask，predict_pairs(wl=...)）；
+#      样本对的生成（make_pairs）不按颜色过滤，测试指标仍覆盖全部候选对
+#   2. 额外节点特征：每轮颜色在同一电路中是否有“孪生”节点（wl_twin_feats）
+# 结果由 read_graph 保存为 wl_colors.npy [N, rounds + 1]；流式输出在首次 load_wl_colors 时计算并缓存
+
+WL_ROUNDS = 3
+WL_FILTER_ROUND = 1  # 预筛选使用的轮数（越大越严格，召回越低）
+
+_M1 = np.uint64(0xbf58476d1ce4e5b9)
+_M2 = np.uint64(0x94d049bb133111eb)
+_SALT_IN = np.uint64(0x9e3779b97f4a7c15)
+_SALT_OUT = np.uint64(0xd6e8feb86659fd93)
+
+
+def _mix(x):
+    """splitmix64 混合函数（uint64 溢出回绕）"""
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def _neighbor_hash(colors, keys_from, keys_to, roles, salt, num_nodes):
+    # 每个节点的邻居多重集哈希：sum(mix(颜色, 角色))，按目标节点分段求和
+    order = np.argsort(keys_to, kind='stable')
+    items = _mix((colors[keys_from[order]].astype(np.uint64) << np.uint64(8)) + roles[order] + salt)
+    out = np.zeros(num_nodes, dtype=np.uint64)
+    if len(order):
+        starts = np.flatnonzero(np.r_[True, np.diff(keys_to[order]) != 0])
+        out[keys_to[order][starts]] = np.add.reduceat(items, starts)
+    return out
+
+
+def wl_colors(node_feats, src, dst, roles, rounds=WL_ROUNDS):
+    """颜色细化
+    参数：
+        node_feats: [N, F] 节点特征（相同行为相同初始颜色）
+        src, dst: [E] 边
+        roles: [E] 引脚角色位掩码（my_features.encode_edge_feats）
+        rounds: 迭代轮数
+    返回：
+        colors: [N, rounds + 1] int64，第 r 列为 r 轮后的颜色（0 列为初始颜色）
+    """
+    num_nodes = len(node_feats)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    roles = np.asarray(roles, dtype=np.uint64)
+    colors = np.empty((num_nodes, rounds + 1), dtype=np.int64)
+    colors[:, 0] = np.unique(np.asarray(node_feats), axis=0, return_inverse=True)[1].reshape(-1)
+    for r in range(rounds):
+        current = colors[:, r]
+        h = _mix(current.astype(np.uint64) + _SALT_IN)
+        h = h ^ _mix(_neighbor_hash(current, src, dst, roles, _SALT_IN, num_nodes))
+        h = _mix(h) ^ _neighbor_hash(current, dst, src, roles, _SALT_OUT, num_nodes)
+        colors[:, r + 1] = np.unique(h, return_inverse=True)[1].reshape(-1)
+    return colors
+
+
+def load_edge_arrays(data_dir):
+    """读取与 edge_feats.npy 对齐的边（my_features.feature_edges 的顺序）及其引脚角色"""
+    edges = load_feature_edges(data_dir)
+    roles = encode_edge_feats(np.load("{}/edge_feats.npy".format(data_dir)))
+    assert len(roles) == len(edges), "edge_feats.npy does not match the graph"
+    return edges[:, 0], edges[:, 1], roles
+
+
+def load_wl_colors(data_dir, rounds=WL_ROUNDS):
+    """读取 wl_colors.npy；不存在、轮数不足或比 node_feats.npy 旧时重新计算"""
+    path = "{}/wl_colors.npy".format(data_dir)
+    feats_path = "{}/node_feats.npy".format(data_dir)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(feats_path):
+        colors = np.load(path)
+        if colors.shape[1] > rounds:
+            return colors[:, :rounds + 1]
+    colors = wl_colors(np.load(feats_path), *load_edge_arrays(data_dir), rounds=rounds)
+    np.save(path, colors)
+    return colors
+
+
+def graph_node_circuits(G):
+    """[N] int64 合并图 G（read_graph 的 graph.pkl）中每个节点所属电路的序号（节点属性 graph）"""
+    return np.array([G.nodes[k]['graph'] for k in range(len(G))], dtype=np.int64)
+
+
+def load_node_circuits(data_dir):
+    """read_graph 输出中每个节点所属电路的序号（流式输出读 node_circuits.npy，否则读 graph.pkl）"""
+    from my_stream_graph import is_streamed
+    if is_streamed(data_dir):
+        path = "{}/node_circuits.npy".format(data_dir)
+        if not os.path.exists(path):
+            raise FileNotFoundError("{} not found, re-run my_stream_graph.py to write it".format(path))
+        return np.load(path).reshape(-1)
+    import networkx as nx
+    return graph_node_circuits(nx.read_gpickle("{}/graph.pkl".format(data_dir)))
+
+
+def wl_twin_feats(colors, circuits):
+    """[N, rounds] float32：第 r 轮后同一电路中是否还有其他节点与该节点颜色相同（有结构镜像）
+    参数：
+        circuits: [N] 节点所属电路的序号（load_node_circuits）；其他电路中的相同结构不算孪生，特征与数据集的组成无关
+    """
+    circuits = np.asarray(circuits, dtype=np.int64)
+    feats = np.empty((len(colors), colors.shape[1] - 1), dtype=np.float32)
+    for r in range(1, colors.shape[1]):
+        key = np.unique(np.stack((circuits, colors[:, r]), axis=1), axis=0, return_inverse=True)[1].reshape(-1)
+        feats[:, r - 1] = np.bincount(key)[key] > 1
+    return feats
+
+
+def load_wl_twin_feats(data_dir):
+    """read_graph 输出的 WL 孪生特征（load_wl_colors + wl_twin_feats，按电路计数）"""
+    return wl_twin_feats(load_wl_colors(data_dir), load_node_circuits(data_dir))
+
+
+def wl_pair_mask(colors, pair1, pair2, wl_round=WL_FILTER_ROUND):
+    """颜色相同（可能对称）的对为 True"""
+    return colors[np.asarray(pair1), wl_round] == colors[np.asarray(pair2), wl_round]
+
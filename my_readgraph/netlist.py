@@ -3,9 +3,6 @@ import os
 import sys
 import glob
 
-import numpy as np
-import networkx as nx
-
 
 class SpiceEntry(object):
     def __init__(self):
@@ -13,6 +10,7 @@ class SpiceEntry(object):
         self.pins = []        # 引脚连接列表（存储节点名称或网络名）
         self.cell = None      # 元件类型（如nmos/pmos/电阻等基础器件）
         self.attributes = {}  # 元件参数字典（包含w/l/nf等工艺参数）
+        self.params = {}      # 行中的全部 name=value（子电路实例参数、尺寸表达式），值为原始字符串
 
     def __str__(self):
         content = "name: " + self.name
@@ -30,6 +28,8 @@ class SpiceSubckt(object):
         self.name = ""        # 子电路名称（如CLK_COMP）
         self.pins = []        # 子电路引脚列表（如["vdd", "gnd"]）
         self.entries = []     # 子电路包含的元件实例列表（SpiceEntry对象集合）
+        self.params = {}      # .subckt 行上的参数默认值（可被实例参数覆盖）
+        self.local_params = []  # 子电路内的 .param [(名字, 表达式)]
 
     def __str__(self):
         content = "subckt: " + self.name + "\n"
@@ -43,6 +43,13 @@ class SpiceSubckt(object):
         return self.__str__()
 
 
+class SpiceSubcktList(list):
+    """read_netlist 的返回值：子电路列表，params 为全局 .param [(名字, 表达式)]"""
+    def __init__(self, subckts=(), params=()):
+        list.__init__(self, subckts)
+        self.params = list(params)
+
+
 class SpiceNode(object):
     def __init__(self):
         self.id = None